@@ -11,6 +11,7 @@ from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from db.db_setup import Base
+from settings import get_settings
 
 from alembic import context
 
@@ -18,7 +19,7 @@ from alembic import context
 # from db.db_setup import Base  # Import all models
 
 # Import your models here when you create them
-# from db.models.your_model import YourModel
+from db.models import model_tenant, model_timetable, model_occurrence, model_sms, model_idempotency, model_student, model_message_log, model_scheduled_message, model_timetable_version, users  # noqa: F401
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -38,6 +39,12 @@ target_metadata = Base.metadata
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+# migrations run against the live database : one waiting on a lock gives up instead of
+# queueing every query of the app behind it , and no statement runs unbounded
+# ( db/online_migrations.py lifts both for concurrent index builds )
+MIGRATION_LOCK_TIMEOUT = get_settings().migration_lock_timeout
+MIGRATION_STATEMENT_TIMEOUT = get_settings().migration_statement_timeout
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -57,14 +64,31 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
+    if url and url.startswith('postgresql'):
+        context.execute(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+        context.execute(f"SET statement_timeout = '{MIGRATION_STATEMENT_TIMEOUT}'")
 
     with context.begin_transaction():
         context.run_migrations()
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    if connection.dialect.name == 'postgresql':
+        # session level so they hold for every migration's transaction
+        connection.exec_driver_sql(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'")
+        connection.exec_driver_sql(f"SET statement_timeout = '{MIGRATION_STATEMENT_TIMEOUT}'")
+        connection.commit()
+
+    # a transaction per migration instead of one around them all , so locks taken by one
+    # migration are released before the next starts and autocommit blocks
+    # ( CREATE INDEX CONCURRENTLY , batched backfills ) can step outside it
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,45 @@
+"""time_table day_index , added and backfilled
+
+Databases made before slots carried a day_index have it NULL on every row , and the timetable
+read api leaves those rows out. Adds the column where it is missing and fills it in batches
+
+Revision ID: 3f1a9c2b7d41
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.online_migrations import backfill, has_column
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a9c2b7d41'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# db.models.model_timetable.WEEKDAYS in sql , spelled out so the revision does not change with the model
+DAY_INDEX = (
+    "CASE lower(trim(day)) "
+    "WHEN 'monday' THEN 0 WHEN 'tuesday' THEN 1 WHEN 'wednesday' THEN 2 WHEN 'thursday' THEN 3 "
+    "WHEN 'friday' THEN 4 WHEN 'saturday' THEN 5 WHEN 'sunday' THEN 6 END"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not has_column('time_table', 'day_index'):
+        # nullable and without a default , adding it does not rewrite the table
+        op.add_column('time_table', sa.Column('day_index', sa.SmallInteger(), nullable=True))
+    # a row stops matching once it is filled , so a rerun picks up where a failed run stopped ,
+    # rows whose day is not a weekday never match and stay NULL
+    backfill('time_table', f"day_index = {DAY_INDEX}", f"day_index IS NULL AND {DAY_INDEX} IS NOT NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('time_table', 'day_index')
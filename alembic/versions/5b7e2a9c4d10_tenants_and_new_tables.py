@@ -0,0 +1,268 @@
+"""tenants , timetable versions and the other tables added next to time_table
+
+Creates every table the app uses besides time_table that the database does not have yet ,
+in its current shape. Tables that are already there ( made with create_all ) are left alone ,
+columns and indexes they may be missing are the next revision's job
+
+Revision ID: 5b7e2a9c4d10
+Revises: 3f1a9c2b7d41
+Create Date: 2026-10-19 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.online_migrations import has_table
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2a9c4d10'
+down_revision: Union[str, Sequence[str], None] = '3f1a9c2b7d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# db.models.model_tenant.DEFAULT_TENANT_ID , spelled out so the revision does not change with the model
+DEFAULT_TENANT_ID = 1
+
+
+def timestamps():
+    return [
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    ]
+
+def tenant_id():
+    return sa.Column('tenant_id', sa.Integer(), sa.ForeignKey('tenants.id'), nullable=False,
+                     server_default=str(DEFAULT_TENANT_ID))
+
+
+def create_tenants():
+    op.create_table(
+        'tenants',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('slug', sa.String(), nullable=False, unique=True),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.Column('active_timetable_version_id', sa.Integer(), nullable=True),
+        *timestamps(),
+    )
+    # every existing row is given this tenant by the next revision , so it has to exist first
+    op.execute(
+        f"INSERT INTO tenants (id, name, slug, active, created_at, updated_at) "
+        f"VALUES ({DEFAULT_TENANT_ID}, 'default', 'default', true, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+    )
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute(f"SELECT setval('tenants_id_seq', {DEFAULT_TENANT_ID})")
+
+def create_timetable_versions():
+    op.create_table(
+        'timetable_versions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='draft'),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('published_at', sa.DateTime(), nullable=True),
+        sa.Column('previous_version_id', sa.Integer(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index('ix_timetable_versions_tenant', 'timetable_versions', ['tenant_id', 'id'])
+
+def create_users():
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('phone', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        *timestamps(),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+def create_accounts():
+    op.create_table(
+        'accounts',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False, unique=True),
+        sa.Column('balance', sa.Integer(), nullable=False),
+        sa.Column('currency', sa.String(), nullable=False),
+        *timestamps(),
+    )
+    op.create_index('ix_accounts_id', 'accounts', ['id'])
+
+def create_native_chess_profiles():
+    op.create_table(
+        'native_chess_profiles',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False, unique=True),
+        *timestamps(),
+    )
+    op.create_index('ix_native_chess_profiles_id', 'native_chess_profiles', ['id'])
+
+def create_students():
+    op.create_table(
+        'students',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('phone', sa.String(), nullable=False),
+        sa.Column('student_id', sa.String(), nullable=False),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.Column('class_name', sa.String(), nullable=True),
+        sa.Column('alert_mask', sa.SmallInteger(), nullable=False),
+        sa.Column('quiet_start', sa.SmallInteger(), nullable=True),
+        sa.Column('quiet_end', sa.SmallInteger(), nullable=True),
+        sa.Column('opted_out', sa.Boolean(), nullable=False),
+        *timestamps(),
+        sa.UniqueConstraint('tenant_id', 'email', name='uq_students_tenant_email'),
+        sa.UniqueConstraint('tenant_id', 'student_id', name='uq_students_tenant_student_id'),
+    )
+    op.create_index('ix_students_id', 'students', ['id'])
+    op.create_index('ix_students_tenant_active', 'students', ['tenant_id', 'active', 'id'])
+
+def create_class_occurrences():
+    op.create_table(
+        'class_occurrences',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('timetable_id', sa.Integer(), sa.ForeignKey('time_table.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('version_id', sa.Integer(), nullable=True),
+        sa.Column('original_date', sa.Date(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('start_time', sa.Time(), nullable=False),
+        sa.Column('end_time', sa.Time(), nullable=False),
+        sa.Column('unit', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        *timestamps(),
+        sa.UniqueConstraint('timetable_id', 'original_date', name='uq_class_occurrences_slot_date'),
+    )
+    op.create_index('ix_class_occurrences_date_start', 'class_occurrences', ['tenant_id', 'date', 'start_time'])
+
+def create_timetable_exceptions():
+    op.create_table(
+        'timetable_exceptions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('timetable_id', sa.Integer(), sa.ForeignKey('time_table.id', ondelete='CASCADE'), nullable=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=False),
+        sa.Column('new_date', sa.Date(), nullable=True),
+        sa.Column('new_start_time', sa.Time(), nullable=True),
+        sa.Column('new_end_time', sa.Time(), nullable=True),
+        sa.Column('reason', sa.String(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index('ix_timetable_exceptions_timetable_id', 'timetable_exceptions', ['timetable_id'])
+    op.create_index('ix_timetable_exceptions_tenant_dates', 'timetable_exceptions', ['tenant_id', 'start_date', 'end_date'])
+
+def create_sms_messages():
+    op.create_table(
+        'sms_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('provider_message_id', sa.String(), nullable=False, unique=True),
+        sa.Column('class_id', sa.Integer(), sa.ForeignKey('time_table.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('failure_reason', sa.String(), nullable=True),
+        sa.Column('network_code', sa.String(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index('ix_sms_messages_class_status', 'sms_messages', ['class_id', 'status'])
+
+def create_idempotency_keys():
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(), primary_key=True),
+        sa.Column('fingerprint', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.JSON(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+def create_scheduled_messages():
+    op.create_table(
+        'scheduled_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        tenant_id(),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('recipients', sa.JSON(), nullable=True),
+        sa.Column('send_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        *timestamps(),
+    )
+    op.create_index('ix_scheduled_messages_pending', 'scheduled_messages', ['tenant_id', 'send_at', 'id'],
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+    op.create_index('ix_scheduled_messages_sending', 'scheduled_messages', ['updated_at'],
+                    postgresql_where=sa.text("status = 'sending'"), sqlite_where=sa.text("status = 'sending'"))
+    op.create_index('ix_scheduled_messages_tenant_created', 'scheduled_messages', ['tenant_id', 'created_at', 'id'])
+
+def create_message_log():
+    postgres = op.get_context().dialect.name == 'postgresql'
+    op.create_table(
+        'message_log',
+        # a bigserial , sqlite has no autoincrement in a composite primary key
+        sa.Column('id', sa.BigInteger(), autoincrement=postgres, nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=False),
+        sa.Column('tenant_id', sa.Integer(), nullable=False, server_default=str(DEFAULT_TENANT_ID)),
+        sa.Column('recipient', sa.String(), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('minutes_before', sa.SmallInteger(), nullable=True),
+        sa.Column('provider', sa.String(), nullable=True),
+        sa.Column('provider_message_id', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id', 'sent_at'),
+        postgresql_partition_by='RANGE (sent_at)',
+    )
+    if postgres:
+        # the writer adds the monthly partitions , rows outside them land here
+        op.execute('CREATE TABLE IF NOT EXISTS message_log_default PARTITION OF message_log DEFAULT')
+    op.create_index('ix_message_log_class_sent', 'message_log', ['tenant_id', 'class_id', 'sent_at', 'id'],
+                    postgresql_include=['recipient', 'kind', 'minutes_before', 'status'])
+    op.create_index('ix_message_log_recipient_sent', 'message_log', ['tenant_id', 'recipient', 'sent_at', 'id'],
+                    postgresql_include=['class_id', 'kind', 'minutes_before', 'status'])
+    op.create_index('ix_message_log_sent', 'message_log', ['tenant_id', 'sent_at', 'id'])
+
+# in the order they are created , each only references tables before it ( and time_table )
+TABLES = (
+    ('tenants', create_tenants),
+    ('timetable_versions', create_timetable_versions),
+    ('users', create_users),
+    ('accounts', create_accounts),
+    ('native_chess_profiles', create_native_chess_profiles),
+    ('students', create_students),
+    ('class_occurrences', create_class_occurrences),
+    ('timetable_exceptions', create_timetable_exceptions),
+    ('sms_messages', create_sms_messages),
+    ('idempotency_keys', create_idempotency_keys),
+    ('scheduled_messages', create_scheduled_messages),
+    ('message_log', create_message_log),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # new and empty , so plain CREATE INDEX is fine here
+    for table, create in TABLES:
+        if not has_table(table):
+            create()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, _ in reversed(TABLES):
+        op.drop_table(table)
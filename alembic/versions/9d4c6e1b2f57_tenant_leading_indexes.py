@@ -0,0 +1,153 @@
+"""tenant and version columns , and the indexes and constraints that lead with them
+
+Tables made before schools ( tenants ) and timetable versions existed get their tenant_id ,
+every existing row going to the default tenant , and time_table and class_occurrences their
+version_id. The lookup indexes are then rebuilt to lead with tenant_id , concurrently and
+swapped in under the same name , and the clash constraints of time_table are rebuilt to
+compare slots within one tenant's version only. Anything already in its current shape is
+left alone , so this is a no-op on a database made with create_all
+
+Revision ID: 9d4c6e1b2f57
+Revises: 5b7e2a9c4d10
+Create Date: 2026-10-19 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from db.online_migrations import add_column, add_foreign_key, ensure_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4c6e1b2f57'
+down_revision: Union[str, Sequence[str], None] = '5b7e2a9c4d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# db.models.model_tenant.DEFAULT_TENANT_ID
+DEFAULT_TENANT_ID = 1
+
+# tables whose rows belong to a school , and whether tenant_id references tenants ( the log has no foreign keys )
+TENANT_TABLES = (
+    ('time_table', True),
+    ('class_occurrences', True),
+    ('timetable_exceptions', True),
+    ('students', True),
+    ('users', True),
+    ('message_log', False),
+)
+
+INDEXES = (
+    ('ix_time_table_week', 'time_table', ['tenant_id', 'version_id', 'day_index', 'start_time', 'id'], {}),
+    ('ix_time_table_unit_week', 'time_table', ['tenant_id', 'version_id', 'unit', 'day_index', 'start_time', 'id'], {}),
+    ('ix_class_occurrences_date_start', 'class_occurrences', ['tenant_id', 'date', 'start_time'], {}),
+    ('ix_timetable_exceptions_tenant_dates', 'timetable_exceptions', ['tenant_id', 'start_date', 'end_date'], {}),
+    ('ix_students_tenant_active', 'students', ['tenant_id', 'active', 'id'], {}),
+    ('ix_timetable_versions_tenant', 'timetable_versions', ['tenant_id', 'id'], {}),
+    ('ix_scheduled_messages_sending', 'scheduled_messages', ['updated_at'], {
+        'postgresql_where': sa.text("status = 'sending'"), 'sqlite_where': sa.text("status = 'sending'"),
+    }),
+    ('ix_message_log_class_sent', 'message_log', ['tenant_id', 'class_id', 'sent_at', 'id'], {
+        'partitioned': True, 'postgresql_include': ['recipient', 'kind', 'minutes_before', 'status'],
+    }),
+    ('ix_message_log_recipient_sent', 'message_log', ['tenant_id', 'recipient', 'sent_at', 'id'], {
+        'partitioned': True, 'postgresql_include': ['class_id', 'kind', 'minutes_before', 'status'],
+    }),
+    ('ix_message_log_sent', 'message_log', ['tenant_id', 'sent_at', 'id'], {'partitioned': True}),
+)
+
+# registration numbers and emails became unique per school instead of overall
+STUDENT_UNIQUES = (
+    ('uq_students_tenant_email', 'students_email_key', 'email'),
+    ('uq_students_tenant_student_id', 'students_student_id_key', 'student_id'),
+)
+
+# db.models.model_timetable.SLOT_RANGE
+SLOT_RANGE = "tsrange(DATE '2000-01-01' + start_time, DATE '2000-01-01' + end_time)"
+OVERLAP_COLUMNS = ('room', 'lecturer', 'group_name')
+
+
+def is_postgres() -> bool:
+    return op.get_context().dialect.name == 'postgresql'
+
+def constraint_definition(name: str):
+    if context.is_offline_mode():
+        return None
+    return op.get_bind().execute(
+        sa.text("SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = :name"), {'name': name}
+    ).scalar()
+
+def add_columns():
+    columns = (
+        ('tenants', sa.Column('active_timetable_version_id', sa.Integer(), nullable=True)),
+        ('timetable_versions', sa.Column('previous_version_id', sa.Integer(), nullable=True)),
+        ('time_table', sa.Column('version_id', sa.Integer(), nullable=True)),
+        ('time_table', sa.Column('room', sa.String(), nullable=True)),
+        ('time_table', sa.Column('lecturer', sa.String(), nullable=True)),
+        ('time_table', sa.Column('group_name', sa.String(), nullable=True)),
+        ('class_occurrences', sa.Column('version_id', sa.Integer(), nullable=True)),
+    )
+    for table, _ in TENANT_TABLES:
+        # a constant default , so postgres fills existing rows without rewriting the table
+        add_column(table, sa.Column('tenant_id', sa.Integer(), nullable=False, server_default=str(DEFAULT_TENANT_ID)))
+    for table, column in columns:
+        add_column(table, column)
+
+    for table, references in TENANT_TABLES:
+        if references:
+            add_foreign_key(table, 'tenant_id', 'tenants')
+    add_foreign_key('timetable_versions', 'tenant_id', 'tenants')
+    add_foreign_key('time_table', 'version_id', 'timetable_versions', ondelete='CASCADE')
+
+def replace_student_uniques():
+    if not is_postgres():
+        # sqlite cannot alter constraints , recreate a dev database with create_all instead
+        return
+    for name, old_name, column in STUDENT_UNIQUES:
+        if constraint_definition(name) is None:
+            # the unique index is built without blocking writes , attaching it is a catalog change
+            ensure_index(name, 'students', ['tenant_id', column], unique=True)
+            op.execute(f"ALTER TABLE students ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
+        op.execute(f"ALTER TABLE students DROP CONSTRAINT IF EXISTS {old_name}")
+
+def rebuild_overlap_constraints():
+    if not is_postgres():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in OVERLAP_COLUMNS:
+        name = f'ex_time_table_{column}_overlap'
+        definition = constraint_definition(name)
+        if definition is not None and 'version_id' in definition:
+            continue
+        # an exclusion constraint cannot be built concurrently , this blocks writes to time_table
+        # ( a few thousand rows per school ) while its gist index builds
+        op.execute(f"ALTER TABLE time_table DROP CONSTRAINT IF EXISTS {name}")
+        op.execute(
+            f"ALTER TABLE time_table ADD CONSTRAINT {name} EXCLUDE USING gist ("
+            f"tenant_id WITH =, coalesce(version_id, 0) WITH =, lower(day) WITH =, {column} WITH =, {SLOT_RANGE} WITH &&)"
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    add_columns()
+    replace_student_uniques()
+    rebuild_overlap_constraints()
+    for name, table, columns, kw in INDEXES:
+        ensure_index(name, table, columns, **kw)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # time_table back to what it was before schools and versions , the other tables are
+    # dropped by the previous revision's downgrade anyway
+    if is_postgres():
+        for column in OVERLAP_COLUMNS:
+            op.execute(f"ALTER TABLE time_table DROP CONSTRAINT IF EXISTS ex_time_table_{column}_overlap")
+    for name, table, columns, kw in INDEXES:
+        if table == 'time_table':
+            op.drop_index(name, table_name=table, if_exists=True)
+    for column in ('version_id', 'tenant_id', *OVERLAP_COLUMNS):
+        op.drop_column('time_table', column)
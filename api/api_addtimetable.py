@@ -1,15 +1,38 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 import fastapi
+import json
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import time
+from sqlalchemy.exc import IntegrityError
+from datetime import time, date
+from typing import List, Optional
+
+try:
+    import orjson
+except ImportError: # orjson is optional , we just fall back to the standard json encoder
+    orjson = None
 
 from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 from starlette.types import HTTPExceptionHandler
-from api.utils.util_timetables import add_new_timetalbe
+from api.utils.util_timetables import (
+    add_new_timetalbe, add_timetable_exception, get_timetable_by_id, parse_fields, get_timetable_page, timetable_query, occurrences_query,
+    get_active_version_id, get_timetable_version, get_timetable_versions
+)
+from db.db_setup import AsyncSessionLocal
+from db.models.model_timetable_version import ACTIVE_VERSION
+from services.timetable_services.occurrence_service import occurrence_engine
+from services.timetable_services.conflict_service import check_new_slots
+from services.timetable_services.version_service import timetable_versions
+from services.event_services.event_bus import event_bus
 
 from api.utils.dependancies import db_dependancy
 
 from api.utils.dependancies import user_depencancy
+from pydantic_schemas.timetable_schema import (
+    TimetableCreateRequest, TimetableResponse,
+    TimetableExceptionCreateRequest, TimetableExceptionResponse, ClassOccurrenceResponse, TimetablePageResponse,
+    TimetableVersionCreateRequest, TimetableVersionResponse, TimetableSlotsLoadResponse, TimetablePublishResponse
+)
 
 # hard_timetable_data = {
 #     {'starttime' : time(7,0) , 'end_time' : time(9,0) , 'unit' : 'mathematics' },
@@ -20,15 +43,217 @@ from api.utils.dependancies import user_depencancy
 
 router = APIRouter()
 
-@router.post('/add_timetable')
-async def add_timetable(db : db_dependancy , User : user_depencancy , timetable_data):
+@router.post('/add_timetable', response_model=List[TimetableResponse], status_code=fastapi.status.HTTP_201_CREATED)
+async def add_timetable(db : db_dependancy , User : user_depencancy , timetable_data : List[TimetableCreateRequest]):
+    slots = [item.model_dump() for item in timetable_data]
+    # edits go to the live timetable , a new term is loaded into a draft version instead ( /timetable-versions )
+    version_id = await get_active_version_id(db , User['tenant_id'])
+    # validate the whole batch against itself and the stored timetable before writing anything
+    problems = await check_new_slots(db , slots , User['tenant_id'] , version_id)
+    if problems:
+        raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = {'message' : 'timetable has clashes' , 'conflicts' : problems})
+
     # here we will add the things iteratively
-    for item in timetable_data:
+    new_db_objects = []
+    for item in slots:
         try:
-            new_db_object = add_new_timetalbe(item)
-            if not new_db_object:
-                raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR , detail = "object returned from database is undefined")
+            new_db_object = await add_new_timetalbe(db , item , User['tenant_id'] , version_id)
+        except IntegrityError:
+            # the postgres exclusion constraint caught a clash written by someone else in the meantime
+            raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = "timetable slot clashes with an existing slot")
         except Exception as e:
             raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR , detail = "failed to add to the database ")
-        
-        
\ No newline at end of file
+        if not new_db_object:
+            raise HTTPException(status_code=HTTP_500_INTERNAL_SERVER_ERROR , detail = "object returned from database is undefined")
+        new_db_objects.append(new_db_object)
+    # only the new slots get materialised , the rest of the occurrences are left alone
+    await occurrence_engine.materialise(db , [obj.id for obj in new_db_objects])
+    await db.commit()
+    # the TimetableResponse model reads these straight off the orm objects ( from_attributes )
+    return new_db_objects
+
+
+@router.post('/timetable-exceptions', response_model=TimetableExceptionResponse, status_code=fastapi.status.HTTP_201_CREATED)
+async def add_exception(db : db_dependancy , User : user_depencancy , exception_data : TimetableExceptionCreateRequest):
+    # holidays , exam weeks , one-off cancellations and reschedules
+    if exception_data.end_date < exception_data.start_date:
+        raise HTTPException(status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY , detail = "end_date is before start_date")
+    if exception_data.kind == 'reschedule' and exception_data.timetable_id is None:
+        raise HTTPException(status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY , detail = "a reschedule needs a timetable_id")
+    if exception_data.timetable_id is not None and not await get_timetable_by_id(db , exception_data.timetable_id , User['tenant_id']):
+        raise HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND , detail = "timetable slot not found")
+    db_exception = await add_timetable_exception(db , exception_data.model_dump() , User['tenant_id'])
+    await occurrence_engine.rematerialise_for_exception(db , db_exception)
+    await db.commit()
+    return db_exception
+
+@router.get('/occurrences', response_model=List[ClassOccurrenceResponse])
+async def get_occurrences(db : db_dependancy , User : user_depencancy , day : date):
+    # ready made dated classes for one day , cancelled ones included so the frontend can show them
+    return await occurrence_engine.get_occurrences_for_date(db , day , include_cancelled = True , tenant_ids = [User['tenant_id']])
+
+
+
+# ---- timetable versions --------------------------------------------------------
+# a new term : create a draft , load its slots , review it with GET /timetable?version_id= , publish .
+# publishing switches every reader to the new version at once , rollback switches back
+
+def _version_response(version , active_id) -> dict:
+    return {**TimetableVersionResponse.model_validate(version).model_dump() , 'active' : version.id == active_id}
+
+@router.post('/timetable-versions', response_model=TimetableVersionResponse, status_code=fastapi.status.HTTP_201_CREATED)
+async def create_timetable_version(db : db_dependancy , User : user_depencancy , version_data : TimetableVersionCreateRequest):
+    version = await timetable_versions.create_draft(
+        db , User['tenant_id'] , version_data.name , User['user_id'] , copy_active = version_data.copy_active
+    )
+    await db.commit()
+    return _version_response(version , None)
+
+@router.get('/timetable-versions', response_model=List[TimetableVersionResponse])
+async def list_timetable_versions(db : db_dependancy , User : user_depencancy):
+    active_id = await get_active_version_id(db , User['tenant_id'])
+    return [_version_response(version , active_id) for version in await get_timetable_versions(db , User['tenant_id'])]
+
+@router.post('/timetable-versions/rollback', response_model=TimetablePublishResponse)
+async def rollback_timetable_version(db : db_dependancy , User : user_depencancy):
+    # back to the version that was live before the current one
+    rolled_back = await timetable_versions.rollback(db , User['tenant_id'])
+    if rolled_back is None:
+        raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = "no earlier version to roll back to")
+    await db.commit()
+    version = rolled_back['version']
+    event_bus.publish('timetable_published' , tenant_id = User['tenant_id'] , version_id = version.id , previous_version_id = rolled_back['previous_version_id'] , rollback = True)
+    return {
+        'version' : _version_response(version , version.id) ,
+        'previous_version_id' : rolled_back['previous_version_id'] ,
+        'occurrences' : rolled_back['occurrences']
+    }
+
+async def _get_draft(db , version_id : int , tenant_id : int):
+    version = await get_timetable_version(db , version_id , tenant_id)
+    if version is None:
+        raise HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND , detail = "timetable version not found")
+    if version.status != 'draft':
+        raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = "only a draft can be changed , start a new draft from it with copy_active")
+    return version
+
+@router.post('/timetable-versions/{version_id}/slots', response_model=TimetableSlotsLoadResponse, status_code=fastapi.status.HTTP_201_CREATED)
+async def load_timetable_version_slots(version_id : int , db : db_dependancy , User : user_depencancy , timetable_data : List[TimetableCreateRequest]):
+    # a whole term in one request , checked against itself and the draft's slots and written in one statement
+    version = await _get_draft(db , version_id , User['tenant_id'])
+    slots = [item.model_dump() for item in timetable_data]
+    problems = await check_new_slots(db , slots , User['tenant_id'] , version.id)
+    if problems:
+        raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = {'message' : 'timetable has clashes' , 'conflicts' : problems})
+    try:
+        loaded = await timetable_versions.load_slots(db , version , slots)
+    except IntegrityError:
+        raise HTTPException(status_code=fastapi.status.HTTP_409_CONFLICT , detail = "timetable slot clashes with an existing slot")
+    await db.commit()
+    return {'version_id' : version.id , 'slots' : loaded}
+
+@router.post('/timetable-versions/{version_id}/publish', response_model=TimetablePublishResponse)
+async def publish_timetable_version(version_id : int , db : db_dependancy , User : user_depencancy):
+    # a draft , or an archived version to go back to
+    version = await get_timetable_version(db , version_id , User['tenant_id'])
+    if version is None:
+        raise HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND , detail = "timetable version not found")
+    published = await timetable_versions.publish(db , version)
+    await db.commit()
+    event_bus.publish('timetable_published' , tenant_id = User['tenant_id'] , version_id = version.id , previous_version_id = published['previous_version_id'])
+    return {'version' : _version_response(version , version.id) , **published}
+
+@router.delete('/timetable-versions/{version_id}', status_code=fastapi.status.HTTP_204_NO_CONTENT)
+async def delete_timetable_version(version_id : int , db : db_dependancy , User : user_depencancy):
+    # drafts only , its slots go with it
+    version = await _get_draft(db , version_id , User['tenant_id'])
+    await db.delete(version)
+    await db.commit()
+
+
+STREAM_BATCH_SIZE = 500 # rows fetched from the server side cursor at a time
+TERM_VIEW_MAX_DAYS = 366
+
+def _ndjson_line(row : dict) -> bytes:
+    if orjson is None:
+        return (json.dumps(row , default = str) + '\n').encode()
+    return orjson.dumps(row , option = orjson.OPT_APPEND_NEWLINE)
+
+async def _stream_rows(query , fields = None):
+    # own session : the response outlives the request's dependencies , and rows are pulled in batches from a server side cursor
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per = STREAM_BATCH_SIZE))
+        async for partition in result.partitions():
+            chunk = b''.join(
+                _ndjson_line({field : row._mapping[field] for field in fields} if fields else dict(row._mapping))
+                for row in partition
+            )
+            yield chunk
+
+@router.get('/timetable', response_model=TimetablePageResponse)
+async def list_timetable(
+    db : db_dependancy ,
+    User : user_depencancy ,
+    day : Optional[List[str]] = Query(None) ,
+    unit : Optional[List[str]] = Query(None) ,
+    from_time : Optional[time] = None ,
+    to_time : Optional[time] = None ,
+    room : Optional[str] = None ,
+    lecturer : Optional[str] = None ,
+    group_name : Optional[str] = None ,
+    fields : Optional[str] = None ,
+    limit : int = Query(100 , ge=1 , le=1000) ,
+    cursor : Optional[str] = None ,
+    version_id : Optional[int] = None
+):
+    # weekly slots in week order , filter with ?day=monday&day=tuesday&unit=...&from_time=08:00&to_time=12:00
+    # ?fields=unit,start_time returns only those columns , page on with the returned next_cursor
+    # the live timetable , or a draft to review with ?version_id=
+    try:
+        selected = parse_fields(fields)
+        rows , next_cursor = await get_timetable_page(
+            db , User['tenant_id'] , selected , limit , cursor ,
+            days = day , units = unit , from_time = from_time , to_time = to_time ,
+            room = room , lecturer = lecturer , group_name = group_name ,
+            version_id = ACTIVE_VERSION if version_id is None else version_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=fastapi.status.HTTP_400_BAD_REQUEST , detail = str(e) or "invalid cursor")
+    return {'data' : rows , 'next_cursor' : next_cursor}
+
+@router.get('/timetable/stream')
+async def stream_timetable(
+    User : user_depencancy ,
+    day : Optional[List[str]] = Query(None) ,
+    unit : Optional[List[str]] = Query(None) ,
+    from_time : Optional[time] = None ,
+    to_time : Optional[time] = None ,
+    room : Optional[str] = None ,
+    lecturer : Optional[str] = None ,
+    group_name : Optional[str] = None ,
+    fields : Optional[str] = None
+):
+    # the whole ( filtered ) week as newline delimited json , streamed as it is read instead of built in memory
+    try:
+        selected = parse_fields(fields)
+        query = timetable_query(
+            User['tenant_id'] , selected , days = day , units = unit , from_time = from_time , to_time = to_time ,
+            room = room , lecturer = lecturer , group_name = group_name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=fastapi.status.HTTP_400_BAD_REQUEST , detail = str(e))
+    return StreamingResponse(_stream_rows(query , selected) , media_type = 'application/x-ndjson')
+
+@router.get('/occurrences/stream')
+async def stream_occurrences(
+    User : user_depencancy ,
+    start_date : date ,
+    end_date : date ,
+    unit : Optional[List[str]] = Query(None) ,
+    include_cancelled : bool = True
+):
+    # term view : every dated class between two dates as newline delimited json
+    if end_date < start_date or (end_date - start_date).days > TERM_VIEW_MAX_DAYS:
+        raise HTTPException(status_code=fastapi.status.HTTP_400_BAD_REQUEST , detail = f"end_date must be within {TERM_VIEW_MAX_DAYS} days after start_date")
+    query = occurrences_query(User['tenant_id'] , start_date , end_date , unit , include_cancelled)
+    return StreamingResponse(_stream_rows(query) , media_type = 'application/x-ndjson')
@@ -1,9 +1,5 @@
 from datetime import timedelta , datetime , timezone
-from typing import Annotated
-import os # os import
-from aiohttp.web import HTTPExpectationFailed
-from requests import status_codes
-from typing_extensions import runtime
+from typing import Annotated , List
 
 from fastapi import Depends , HTTPException , status , APIRouter
 from pydantic import BaseModel 
@@ -12,12 +8,13 @@ from jose import jwt
 from starlette.status import HTTP_400_BAD_REQUEST
 import logging
 
-from dotenv import load_dotenv
-from api.utils.dependancies import ALGORITHM, SECRET_KEY, bcrypt_context , db_dependancy , refresh_user_dependancy
-from pydantic_schemas.users_schema import Token , UserCreateRequest
-from api.utils.util_users import create_user , get_user_by_username , get_user_by_email
+from api.utils.dependancies import ALGORITHM, REFRESH_ALGORITHM, SECRET_KEY, bcrypt_context , db_dependancy , refresh_user_dependancy , user_depencancy , admin_dependancy
+from pydantic_schemas.users_schema import Token , UserCreateRequest , UserProfileResponse , BulkUserCreateResponse
+from api.utils.util_users import create_user , get_user_by_username , get_user_by_email , get_user_profile , bulk_create_users
+from services.chess_services.chess_profile_service import chess_profiles , ChessAPIUnavailable
+from settings import get_settings
 
-load_dotenv()
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -25,10 +22,6 @@ router = APIRouter(
     tags = ['auth']
 )
 
-SECRET_KEY = os.getenv('AUTH_SECRET_KEY')
-ALGORITHM = os.getenv('AUTH_ALGORITHM')
-REFRESH_ALGORITHM = os.getenv('REFRESH_ALGORITHM')
-
 # now we are going to create some functinality for the authentication itself 
 # user auth function 
 
@@ -42,21 +35,21 @@ async def authenticate_user(username: str, password: str, db):
 
 # now lets build another function for generating the authentication token 
 
-async def create_access_token( username : str , user_id : int , expires_delta : timedelta ):
-    encode = {'sub' : username , 'id' : user_id}
+async def create_access_token( username : str , user_id : int , expires_delta : timedelta , tenant_id : int ):
+    encode = {'sub' : username , 'id' : user_id , 'tenant' : tenant_id}
     expires = datetime.now(timezone.utc) + expires_delta
     encode.update({'exp' : expires})
     return jwt.encode(encode , SECRET_KEY , algorithm = ALGORITHM) # and just like that we will have created the access token 
 
-async def create_refresh_token(username : str , user_id : int , expires_delta : timedelta):
-    encode = {'sub' : username , 'id' : user_id }
+async def create_refresh_token(username : str , user_id : int , expires_delta : timedelta , tenant_id : int):
+    encode = {'sub' : username , 'id' : user_id , 'tenant' : tenant_id }
     expires = datetime.now(timezone.utc) + expires_delta
     encode.update({'exp' : expires})
     return jwt.encode(encode , SECRET_KEY , algorithm = REFRESH_ALGORITHM)
 
 # ENDPOINTS
 #this endpoint is for creating a new user to the database and the system 
-@router.post('/' , status_code = status.HTTP_201_CREATED)
+@router.post('/' , response_model = Token , status_code = status.HTTP_201_CREATED)
 async def add_user( db : db_dependancy , user : UserCreateRequest):
     """
     fetch database to confirm that user is not duplicate by confirming the email
@@ -69,33 +62,31 @@ async def add_user( db : db_dependancy , user : UserCreateRequest):
         raise HTTPException( status_code = status.HTTP_409_CONFLICT , detail = "email is already registered")
     # fech user data to confirm validility of the account on chess.com
     if user.chessDotComUsername :
-        try : 
-            chess_service_instance = ChessPlayerService(user.chess_username)
-            user_chess_data = await chess_service_instance.fetch_user_profile_data() # error handing for the response is already done in the chessprofileservice itself 
-            # after fetching the chess user data the next step is to add the data to the database of which we have down down here after the creating a new user to the database
-        except Exception as e:
-            logger.error(f'the chessprofile service failed {e}')
-            raise RuntimeError(f'the chess service failed')
+        # signup waits for chess.com only up to the client's deadline , lookups are cached and concurrent ones coalesced
+        try :
+            user_chess_data = await chess_profiles.get_profile(user.chessDotComUsername)
+        except ChessAPIUnavailable as e:
+            # chess.com being slow or down should not block signups , the account is created unverified
+            logger.warning(f'could not verify chess.com account {user.chessDotComUsername} : {e}')
+            user_chess_data = {}
+        if user_chess_data is None:
+            raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST , detail = "chess.com account not found")
         #on successful fetch of the chess user data i belive its not time to create populate the database with relevant data for the users using their chess.com username as their username
         new_db_user = await create_user(db , user)
         if not new_db_user:
-            raise RuntimeError(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR , detail = f"failed to create a new user database object")
-        new_db_chess_profile_foreign = await add_new_chess_player(user_chess_data)
-        if not new_db_chess_profile_foreign :
-            raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR , detail = f"failed to create a chess.com profile on database")
-        print("user and related object created successfuly")
-        token = await create_access_token(new_db_user.username , new_db_user.id , timedelta(minutes=20))
+            raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR , detail = f"failed to create a new user database object")
+        # the native chess profile is created by create_user , there is no separate chess.com profile table to fill yet
+        token = await create_access_token(new_db_user.username , new_db_user.id , timedelta(minutes=20) , new_db_user.tenant_id)
         return {'access_token' : token , 'token_type' : 'bearer' }
 
     else :
-        print(f'no chess username was provided thus no need to add fetch chess user data')
         # create a new user profile in the database using the non_chess.com username
         new_db_user = await create_user(db , user)
         if not new_db_user:
             raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR , detail = f"failed to create a chess profile for the normal non chess.com username")
         # by this point the native profile will have been created in the create user utility function 
         # and thus the only thing left i think will be return the access token 
-        token = await create_access_token(new_db_user.username , new_db_user.id , timedelta(minutes = 20))
+        token = await create_access_token(new_db_user.username , new_db_user.id , timedelta(minutes = 20) , new_db_user.tenant_id)
         return {'access_token' : token , 'token_type' : 'bearer'}
         
 # lets create another endpoint for getting the access token and sedning it back to the user
@@ -107,8 +98,8 @@ async def login_for_access_token(
     if not user:
         raise HTTPException( status_code =status.HTTP_401_UNAUTHORIZED , detail = " could not authorize the user , the dtails that you have entered are not correct check details please  ")
         raise RuntimeError( status_code=status.HTTP_401_UNAUTHORIZED , detail = 'the dtails that you have entered are not correct check details please ')
-    access_token = await create_access_token(user.username , user.id , timedelta(minutes = 20))
-    refresh_token = await create_refresh_token(user.username , user.id , timedelta(minutes=10080))
+    access_token = await create_access_token(user.username , user.id , timedelta(minutes = 20) , user.tenant_id)
+    refresh_token = await create_refresh_token(user.username , user.id , timedelta(minutes=10080) , user.tenant_id)
     return {
         'access_token' : access_token ,
         #'refresh_token' : refresh_token , 
@@ -116,14 +107,31 @@ async def login_for_access_token(
          }
 
 # we are now going to create a nll use it iew endpoint for generating a new access tokne whenver the previous one expires 
-@router.post('/token/refresh' ) # so this neans when querying this endpoint we structure it this way : /auth/token/refresh and this is based on the prefix at the start of the file 
+@router.post('/token/refresh' , response_model = Token ) # so this neans when querying this endpoint we structure it this way : /auth/token/refresh and this is based on the prefix at the start of the file 
 async def get_new_access_token(data : refresh_user_dependancy):
     username = data.get('username')
     user_id = data.get('id')
-    print("we are now extracting user data from the ")
     if username is None or user_id is None:
         raise HTTPException( status_code = status.HTTP_401_UNAUTHORIZED , detail = "error authenticating user")
-    new_access_token = await create_access_token(username , user_id , timedelta(minutes = 20))
+    new_access_token = await create_access_token(username , user_id , timedelta(minutes = 20) , data.get('tenant_id'))
     return {'access_token' : new_access_token , 'token_type' : 'bearer' }
 
+# profile of the logged in user , served from the user cache so most calls never open a db session
+@router.get('/me' , response_model = UserProfileResponse)
+async def get_my_profile(user : user_depencancy):
+    profile = await get_user_profile(user['user_id'])
+    if profile is None:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND , detail = "user not found")
+    return profile
+
+BULK_USER_MAX_ROWS = settings.bulk_user_max_rows
+
+# admin endpoint for onboarding a whole cohort in one call , rows that clash on email or username are reported back
+@router.post('/admin/bulk-users' , response_model = BulkUserCreateResponse , status_code = status.HTTP_201_CREATED)
+async def bulk_add_users(db : db_dependancy , admin : admin_dependancy , users : List[UserCreateRequest]):
+    if len(users) > BULK_USER_MAX_ROWS:
+        raise HTTPException(status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE , detail = f"at most {BULK_USER_MAX_ROWS} users per request")
+    # the cohort joins the admin's own school
+    return await bulk_create_users(db , users , admin['tenant_id'])
+
 # note : this endpoint created here we will use it in future requests when building the other secure endpoints 
\ No newline at end of file
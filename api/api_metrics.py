@@ -0,0 +1,64 @@
+from fastapi import APIRouter
+
+from api.utils.dependancies import user_depencancy
+from db.db_setup import get_pool_metrics , engine
+from db.query_cache import get_query_cache_metrics
+from api.utils.user_cache import cache_metrics
+from services.sms_services.sms_service import get_sms_service
+from services.timetable_services.timetable_allerts import alert_service
+from services.logging_services.structured_logging import logging_metrics
+from services.tracing_services.tracing import tracing_metrics
+
+router = APIRouter(
+    prefix = '/metrics',
+    tags = ['metrics']
+)
+
+@router.get('/db')
+async def get_db_metrics(user : user_depencancy):
+    """
+    connection pool usage and how many requests actually opened a db session
+    """
+    return get_pool_metrics()
+
+@router.get('/queries')
+async def get_query_metrics(user : user_depencancy):
+    """
+    compiled statement cache hits and misses
+    """
+    return get_query_cache_metrics(engine.sync_engine)
+
+@router.get('/sms-providers')
+async def get_sms_provider_metrics(user : user_depencancy):
+    """
+    rolling latency , error rate and circuit state per sms provider
+    """
+    return get_sms_service().router.snapshot()
+
+@router.get('/alerts')
+async def get_alert_metrics(user : user_depencancy):
+    """
+    due alerts vs sms sends actually made after coalescing
+    """
+    return alert_service.coalesce_stats
+
+@router.get('/user-cache')
+async def get_user_cache_metrics(user : user_depencancy):
+    """
+    user profile cache hits , misses and how many misses actually went to postgres
+    """
+    return cache_metrics
+
+@router.get('/logging')
+async def get_logging_metrics(user : user_depencancy):
+    """
+    log records dropped because the log queue was full and high volume records skipped by sampling
+    """
+    return logging_metrics
+
+@router.get('/tracing')
+async def get_tracing_metrics(user : user_depencancy):
+    """
+    traces kept ( slow , failed or sampled ) and dropped by tail sampling
+    """
+    return tracing_metrics
@@ -1,16 +1,40 @@
 # api/api_sms_alerts.py
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR, HTTP_200_OK, HTTP_201_CREATED
+from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR, HTTP_502_BAD_GATEWAY, HTTP_200_OK, HTTP_201_CREATED
+import hmac
+import json
 import logging
+from datetime import datetime
 
 from api.utils.dependancies import db_dependancy, user_depencancy
-from services.sms_services.sms_service import sms_service
-from services.timetable_alerts.alert_service import alert_service
+from api.utils.util_timetables import get_timetable_by_id
+from api.utils.idempotency import idempotency_dependancy
+from services.sms_services.sms_service import get_sms_service
+from services.sms_services.delivery_reports import delivery_reports
+from services.event_services.event_bus import event_bus
+from services.timetable_services.timetable_allerts import alert_service
+from pydantic_schemas.sms_schema import (
+    SMSActionResponse, SchedulerStatusResponse, DeliveryStatsResponse, MessageHistoryResponse,
+    ScheduledMessageResponse, ScheduledMessagesResponse
+)
+from api.utils.util_sms import get_delivery_stats, get_message_history, get_scheduled_messages
+from api.utils.util_students import (
+    STOP_KEYWORDS, START_KEYWORDS, get_student_by_student_id, update_student_preferences,
+    set_opted_out_by_phone, mask_to_intervals, minute_to_time
+)
+from pydantic_schemas.student_schema import StudentPreferencesUpdate, StudentPreferencesResponse
+from pydantic_schemas.timetable_schema import TodaysScheduleResponse
+from settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# shared secret the provider callback url carries as ?token=... , unset leaves the delivery report
+# callback open but turns off the inbound sms one , which changes who gets alerts
+DELIVERY_REPORT_TOKEN = get_settings().delivery_report_token
+
 router = APIRouter(
     prefix='/sms',
     tags=['SMS Alerts']
@@ -20,6 +44,11 @@ class CustomMessageRequest(BaseModel):
     message: str
     recipients: Optional[List[str]] = None  # If None, send to all students
 
+class ScheduleMessageRequest(BaseModel):
+    message: str
+    send_at: datetime  # without a timezone it is taken as the server's local time , like class times
+    recipients: Optional[List[str]] = None  # If None, send to every subscribed student at send time
+
 class TestSMSRequest(BaseModel):
     phone_number: str
     message: str
@@ -28,36 +57,40 @@ class AlertConfigRequest(BaseModel):
     alert_intervals: List[int]  # Minutes before class to send alerts
     enabled: bool = True
 
-@router.post('/send-custom-message', status_code=HTTP_201_CREATED)
+@router.post('/send-custom-message', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_201_CREATED)
 async def send_custom_message(
-    db: db_dependancy,
     user: user_depencancy,
-    message_request: CustomMessageRequest
+    message_request: CustomMessageRequest,
+    idempotency: idempotency_dependancy
 ):
     """
     Send custom message to students
     Only teachers/admins can send custom messages
+    Retries with the same Idempotency-Key header get the first response back instead of a second blast
     """
     try:
         # Format phone numbers if recipients are provided
         if message_request.recipients:
             formatted_recipients = [
-                sms_service.format_phone_number(phone) 
+                get_sms_service().format_phone_number(phone) 
                 for phone in message_request.recipients
             ]
             result = await alert_service.send_custom_message(
                 message_request.message, 
+                user['tenant_id'],
                 formatted_recipients
             )
         else:
-            result = await alert_service.send_custom_message(message_request.message)
+            result = await alert_service.send_custom_message(message_request.message, user['tenant_id'])
         
         if result['success']:
-            return {
+            response = {
                 'success': True,
                 'message': 'Custom message sent successfully',
                 'data': result['data']
             }
+            await idempotency.save(response, HTTP_201_CREATED)
+            return response
         else:
             raise HTTPException(
                 status_code=HTTP_500_INTERNAL_SERVER_ERROR,
@@ -71,26 +104,104 @@ async def send_custom_message(
             detail="Failed to send custom message"
         )
 
-@router.post('/test-sms', status_code=HTTP_201_CREATED)
-async def test_sms(
+@router.post('/scheduled-messages', response_model=ScheduledMessageResponse, status_code=HTTP_201_CREATED)
+async def schedule_custom_message(
+    db: db_dependancy,
+    user: user_depencancy,
+    schedule_request: ScheduleMessageRequest,
+    idempotency: idempotency_dependancy
+):
+    """
+    Schedule a custom message to go out later , e.g. a reminder at 18:00 on Friday
+    Supports the Idempotency-Key header
+    """
+    send_at = schedule_request.send_at
+    if send_at.tzinfo is not None:
+        send_at = send_at.astimezone().replace(tzinfo=None)
+    if send_at <= alert_service.clock.now():
+        raise HTTPException(status_code=400, detail="send_at must be in the future, use /sms/send-custom-message to send now")
+    
+    recipients = None
+    if schedule_request.recipients:
+        recipients = [get_sms_service().format_phone_number(phone) for phone in schedule_request.recipients]
+    
+    scheduled = await alert_service.schedule_custom_message(
+        db, schedule_request.message, send_at, user['tenant_id'], recipients, user['user_id']
+    )
+    response = {
+        'success': True,
+        'message': 'Custom message scheduled successfully',
+        'data': {
+            'id': scheduled.id,
+            'message': scheduled.message,
+            'recipients': scheduled.recipients,
+            'send_at': scheduled.send_at,
+            'status': scheduled.status
+        }
+    }
+    await idempotency.save(response, HTTP_201_CREATED)
+    return response
+
+@router.get('/scheduled-messages', response_model=ScheduledMessagesResponse, status_code=HTTP_200_OK)
+async def list_scheduled_messages(
+    db: db_dependancy,
+    user: user_depencancy,
+    status: Optional[str] = Query('pending', pattern='^(pending|sending|sent|failed|cancelled|expired)$'),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """
+    Scheduled messages in the order they go out , the pending ones by default
+    """
+    try:
+        rows, next_cursor = await get_scheduled_messages(db, user['tenant_id'], status, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        'success': True,
+        'data': rows,
+        'next_cursor': next_cursor
+    }
+
+@router.delete('/scheduled-messages/{message_id}', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_200_OK)
+async def cancel_scheduled_message(
+    message_id: int,
     db: db_dependancy,
+    user: user_depencancy
+):
+    """
+    Cancel a scheduled message that has not gone out yet
+    """
+    if not await alert_service.cancel_scheduled_message(db, message_id, user['tenant_id']):
+        raise HTTPException(status_code=404, detail="No pending scheduled message with that id")
+    return {
+        'success': True,
+        'message': 'Scheduled message cancelled'
+    }
+
+@router.post('/test-sms', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_201_CREATED)
+async def test_sms(
     user: user_depencancy,
-    test_request: TestSMSRequest
+    test_request: TestSMSRequest,
+    idempotency: idempotency_dependancy
 ):
     """
     Test SMS functionality by sending a message to a single number
+    Supports the Idempotency-Key header
     """
     try:
-        formatted_phone = sms_service.format_phone_number(test_request.phone_number)
+        formatted_phone = get_sms_service().format_phone_number(test_request.phone_number)
         
-        result = await sms_service.send_sms([formatted_phone], test_request.message)
+        result = await get_sms_service().send_sms([formatted_phone], test_request.message)
         
         if result['success']:
-            return {
+            response = {
                 'success': True,
                 'message': 'Test SMS sent successfully',
                 'data': result['data']
             }
+            await idempotency.save(response, HTTP_201_CREATED)
+            return response
         else:
             raise HTTPException(
                 status_code=HTTP_500_INTERNAL_SERVER_ERROR,
@@ -104,27 +215,29 @@ async def test_sms(
             detail="Failed to send test SMS"
         )
 
-@router.post('/start-scheduler', status_code=HTTP_200_OK)
+@router.post('/start-scheduler', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_200_OK)
 async def start_alert_scheduler(
-    background_tasks: BackgroundTasks,
-    db: db_dependancy,
     user: user_depencancy
 ):
     """
     Start the automatic timetable alert scheduler
     """
     try:
-        if not alert_service.running:
-            background_tasks.add_task(alert_service.start_scheduler)
+        if alert_service.start():
             return {
                 'success': True,
                 'message': 'Alert scheduler started successfully'
             }
-        else:
+        elif alert_service.running:
             return {
                 'success': True,
                 'message': 'Alert scheduler is already running'
             }
+        else:
+            return {
+                'success': False,
+                'message': 'Alert scheduler is still finishing its last run, try again shortly'
+            }
             
     except Exception as e:
         logger.error(f"Error starting scheduler: {str(e)}")
@@ -133,9 +246,8 @@ async def start_alert_scheduler(
             detail="Failed to start alert scheduler"
         )
 
-@router.post('/stop-scheduler', status_code=HTTP_200_OK)
+@router.post('/stop-scheduler', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_200_OK)
 async def stop_alert_scheduler(
-    db: db_dependancy,
     user: user_depencancy
 ):
     """
@@ -155,9 +267,8 @@ async def stop_alert_scheduler(
             detail="Failed to stop alert scheduler"
         )
 
-@router.get('/scheduler-status', status_code=HTTP_200_OK)
+@router.get('/scheduler-status', response_model=SchedulerStatusResponse, status_code=HTTP_200_OK)
 async def get_scheduler_status(
-    db: db_dependancy,
     user: user_depencancy
 ):
     """
@@ -177,23 +288,20 @@ async def get_scheduler_status(
             detail="Failed to get scheduler status"
         )
 
-@router.post('/send-immediate-alert/{class_id}', status_code=HTTP_201_CREATED)
+@router.post('/send-immediate-alert/{class_id}', response_model=SMSActionResponse, response_model_exclude_none=True, status_code=HTTP_201_CREATED)
 async def send_immediate_class_alert(
     class_id: int,
     db: db_dependancy,
-    user: user_depencancy
+    user: user_depencancy,
+    idempotency: idempotency_dependancy
 ):
     """
     Send immediate alert for a specific class
+    Supports the Idempotency-Key header
     """
     try:
         # Get the class details
-        from db.models.model_timetable import TimeTable
-        from sqlalchemy.future import select
-        
-        query = select(TimeTable).where(TimeTable.id == class_id)
-        result = await db.execute(query)
-        class_item = result.scalars().first()
+        class_item = await get_timetable_by_id(db, class_id, user['tenant_id'])
         
         if not class_item:
             raise HTTPException(
@@ -202,7 +310,9 @@ async def send_immediate_class_alert(
             )
         
         # Get student contacts
-        student_contacts = await alert_service.get_student_contacts(db)
+        student_contacts = await alert_service.get_student_contacts(db, user['tenant_id'])
+        # db work is done , hand the connection back before the slow sms call
+        await db.release()
         
         if not student_contacts:
             raise HTTPException(
@@ -211,12 +321,20 @@ async def send_immediate_class_alert(
             )
         
         # Send immediate alert
-        await alert_service.send_class_alert(class_item, student_contacts, 0)
+        result = await alert_service.send_class_alert(class_item, student_contacts, 0)
+        if not result['success']:
+            # not saved , so the idempotency key is let go and a retry sends again
+            raise HTTPException(
+                status_code=HTTP_502_BAD_GATEWAY,
+                detail="Failed to send immediate alert"
+            )
         
-        return {
+        response = {
             'success': True,
             'message': f'Immediate alert sent for {class_item.unit} class'
         }
+        await idempotency.save(response, HTTP_201_CREATED)
+        return response
             
     except HTTPException:
         raise
@@ -227,7 +345,7 @@ async def send_immediate_class_alert(
             detail="Failed to send immediate alert"
         )
 
-@router.get('/todays-schedule', status_code=HTTP_200_OK)
+@router.get('/todays-schedule', response_model=TodaysScheduleResponse, status_code=HTTP_200_OK)
 async def get_todays_schedule_with_alerts(
     db: db_dependancy,
     user: user_depencancy
@@ -238,7 +356,8 @@ async def get_todays_schedule_with_alerts(
     try:
         from datetime import datetime, timedelta
         
-        today_classes = await alert_service.get_todays_timetable(db)
+        today_classes = await alert_service.get_todays_timetable(db, user['tenant_id'])
+        await db.release()
         current_time = datetime.now()
         
         schedule_with_alerts = []
@@ -256,11 +375,11 @@ async def get_todays_schedule_with_alerts(
                     })
             
             schedule_with_alerts.append({
-                'id': class_item.id,
+                'id': class_item.timetable_id,
                 'unit': class_item.unit,
                 'start_time': class_item.start_time.strftime('%H:%M'),
                 'end_time': class_item.end_time.strftime('%H:%M'),
-                'day': class_item.day,
+                'day': class_item.date.strftime('%A').lower(),
                 'next_alerts': next_alerts
             })
         
@@ -274,4 +393,149 @@ async def get_todays_schedule_with_alerts(
         raise HTTPException(
             status_code=HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get today's schedule"
-        )
\ No newline at end of file
+        )
+
+@router.post('/delivery-reports', status_code=HTTP_200_OK)
+async def receive_delivery_report(request: Request):
+    """
+    Africa's Talking delivery report callback
+    Acknowledged straight away, the report is buffered and written in batches
+    """
+    if DELIVERY_REPORT_TOKEN and request.query_params.get('token') != DELIVERY_REPORT_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid callback token")
+    
+    form = await request.form()
+    delivery_reports.add_report(dict(form))
+    return Response(status_code=HTTP_200_OK)
+
+@router.post('/incoming-messages', status_code=HTTP_200_OK)
+async def receive_incoming_message(request: Request, db: db_dependancy):
+    """
+    Africa's Talking inbound sms callback
+    A STOP reply opts the sender out of all alerts, START opts them back in
+    Needs DELIVERY_REPORT_TOKEN , without it anyone could opt any number in or out
+    """
+    if not DELIVERY_REPORT_TOKEN:
+        logger.warning("Inbound sms callback refused , DELIVERY_REPORT_TOKEN is not set")
+        raise HTTPException(status_code=403, detail="Inbound sms callback is not configured")
+    if not hmac.compare_digest(request.query_params.get('token', ''), DELIVERY_REPORT_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid callback token")
+    
+    form = await request.form()
+    phone = form.get('from')
+    keyword = (form.get('text') or '').strip().upper()
+    if phone and (keyword in STOP_KEYWORDS or keyword in START_KEYWORDS):
+        opted_out = keyword in STOP_KEYWORDS
+        matched = await set_opted_out_by_phone(db, phone, opted_out)
+        alert_service.set_opted_out(get_sms_service().format_phone_number(phone), opted_out)
+        logger.info(f"{keyword} reply from {phone}, {matched} student(s) updated")
+    return Response(status_code=HTTP_200_OK)
+
+@router.put('/students/{student_id}/preferences', response_model=StudentPreferencesResponse, status_code=HTTP_200_OK)
+async def set_student_preferences(
+    student_id: str,
+    preferences: StudentPreferencesUpdate,
+    db: db_dependancy,
+    user: user_depencancy
+):
+    """
+    Choose which alert intervals a student gets, their quiet hours and whether they get alerts at all
+    """
+    student = await get_student_by_student_id(db, student_id, user['tenant_id'])
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    
+    student = await update_student_preferences(db, student, preferences)
+    alert_service.audience_index_for(student.tenant_id).update(
+        get_sms_service().format_phone_number(student.phone),
+        student.alert_mask,
+        student.quiet_start,
+        student.quiet_end,
+        student.opted_out
+    )
+    return {
+        'student_id': student.student_id,
+        'alert_intervals': mask_to_intervals(student.alert_mask),
+        'quiet_start': minute_to_time(student.quiet_start),
+        'quiet_end': minute_to_time(student.quiet_end),
+        'opted_out': student.opted_out
+    }
+
+@router.get('/delivery-stats', response_model=DeliveryStatsResponse, status_code=HTTP_200_OK)
+async def get_delivery_statistics(
+    db: db_dependancy,
+    user: user_depencancy,
+    class_id: Optional[int] = None,
+    since: Optional[datetime] = None
+):
+    """
+    Delivery status counts per class, optionally for one class and/or since a point in time
+    """
+    try:
+        rows = await get_delivery_stats(db, class_id, since)
+        return {
+            'success': True,
+            'data': rows
+        }
+    
+    except Exception as e:
+        logger.error(f"Error getting delivery stats: {str(e)}")
+        raise HTTPException(
+            status_code=HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get delivery stats"
+        )
+
+@router.get('/messages', response_model=MessageHistoryResponse, status_code=HTTP_200_OK)
+async def get_message_history_page(
+    db: db_dependancy,
+    user: user_depencancy,
+    class_id: Optional[int] = None,
+    recipient: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """
+    Every message sent, newest first, optionally for one class and/or one recipient
+    e.g. did a student get the 8:00 alert : ?recipient=0712345678&class_id=4&since=2025-03-03T07:00
+    """
+    if recipient is not None:
+        recipient = get_sms_service().format_phone_number(recipient)
+    try:
+        rows, next_cursor = await get_message_history(db, user['tenant_id'], class_id, recipient, since, until, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        'success': True,
+        'data': rows,
+        'next_cursor': next_cursor
+    }
+
+@router.get('/events')
+async def stream_events(request: Request, user: user_depencancy):
+    """
+    Server-sent event stream of scheduler and delivery events
+    (scheduler_started, alert_queued, alert_sent, alert_failed, delivery_failed ...)
+    Replaces polling /scheduler-status and /todays-schedule
+    """
+    subscriber = event_bus.subscribe()
+    
+    async def event_stream():
+        try:
+            # tell the client where things stand right away
+            yield f"event: scheduler_status\ndata: {json.dumps({'running': alert_service.running})}\n\n"
+            while not await request.is_disconnected():
+                event = await subscriber.next_event(timeout=15)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
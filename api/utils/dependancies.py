@@ -3,24 +3,23 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
 from typing import Annotated
-from passlib.context import CryptContext
 from jose import jwt , JWTError
-from dotenv import load_dotenv
-import os
 
 from db.db_setup import get_db
+from api.utils.passwords import bcrypt_context
+from db.models.model_tenant import DEFAULT_TENANT_ID
+from settings import get_settings
 
-load_dotenv()
-SECRET_KEY = os.getenv('AUTH_SECRET_KEY')
-ALGORITHM = os.getenv("ALGORITHM")  
-REFRESH_ALGORITHM = os.getenv("REFRESH_ALGORITHM")
+settings = get_settings()
+SECRET_KEY = settings.auth_secret_key
+ALGORITHM = settings.algorithm
+REFRESH_ALGORITHM = settings.refresh_algorithm
 ##   db_dependancy = Annotated[Session, Depends(get_db)] #This creates a reusable shortcut for injecting a database session (Session) from your custom get_db() function.
 
 # here I am going to implement a few things whose function I still dont know but lets just go with it 
 # these i think Im made to believe that they are important lines when it comes to the auth things in fastapi 
 
 db_dependancy = Annotated[ Session , Depends(get_db)] # this is just similar to doing : db : Session = Depends(get_db) what this does is that it gives a shortcut for injecting a database sessoin : i guess into our utility functions 
-bcrypt_context = CryptContext( schemes = ['bcrypt'] , deprecated = 'auto') # this is like our password fortress it allows us to hash and verify plain text agains hashed passwords 
 oauth2_bearer = OAuth2PasswordBearer( tokenUrl = "/auth/token") # tells fastapi where to extrect the token 
 oauth2_bearer_dependancy = Annotated[str , Depends(oauth2_bearer)]
 # i think that im now gettng the hang of this so here is an example flow for this : 
@@ -36,14 +35,24 @@ async def get_current_user( token : oauth2_bearer_dependancy):
         username = payload.get('sub')
         user_id = payload.get('id')
         if username is None or user_id is None:
-            print("missing username or userid")
             raise HTTPException( status_code = status.HTTP_401_UNAUTHORIZED , detail = " could not validate user")
-        return { 'username' : username , 'user_id' : user_id}
+        # every query the user makes is scoped to their school , tokens issued before tenants existed belong to the default one
+        return { 'username' : username , 'user_id' : user_id , 'tenant_id' : payload.get('tenant' , DEFAULT_TENANT_ID)}
     except :
         raise HTTPException( status_code = status.HTTP_401_UNAUTHORIZED  , detail = "could not validate user")
 
 user_depencancy = Annotated[dict , Depends(get_current_user)] # and now our auth user validation dependacy is complete
 
+# admin only endpoints ( bulk provisioning ) , admins are listed by username in ADMIN_USERNAMES
+ADMIN_USERNAMES = settings.admin_usernames
+
+async def get_admin_user(user : user_depencancy):
+    if user['username'] not in ADMIN_USERNAMES:
+        raise HTTPException( status_code = status.HTTP_403_FORBIDDEN , detail = "admin access required")
+    return user
+
+admin_dependancy = Annotated[dict , Depends(get_admin_user)]
+
 # well this new dependancy function is going to look somewhat similar to the get_current_user function but we will use it for 
 # decoding the access token and extractin the refresh token from it 
 
@@ -57,7 +66,7 @@ async def get_current_refresh_request_owner(token : refresh_bearer_dependancy):
         user_id = payload.get('id')
         if username is None or user_id is None:
             raise HTTPException( status_code = status.HTTP_401_UNAUTHORIZED , detail = "could not validate the user")
-        return {'username'  : username , 'id' : user_id }
+        return {'username'  : username , 'id' : user_id , 'tenant_id' : payload.get('tenant' , DEFAULT_TENANT_ID)}
     except:
         raise HTTPException( status_code = status.HTTP_401_UNAUTHORIZED , detail = "could not validate the user")
 
@@ -0,0 +1,225 @@
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Annotated, Dict, Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.dialects.postgresql import insert
+
+from api.utils.dependancies import user_depencancy
+from db.db_setup import AsyncSessionLocal
+from db.models.model_idempotency import IdempotencyRecord
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+IDEMPOTENCY_TTL = settings.idempotency_ttl # how long a finished response is replayed
+IDEMPOTENCY_LOCK_TTL = settings.idempotency_lock_ttl # how long an in progress key is held if its request dies
+IDEMPOTENCY_WAIT_TIMEOUT = settings.idempotency_wait_timeout # how long a duplicate waits for the first request
+
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+
+# ---- stores -------------------------------------------------------------
+
+class RedisIdempotencyStore:
+    def __init__(self, redis_url : str):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.from_url(redis_url)
+
+    def _name(self, key : str) -> str:
+        return f"idempotency:{key}"
+
+    async def reserve(self, key : str, fingerprint : str) -> Optional[dict]:
+        # SET NX : only one request gets the key , the others get the existing record back
+        record = {'fingerprint' : fingerprint , 'status' : IN_PROGRESS}
+        if await self.redis.set(self._name(key), json.dumps(record), nx = True, ex = IDEMPOTENCY_LOCK_TTL):
+            return None
+        return await self.get(key)
+
+    async def get(self, key : str) -> Optional[dict]:
+        value = await self.redis.get(self._name(key))
+        return json.loads(value) if value else None
+
+    async def complete(self, key : str, fingerprint : str, status_code : int, body) -> None:
+        record = {'fingerprint' : fingerprint , 'status' : DONE , 'response_status' : status_code , 'response_body' : body}
+        await self.redis.set(self._name(key), json.dumps(record), ex = IDEMPOTENCY_TTL)
+
+    async def release(self, key : str) -> None:
+        await self.redis.delete(self._name(key))
+
+
+class PostgresIdempotencyStore:
+    async def reserve(self, key : str, fingerprint : str) -> Optional[dict]:
+        now = datetime.utcnow()
+        values = {
+            'key' : key ,
+            'fingerprint' : fingerprint ,
+            'status' : IN_PROGRESS ,
+            'response_status' : None ,
+            'response_body' : None ,
+            'expires_at' : now + timedelta(seconds = IDEMPOTENCY_LOCK_TTL)
+        }
+        stmt = insert(IdempotencyRecord).values(**values)
+        # take the key if it is new or its previous record has expired , in one statement
+        stmt = stmt.on_conflict_do_update(
+            index_elements = [IdempotencyRecord.key],
+            set_ = {k : v for k , v in values.items() if k != 'key'},
+            where = IdempotencyRecord.expires_at < now
+        ).returning(IdempotencyRecord.key)
+        async with AsyncSessionLocal() as db:
+            reserved = (await db.execute(stmt)).first()
+            await db.commit()
+        if reserved:
+            return None
+        return await self.get(key)
+
+    async def get(self, key : str) -> Optional[dict]:
+        async with AsyncSessionLocal() as db:
+            record = await db.get(IdempotencyRecord, key)
+            if record is None or record.expires_at < datetime.utcnow():
+                return None
+            return {
+                'fingerprint' : record.fingerprint ,
+                'status' : record.status ,
+                'response_status' : record.response_status ,
+                'response_body' : record.response_body
+            }
+
+    async def complete(self, key : str, fingerprint : str, status_code : int, body) -> None:
+        async with AsyncSessionLocal() as db:
+            record = await db.get(IdempotencyRecord, key)
+            if record is None:
+                return
+            record.status = DONE
+            record.response_status = status_code
+            record.response_body = body
+            record.expires_at = datetime.utcnow() + timedelta(seconds = IDEMPOTENCY_TTL)
+            await db.commit()
+
+    async def release(self, key : str) -> None:
+        async with AsyncSessionLocal() as db:
+            record = await db.get(IdempotencyRecord, key)
+            if record is not None and record.status == IN_PROGRESS:
+                await db.delete(record)
+                await db.commit()
+
+
+_store = None
+
+def get_idempotency_store():
+    # redis when it is configured , postgres otherwise
+    global _store
+    if _store is None:
+        redis_url = settings.redis_url
+        _store = RedisIdempotencyStore(redis_url) if redis_url else PostgresIdempotencyStore()
+    return _store
+
+# ---- request handling -----------------------------------------------------
+
+class IdempotentReplay(Exception):
+    """
+    Raised by the dependency to answer a retried request with the stored response
+    """
+    def __init__(self, status_code : int, body):
+        self.status_code = status_code
+        self.body = body
+
+async def idempotent_replay_handler(request : Request, exc : IdempotentReplay):
+    return JSONResponse(exc.body, status_code = exc.status_code, headers = {'Idempotent-Replayed' : 'true'})
+
+# duplicates arriving at this same process wait on the first request's future instead of polling the store
+_local_in_flight : Dict[str, asyncio.Future] = {}
+
+class Idempotency:
+    def __init__(self, store, key : Optional[str], fingerprint : Optional[str]):
+        self.store = store
+        self.key = key
+        self.fingerprint = fingerprint
+        self.saved = False
+
+    async def save(self, body, status_code : int) -> None:
+        """
+        Store the successful response so retries with the same key get it back without resending
+        """
+        if self.key is None:
+            return
+        await self.store.complete(self.key, self.fingerprint, status_code, jsonable_encoder(body))
+        self.saved = True
+
+async def _wait_for_first(store, key : str) -> Optional[dict]:
+    local = _local_in_flight.get(key)
+    if local is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(local), IDEMPOTENCY_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        return await store.get(key)
+    # the first request is on another replica , poll until it finishes
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_TIMEOUT
+    while loop.time() < deadline:
+        await asyncio.sleep(0.2)
+        record = await store.get(key)
+        if record is None or record['status'] == DONE:
+            return record
+    return None
+
+async def get_idempotency(request : Request, user : user_depencancy):
+    """
+    Handles the Idempotency-Key header for endpoints that send sms
+
+    new key         -> the endpoint runs and must call idempotency.save(response, status_code)
+    finished key    -> the stored response is replayed , nothing is sent again
+    key in progress -> waits for the first request and replays its response
+    same key but a different request body -> 422
+    Requests without the header behave as before.
+    """
+    header = request.headers.get('Idempotency-Key')
+    if not header:
+        yield Idempotency(None, None, None)
+        return
+
+    store = get_idempotency_store()
+    key = f"{user['user_id']}:{header}"
+    body = await request.body()
+    fingerprint = hashlib.sha256(request.method.encode() + request.url.path.encode() + body).hexdigest()
+
+    for _ in range(2):
+        existing = await store.reserve(key, fingerprint)
+        if existing is None:
+            break
+        if existing['fingerprint'] != fingerprint:
+            raise HTTPException(status_code = status.HTTP_422_UNPROCESSABLE_ENTITY , detail = "Idempotency-Key was already used for a different request")
+        if existing['status'] == IN_PROGRESS:
+            existing = await _wait_for_first(store, key)
+            if existing is None:
+                # the first request failed and let go of the key , try to take it ourselves
+                continue
+            if existing['status'] != DONE:
+                raise HTTPException(status_code = status.HTTP_409_CONFLICT , detail = "a request with this Idempotency-Key is still in progress")
+        raise IdempotentReplay(existing['response_status'], existing['response_body'])
+    else:
+        raise HTTPException(status_code = status.HTTP_409_CONFLICT , detail = "a request with this Idempotency-Key is still in progress")
+
+    future = asyncio.get_running_loop().create_future()
+    _local_in_flight[key] = future
+    idempotency = Idempotency(store, key, fingerprint)
+    try:
+        yield idempotency
+    finally:
+        if not idempotency.saved:
+            # failed requests are not cached , a retry runs them again
+            try:
+                await store.release(key)
+            except Exception as e:
+                logger.error(f"Failed to release idempotency key: {str(e)}")
+        _local_in_flight.pop(key, None)
+        future.set_result(None)
+
+idempotency_dependancy = Annotated[Idempotency, Depends(get_idempotency)]
@@ -0,0 +1,56 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from passlib.context import CryptContext
+
+from settings import get_settings
+
+# the hashing workers are spawned , not forked , and import this module fresh , keep its imports light
+bcrypt_context = CryptContext( schemes = ['bcrypt'] , deprecated = 'auto') # this is like our password fortress it allows us to hash and verify plain text agains hashed passwords 
+
+PASSWORD_HASH_WORKERS = get_settings().password_hash_workers
+PASSWORD_HASH_CHUNK = get_settings().password_hash_chunk # passwords per task sent to a worker
+
+_pool : Optional[ProcessPoolExecutor] = None
+
+def _hash_chunk(passwords : List[str]) -> List[str]:
+    return [bcrypt_context.hash(password) for password in passwords]
+
+def start_hash_pool() -> ProcessPoolExecutor:
+    """
+    Create the worker pool , called at startup
+
+    spawn rather than linux's default fork : by now the log listener and trace exporter threads run ,
+    and a forked child would inherit any lock one of them held at that moment , locked forever
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers = PASSWORD_HASH_WORKERS , mp_context = multiprocessing.get_context('spawn'))
+    return _pool
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    # scripts that never ran the app's startup get one on first use
+    return _pool or start_hash_pool()
+
+async def hash_passwords(passwords : List[str]) -> List[str]:
+    """
+    bcrypt is cpu bound on purpose , so hashing runs in a process pool instead of on the event loop ,
+    spread over every core for bulk provisioning
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    chunks = [passwords[i:i + PASSWORD_HASH_CHUNK] for i in range(0 , len(passwords) , PASSWORD_HASH_CHUNK)]
+    hashed = await asyncio.gather(*(loop.run_in_executor(get_hash_pool() , _hash_chunk , chunk) for chunk in chunks))
+    return [value for chunk in hashed for value in chunk]
+
+async def hash_password(password : str) -> str:
+    return (await hash_passwords([password]))[0]
+
+def shutdown_hash_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures = True)
+        _pool = None
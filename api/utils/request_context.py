@@ -0,0 +1,83 @@
+# api/utils/request_context.py
+import uuid
+
+from services.logging_services.structured_logging import log_context
+from services.tracing_services.tracing import tracer, parse_traceparent
+
+REQUEST_ID_HEADER = b'x-request-id'
+TRACEPARENT_HEADER = b'traceparent'
+TRACE_ID_HEADER = b'x-trace-id'
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request a correlation id , the caller's X-Request-ID when it sends one ( up to 64
+    characters ) , otherwise a new one. Every record logged while the request is handled carries it
+    as request_id , and it is sent back in the X-Request-ID response header.
+
+    Plain asgi middleware rather than BaseHTTPMiddleware so it adds no task or body buffering per request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope['headers']:
+            if name == REQUEST_ID_HEADER and 0 < len(value) <= 64:
+                request_id = value.decode('latin-1')
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', []), (REQUEST_ID_HEADER, request_id.encode('latin-1'))]
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_request_id)
+
+
+class TracingMiddleware:
+    """
+    Root span of every request , named after the matched route ( "GET /sms/messages" ) once routing is done
+
+    A caller that sends a w3c traceparent header gets its trace continued , and the trace id is sent
+    back in X-Trace-ID so a slow response can be looked up in the trace file
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope['headers']:
+            if name == TRACEPARENT_HEADER:
+                traceparent = value.decode('latin-1')
+                break
+
+        with tracer.span(f"{scope['method']} {scope['path']}", remote_parent=parse_traceparent(traceparent),
+                         **{'http.method': scope['method'], 'http.path': scope['path']}) as span:
+
+            async def send_with_trace_id(message):
+                if message['type'] == 'http.response.start':
+                    span.set(**{'http.status': message['status']})
+                    if message['status'] >= 500:
+                        span.error = f"HTTP {message['status']}"
+                    message['headers'] = [*message.get('headers', []), (TRACE_ID_HEADER, span.trace_id.encode('latin-1'))]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = scope.get('route')
+                if route is not None and getattr(route, 'path', None):
+                    span.name = f"{scope['method']} {route.path}"
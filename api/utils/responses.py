@@ -0,0 +1,22 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError: # orjson is optional , we just fall back to the standard json encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class for the app
+
+    Response models are already turned into plain json types by pydantic before they get here
+    so all that is left is a single orjson dumps of the payload
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
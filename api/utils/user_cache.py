@@ -0,0 +1,301 @@
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.future import select
+from sqlalchemy.util import await_only
+
+from db.db_setup import AsyncSessionLocal
+from db.models.users import User , Account , NativeChessProfile
+from settings import get_settings
+
+try:
+    import orjson
+except ImportError: # orjson is optional , we just fall back to the standard json encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+USER_CACHE_TTL = settings.user_cache_ttl
+USER_CACHE_LOCK_TTL = settings.user_cache_lock_ttl # how long one replica holds the right to rebuild a missing entry
+USER_CACHE_LOCAL_SIZE = settings.user_cache_local_size # entries kept in process when redis is not configured
+
+# payloads are stored as a bare json array in this order instead of an object , about half the bytes
+PROFILE_FIELDS = (
+    'id' , 'username' , 'email' , 'phone' , 'created_at' , 'updated_at' ,
+    'account_id' , 'account_balance' , 'account_currency' , 'native_chess_profile_id'
+)
+
+cache_metrics = {
+    'hits' : 0 ,
+    'misses' : 0 ,
+    'loads' : 0 , # misses that went to postgres , the rest were served by another request's load
+    'invalidations' : 0 ,
+    'stale_loads' : 0 , # loads not cached because the user changed while they ran
+}
+
+# only write a loaded entry if the user's generation is still the one read before the load
+_WRITE_IF_CURRENT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+def _dumps(value) -> bytes:
+    if orjson is None:
+        return json.dumps(value, default = str).encode()
+    return orjson.dumps(value)
+
+def _loads(value):
+    return orjson.loads(value) if orjson is not None else json.loads(value)
+
+def encode_profile(user : User , account : Optional[Account] = None , profile : Optional[NativeChessProfile] = None) -> bytes:
+    account = account or user.account
+    profile = profile or user.native_chess_profile
+    return _dumps([
+        user.id , user.username , user.email , user.phone ,
+        user.created_at.isoformat() if user.created_at else None ,
+        user.updated_at.isoformat() if user.updated_at else None ,
+        account.id if account else None ,
+        account.balance if account else None ,
+        account.currency if account else None ,
+        profile.id if profile else None ,
+    ])
+
+def decode_profile(payload : bytes) -> dict:
+    profile = dict(zip(PROFILE_FIELDS , _loads(payload)))
+    for field in ('created_at' , 'updated_at'):
+        if profile[field]:
+            profile[field] = datetime.fromisoformat(profile[field])
+    return profile
+
+
+class UserCache:
+    """
+    Read-through / write-through cache of a user with their account and native chess profile
+
+    Lives in redis when REDIS_URL is set so every replica shares it , otherwise in a bounded
+    in-process LRU. A miss is loaded from postgres by one request only : concurrent misses in
+    this process wait on the same load , and across replicas a short SET NX lock lets one
+    replica rebuild the entry while the others wait briefly for it. TTLs are jittered so
+    entries written together do not all expire together.
+
+    Every invalidation bumps the user's generation , and a load only writes its entry when the
+    generation is unchanged since it started , so a load that read the row before a commit
+    cannot put the old profile back after that commit dropped it.
+    """
+
+    def __init__(self):
+        self.redis_url = settings.redis_url
+        self._redis = None
+        self.local : OrderedDict = OrderedDict() # user id -> (expires at , payload)
+        self.generations : Dict[int, int] = {} # user id -> invalidations so far , when redis is not configured
+        self._loading : Dict[int, asyncio.Future] = {}
+
+    @property
+    def redis(self):
+        # the client ( and the redis package ) is only loaded on first use , not when the app is imported
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+
+    def _name(self, user_id : int) -> str:
+        return f"user_profile:{user_id}"
+
+    def _generation_name(self, user_id : int) -> str:
+        return f"user_profile:{user_id}:gen"
+
+    def _ttl(self) -> int:
+        return int(USER_CACHE_TTL * random.uniform(0.9, 1.1))
+
+    async def _read(self, user_id : int) -> Optional[bytes]:
+        if self.redis is None:
+            entry = self.local.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.local[user_id]
+                return None
+            self.local.move_to_end(user_id)
+            return entry[1]
+        try:
+            return await self.redis.get(self._name(user_id))
+        except Exception as e:
+            logger.warning(f"user cache read failed : {str(e)}")
+            return None
+
+    async def _write(self, user_id : int, payload : bytes) -> None:
+        if self.redis is None:
+            self.local[user_id] = (time.monotonic() + self._ttl(), payload)
+            self.local.move_to_end(user_id)
+            while len(self.local) > USER_CACHE_LOCAL_SIZE:
+                self.local.popitem(last = False)
+            return
+        try:
+            await self.redis.set(self._name(user_id), payload, ex = self._ttl())
+        except Exception as e:
+            logger.warning(f"user cache write failed : {str(e)}")
+
+    async def _generation(self, user_id : int) -> str:
+        if self.redis is None:
+            return str(self.generations.get(user_id, 0))
+        try:
+            value = await self.redis.get(self._generation_name(user_id))
+        except Exception as e:
+            logger.warning(f"user cache read failed : {str(e)}")
+            return ''  # never matches , the load is served but not cached
+        return value.decode() if value else '0'
+
+    async def _write_if_current(self, user_id : int, payload : bytes, generation : str) -> bool:
+        if self.redis is None:
+            if str(self.generations.get(user_id, 0)) != generation:
+                return False
+            await self._write(user_id, payload)
+            return True
+        try:
+            return bool(await self.redis.eval(
+                _WRITE_IF_CURRENT , 2 , self._name(user_id) , self._generation_name(user_id) ,
+                payload , generation , self._ttl()
+            ))
+        except Exception as e:
+            logger.warning(f"user cache write failed : {str(e)}")
+            return False
+
+    async def _load(self, user_id : int) -> Optional[bytes]:
+        locked = False
+        if self.redis is not None:
+            try:
+                locked = await self.redis.set(self._name(user_id) + ':lock', 1, nx = True, ex = USER_CACHE_LOCK_TTL)
+            except Exception:
+                locked = True # redis trouble , just load it ourselves
+            if not locked:
+                # another replica is loading this user , give it a moment before going to postgres too
+                for _ in range(10):
+                    await asyncio.sleep(0.05)
+                    payload = await self._read(user_id)
+                    if payload is not None:
+                        return payload
+
+        cache_metrics['loads'] += 1
+        generation = await self._generation(user_id)
+        query = select(User).options(
+            selectinload(User.account) , selectinload(User.native_chess_profile)
+        ).where(User.id == user_id)
+        # a session of its own , the load is shared by every request waiting on this user
+        # and must not depend on the first one's session staying open
+        async with AsyncSessionLocal() as db:
+            user = (await db.execute(query)).scalars().first()
+            if user is None:
+                return None
+            payload = encode_profile(user)
+        if not await self._write_if_current(user_id, payload, generation):
+            cache_metrics['stale_loads'] += 1
+        if locked and self.redis is not None:
+            try:
+                await self.redis.delete(self._name(user_id) + ':lock')
+            except Exception:
+                pass
+        return payload
+
+    async def get_profile(self, user_id : int) -> Optional[dict]:
+        """
+        The user's cached profile , loaded from postgres on a miss , None if the user does not exist
+        """
+        payload = await self._read(user_id)
+        if payload is not None:
+            cache_metrics['hits'] += 1
+            return decode_profile(payload)
+        cache_metrics['misses'] += 1
+
+        future = self._loading.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = future
+            future.add_done_callback(lambda _ : self._loading.pop(user_id, None))
+        payload = await asyncio.shield(future)
+        return decode_profile(payload) if payload is not None else None
+
+    async def set_profile(self, user : User, account : Optional[Account] = None, profile : Optional[NativeChessProfile] = None) -> None:
+        """
+        Write-through after a change , pass the account and profile unless they are loaded on the user
+        """
+        await self._write(user.id, encode_profile(user, account, profile))
+
+    async def invalidate(self, user_ids : Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        cache_metrics['invalidations'] += len(user_ids)
+        if self.redis is None:
+            for user_id in user_ids:
+                self.generations[user_id] = self.generations.get(user_id, 0) + 1
+                self.local.pop(user_id, None)
+            return
+        try:
+            async with self.redis.pipeline(transaction = True) as pipe:
+                for user_id in user_ids:
+                    # outlives any load that could have read the generation before this bump
+                    pipe.incr(self._generation_name(user_id))
+                    pipe.expire(self._generation_name(user_id), USER_CACHE_TTL * 2)
+                pipe.delete(*[self._name(user_id) for user_id in user_ids])
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"user cache invalidation failed : {str(e)}")
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+
+user_cache = UserCache()
+
+# ---- invalidation on writes -----------------------------------------------------
+# any committed insert , update or delete of a user , account or native chess profile drops the cached entry ,
+# whichever code path made the change. The drop is awaited inside commit() , so once commit returns no
+# request can read the old profile from the cache
+
+_CACHED_MODELS = (User , Account , NativeChessProfile)
+
+def _owner_id(instance) -> Optional[int]:
+    return instance.id if isinstance(instance, User) else instance.user_id
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    # users created in this transaction cannot be cached yet , leaving them out lets create_user write through
+    created = session.info.setdefault('created_user_ids', set())
+    created.update(instance.id for instance in session.new if isinstance(instance, User))
+    for instance in (*session.new , *session.dirty , *session.deleted):
+        if isinstance(instance, _CACHED_MODELS):
+            owner = _owner_id(instance)
+            if owner is not None and owner not in created:
+                changed.add(owner)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    session.info.pop('created_user_ids', None)
+    changed = session.info.pop('changed_user_ids', None)
+    if not changed:
+        return
+    invalidation = user_cache.invalidate(changed)
+    try:
+        # AsyncSession runs commit in a greenlet , so the listener can wait for the cache here
+        await_only(invalidation)
+    except MissingGreenlet:
+        invalidation.close() # a sync session outside the app ( alembic , scripts ) , entries expire on their own
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('created_user_ids', None)
+    session.info.pop('changed_user_ids', None)
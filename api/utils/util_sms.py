@@ -0,0 +1,114 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func , tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models.model_sms import SMSMessage
+from db.models.model_message_log import MessageLog
+from db.models.model_scheduled_message import ScheduledMessage
+
+
+async def get_delivery_stats(db : AsyncSession , class_id : Optional[int] = None , since : Optional[datetime] = None):
+    # one grouped query served by the (class_id , status) index instead of pulling rows back
+    query = select(
+        SMSMessage.class_id ,
+        SMSMessage.status ,
+        func.count().label('count')
+    ).group_by(SMSMessage.class_id , SMSMessage.status).order_by(SMSMessage.class_id , SMSMessage.status)
+    if class_id is not None:
+        query = query.where(SMSMessage.class_id == class_id)
+    if since is not None:
+        query = query.where(SMSMessage.created_at >= since)
+    result = await db.execute(query)
+    return [dict(row._mapping) for row in result]
+
+
+# keyset cursor : the (sent_at , id) of the last row of the previous page
+def encode_cursor(sent_at : datetime , row_id : int) -> str:
+    return base64.urlsafe_b64encode(f"{sent_at.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor : str):
+    """
+    raises ValueError for a cursor we did not hand out
+    """
+    sent_at , row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(sent_at) , int(row_id)
+
+async def get_message_history(
+    db : AsyncSession ,
+    tenant_id : int ,
+    class_id : Optional[int] = None ,
+    recipient : Optional[str] = None ,
+    since : Optional[datetime] = None ,
+    until : Optional[datetime] = None ,
+    limit : int = 100 ,
+    cursor : Optional[str] = None
+):
+    """
+    one tenant's messages newest first , one page at a time . Pages continue from the cursor with a (sent_at , id) < cursor
+    condition on the (tenant_id , class_id | recipient , sent_at , id) indexes , so page 1000 costs the same as page 1
+    and months outside since / until are pruned from the scan
+    """
+    query = select(
+        MessageLog.id ,
+        MessageLog.sent_at ,
+        MessageLog.recipient ,
+        MessageLog.class_id ,
+        MessageLog.kind ,
+        MessageLog.minutes_before ,
+        MessageLog.status
+    ).where(MessageLog.tenant_id == tenant_id)
+    if class_id is not None:
+        query = query.where(MessageLog.class_id == class_id)
+    if recipient is not None:
+        query = query.where(MessageLog.recipient == recipient)
+    if since is not None:
+        query = query.where(MessageLog.sent_at >= since)
+    if until is not None:
+        query = query.where(MessageLog.sent_at < until)
+    if cursor is not None:
+        query = query.where(tuple_(MessageLog.sent_at , MessageLog.id) < decode_cursor(cursor))
+    query = query.order_by(MessageLog.sent_at.desc() , MessageLog.id.desc()).limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in await db.execute(query)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['sent_at'] , rows[-1]['id'])
+    return rows , next_cursor
+
+
+async def get_scheduled_messages(
+    db : AsyncSession ,
+    tenant_id : int ,
+    status : Optional[str] = 'pending' ,
+    limit : int = 100 ,
+    cursor : Optional[str] = None
+):
+    """
+    one tenant's scheduled messages in send order , one page at a time , keyset paginated on (send_at , id) like the message history
+    """
+    query = select(
+        ScheduledMessage.id ,
+        ScheduledMessage.message ,
+        ScheduledMessage.recipients ,
+        ScheduledMessage.send_at ,
+        ScheduledMessage.status ,
+        ScheduledMessage.sent_at ,
+        ScheduledMessage.error
+    ).where(ScheduledMessage.tenant_id == tenant_id)
+    if status is not None:
+        query = query.where(ScheduledMessage.status == status)
+    if cursor is not None:
+        query = query.where(tuple_(ScheduledMessage.send_at , ScheduledMessage.id) > decode_cursor(cursor))
+    query = query.order_by(ScheduledMessage.send_at , ScheduledMessage.id).limit(limit + 1)
+
+    rows = [dict(row._mapping) for row in await db.execute(query)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['send_at'] , rows[-1]['id'])
+    return rows , next_cursor
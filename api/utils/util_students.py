@@ -0,0 +1,65 @@
+from datetime import time
+from typing import List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models.model_student import Student, ALERT_INTERVALS, INTERVAL_BITS
+from pydantic_schemas.student_schema import StudentPreferencesUpdate
+
+# keywords of an inbound sms that opt a student out of / back in to alerts
+STOP_KEYWORDS = {'STOP', 'STOPALL', 'UNSUBSCRIBE', 'CANCEL', 'END', 'QUIT'}
+START_KEYWORDS = {'START', 'UNSTOP', 'SUBSCRIBE'}
+
+
+def intervals_to_mask(intervals : List[int]) -> int:
+    mask = 0
+    for minutes in intervals:
+        mask |= INTERVAL_BITS[minutes]
+    return mask
+
+def mask_to_intervals(mask : int) -> List[int]:
+    return [minutes for minutes in ALERT_INTERVALS if mask & INTERVAL_BITS[minutes]]
+
+def time_to_minute(value : Optional[time]) -> Optional[int]:
+    return None if value is None else value.hour * 60 + value.minute
+
+def minute_to_time(value : Optional[int]) -> Optional[time]:
+    return None if value is None else time(value // 60 , value % 60)
+
+def phone_variants(phone : str) -> List[str]:
+    # students.phone is stored as typed in , so match the usual kenyan spellings of the number
+    digits = ''.join(filter(str.isdigit , phone))
+    local = digits[3:] if digits.startswith('254') else digits.lstrip('0')
+    return [f"+254{local}" , f"254{local}" , f"0{local}" , local]
+
+
+async def get_student_by_student_id(db : AsyncSession , student_id : str , tenant_id : int) -> Optional[Student]:
+    # registration numbers are only unique within a school
+    result = await db.execute(select(Student).where(Student.tenant_id == tenant_id , Student.student_id == student_id))
+    return result.scalars().first()
+
+async def update_student_preferences(db : AsyncSession , student : Student , preferences : StudentPreferencesUpdate) -> Student:
+    fields = preferences.model_fields_set
+    if preferences.alert_intervals is not None:
+        student.alert_mask = intervals_to_mask(preferences.alert_intervals)
+    if 'quiet_start' in fields:
+        student.quiet_start = time_to_minute(preferences.quiet_start)
+    if 'quiet_end' in fields:
+        student.quiet_end = time_to_minute(preferences.quiet_end)
+    if preferences.opted_out is not None:
+        student.opted_out = preferences.opted_out
+    await db.commit()
+    return student
+
+async def set_opted_out_by_phone(db : AsyncSession , phone : str , opted_out : bool) -> int:
+    """
+    Opt every student with this phone number out of ( or back in to ) alerts , returns how many matched
+    The reply does not say which school it is for so it applies to all of them
+    """
+    result = await db.execute(
+        update(Student).where(Student.phone.in_(phone_variants(phone))).values(opted_out = opted_out)
+    )
+    await db.commit()
+    return result.rowcount
@@ -1,19 +1,164 @@
-from locale import currency
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from db.models.model_timetable import TimeTable
+from sqlalchemy import lambda_stmt , tuple_
+from typing import List , Optional
+import base64
+import json
+from datetime import time
+from db.models.model_timetable import TimeTable , WEEKDAYS
+from db.models.model_occurrence import TimetableException , ClassOccurrence
+from db.models.model_tenant import Tenant
+from db.models.model_timetable_version import TimetableVersion , ACTIVE_VERSION , version_clause
 
 
-async def add_new_timetalbe(db : AsyncSession , timetable_data):
+async def add_new_timetalbe(db : AsyncSession , timetable_data , tenant_id : int , version_id : Optional[int] = None):
     db_timetable = TimeTable(
-        startime = timetable_data.get('start_time'),
+        tenant_id = tenant_id,
+        version_id = version_id,
+        start_time = timetable_data.get('start_time'),
         end_time = timetable_data.get('end_time'),
         unit = timetable_data.get('unit'),
+        day = timetable_data.get('day'),
+        room = timetable_data.get('room'),
+        lecturer = timetable_data.get('lecturer'),
+        group_name = timetable_data.get('group_name'),
     )
 
     db.add(db_timetable)
-    db.refresh()
-    db.flush(db_timetable)
-    return db_timetable
\ No newline at end of file
+    await db.flush() # gives us the id before the endpoint commits
+    return db_timetable
+
+async def get_timetable_by_id(db : AsyncSession , timetable_id : int , tenant_id : int):
+    # lambda statement so the lookup is compiled once and reused as a prepared statement
+    # another school's slot is simply not found
+    query = lambda_stmt(lambda: select(TimeTable).where(TimeTable.id == timetable_id , TimeTable.tenant_id == tenant_id))
+    result = await db.execute(query)
+    return result.scalars().first()
+
+
+async def add_timetable_exception(db : AsyncSession , exception_data , tenant_id : int):
+    db_exception = TimetableException(**exception_data , tenant_id = tenant_id)
+    db.add(db_exception)
+    await db.flush()
+    return db_exception
+
+
+# ---- timetable versions -----------------------------------------------------------
+
+async def get_active_version_id(db : AsyncSession , tenant_id : int) -> Optional[int]:
+    # None while the school still uses its unversioned timetable
+    result = await db.execute(select(Tenant.active_timetable_version_id).where(Tenant.id == tenant_id))
+    return result.scalar()
+
+async def get_timetable_version(db : AsyncSession , version_id : int , tenant_id : int):
+    # another school's version is simply not found
+    result = await db.execute(select(TimetableVersion).where(TimetableVersion.id == version_id , TimetableVersion.tenant_id == tenant_id))
+    return result.scalars().first()
+
+async def get_timetable_versions(db : AsyncSession , tenant_id : int):
+    result = await db.execute(select(TimetableVersion).where(TimetableVersion.tenant_id == tenant_id).order_by(TimetableVersion.id.desc()))
+    return result.scalars().all()
+
+
+# ---- read api -----------------------------------------------------------------
+
+TIMETABLE_FIELDS = ('id' , 'unit' , 'day' , 'start_time' , 'end_time' , 'room' , 'lecturer' , 'group_name')
+# every page is read in this order , matching the ix_time_table_week / ix_time_table_unit_week indexes
+KEYSET = ('day_index' , 'start_time' , 'id')
+
+def parse_fields(fields : Optional[str]) -> List[str]:
+    """
+    ?fields=unit,start_time -> the columns to return , all of them when not given
+    raises ValueError for an unknown field
+    """
+    if not fields:
+        return list(TIMETABLE_FIELDS)
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = set(requested) - set(TIMETABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields {sorted(unknown)} , choose from {list(TIMETABLE_FIELDS)}")
+    return requested
+
+def parse_days(days : Optional[List[str]]) -> Optional[List[int]]:
+    if not days:
+        return None
+    indexes = []
+    for day in days:
+        index = WEEKDAYS.get(day.strip().lower())
+        if index is None:
+            raise ValueError(f"unknown day {day}")
+        indexes.append(index)
+    return indexes
+
+def encode_timetable_cursor(row : dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row['day_index'] , row['start_time'].isoformat() , row['id']]).encode()).decode()
+
+def decode_timetable_cursor(cursor : str):
+    day_index , start_time , row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return int(day_index) , time.fromisoformat(start_time) , int(row_id)
+
+def timetable_query(
+    tenant_id : int ,
+    fields : List[str] ,
+    days : Optional[List[str]] = None ,
+    units : Optional[List[str]] = None ,
+    from_time : Optional[time] = None ,
+    to_time : Optional[time] = None ,
+    room : Optional[str] = None ,
+    lecturer : Optional[str] = None ,
+    group_name : Optional[str] = None ,
+    version_id = ACTIVE_VERSION
+):
+    """
+    Only the requested columns ( plus the keyset ones ) of one tenant's slots are selected , in week order .
+    Slots whose day name is not a weekday have no day_index and are left out , like the occurrence engine does .
+    The live timetable unless a version ( a draft to review ) is named
+    """
+    columns = [getattr(TimeTable , name) for name in dict.fromkeys([*fields , *KEYSET])]
+    query = select(*columns).where(
+        TimeTable.tenant_id == tenant_id , version_clause(TimeTable , version_id) , TimeTable.day_index.is_not(None)
+    )
+    day_indexes = parse_days(days)
+    if day_indexes is not None:
+        query = query.where(TimeTable.day_index.in_(day_indexes))
+    if units:
+        query = query.where(TimeTable.unit.in_(units))
+    if from_time is not None:
+        query = query.where(TimeTable.start_time >= from_time)
+    if to_time is not None:
+        query = query.where(TimeTable.start_time < to_time)
+    if room is not None:
+        query = query.where(TimeTable.room == room)
+    if lecturer is not None:
+        query = query.where(TimeTable.lecturer == lecturer)
+    if group_name is not None:
+        query = query.where(TimeTable.group_name == group_name)
+    return query.order_by(TimeTable.day_index , TimeTable.start_time , TimeTable.id)
+
+async def get_timetable_page(db : AsyncSession , tenant_id : int , fields : List[str] , limit : int , cursor : Optional[str] = None , **filters):
+    query = timetable_query(tenant_id , fields , **filters)
+    if cursor is not None:
+        query = query.where(tuple_(TimeTable.day_index , TimeTable.start_time , TimeTable.id) > decode_timetable_cursor(cursor))
+    rows = [dict(row._mapping) for row in await db.execute(query.limit(limit + 1))]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_timetable_cursor(rows[-1])
+    return [{field : row[field] for field in fields} for row in rows] , next_cursor
+
+def occurrences_query(tenant_id : int , start_date , end_date , units : Optional[List[str]] = None , include_cancelled : bool = True):
+    # dated classes of one tenant's live timetable over a term , served by the (tenant_id , date , start_time) index
+    query = select(
+        ClassOccurrence.id , ClassOccurrence.timetable_id , ClassOccurrence.date , ClassOccurrence.original_date ,
+        ClassOccurrence.start_time , ClassOccurrence.end_time , ClassOccurrence.unit , ClassOccurrence.status
+    ).where(
+        ClassOccurrence.tenant_id == tenant_id , ClassOccurrence.date >= start_date , ClassOccurrence.date <= end_date ,
+        version_clause(ClassOccurrence)
+    )
+    if units:
+        query = query.where(ClassOccurrence.unit.in_(units))
+    if not include_cancelled:
+        query = query.where(ClassOccurrence.status != 'cancelled')
+    return query.order_by(ClassOccurrence.date , ClassOccurrence.start_time , ClassOccurrence.id)
@@ -1,12 +1,21 @@
 # we wanna create our first utility function for creating  a user here now 
-from locale import currency
+import logging
+
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
+from sqlalchemy import lambda_stmt , or_
+from sqlalchemy.dialects.postgresql import insert
+from typing import List
 
 from pydantic_schemas.users_schema import UserCreateRequest
-from api.utils.dependancies import bcrypt_context
+from api.utils.passwords import hash_password , hash_passwords
+from db.models.users import User , Account , NativeChessProfile
+from api.utils.user_cache import user_cache
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
 
 # async def create_user_using_foreign_usernmae(db : AsyncSession , user " UserCreateRequest):
      # lets leave this blank for now 
@@ -17,14 +26,14 @@ async def create_user(db : AsyncSession , user : UserCreateRequest):
         username = user.chessDotComUsername,
         email = user.email,
         phone = user.phone,
-        hashed_password = bcrypt_context.hash(user.password)
+        hashed_password = await hash_password(user.password)
     )
     else :
         db_user = User(
         username = user.username,
         email = user.email,
         phone = user.phone,
-        hashed_password = bcrypt_context.hash(user.password)
+        hashed_password = await hash_password(user.password)
     )
     db.add(db_user)
     await db.flush() # this allows us to get the user_id before commiting to the database
@@ -47,7 +56,8 @@ async def create_user(db : AsyncSession , user : UserCreateRequest):
     await db.refresh(db_user)
     await db.refresh(user_account_db)
     await db.refresh(user_native_profile_db)
-    print("user , account and native chess profile created succesfully")
+    await user_cache.set_profile(db_user , user_account_db , user_native_profile_db) # write-through , the first profile read is a hit
+    logger.info("User created", extra={'user_id': db_user.id})
     return db_user
 
 async def get_user_by_id(db : AsyncSession , user_id : int):
@@ -55,25 +65,104 @@ async def get_user_by_id(db : AsyncSession , user_id : int):
     result = await db.execute(query)
     return result.scalars().first()
 
+# the login and signup lookups are hot so they are lambda statements : the query is built and compiled once ,
+# later calls only swap in the bound parameter and asyncpg reuses the prepared statement
 async def get_user_by_username(db: AsyncSession, username: str):
-    query = select(User).where(User.username == username)
+    query = lambda_stmt(lambda: select(User).where(User.username == username))
     result = await db.execute(query)
     return result.scalars().first()
 
 async def get_user_by_email(db: AsyncSession, email: str):
-    query = select(User).where(User.email == email)
+    query = lambda_stmt(lambda: select(User).where(User.email == email))
     result = await db.execute(query)
     return result.scalars().first()
 
 async def get_user_and_account_data(db: AsyncSession, user_id: int):
-    print("starting the get current user and account data util function now")
     query = select(User).options(selectinload(User.account)).where(User.id == user_id)
-    print("query ran succesfully")
     result = await db.execute(query)
-    print("now sending data to endpoint")
     return result.scalars().first()
 
 async def get_user_data_for_redis(db : AsyncSession , user_id : int):
     query = select(NativeChessProfile).where(NativeChessProfile.user_id == user_id)
     result = await db.execute(query)
-    return result.scaars().first()
\ No newline at end of file
+    return result.scalars().first()
+
+async def get_user_profile(user_id : int):
+    # user , account and native chess profile in one cached payload , postgres is only hit on a miss
+    return await user_cache.get_profile(user_id)
+
+BULK_USER_BATCH_SIZE = get_settings().bulk_user_batch_size # users per transaction
+
+def _username(user : UserCreateRequest):
+    return user.chessDotComUsername or user.username
+
+async def bulk_create_users(db : AsyncSession , users : List[UserCreateRequest] , tenant_id : int) -> dict:
+    """
+    Create a whole cohort : passwords are hashed across the process pool , then users , accounts and
+    native profiles go in as multi-row INSERT ... RETURNING , one transaction per batch.
+    Rows clashing on email or username ( in the request or in the database ) are reported , not raised
+    """
+    conflicts = []
+    candidates = []
+    seen_emails , seen_usernames = set() , set()
+    for row , user in enumerate(users):
+        username = _username(user)
+        if not username:
+            conflicts.append({'row' : row , 'email' : user.email , 'username' : None , 'reason' : 'username is required'})
+        elif user.email in seen_emails:
+            conflicts.append({'row' : row , 'email' : user.email , 'username' : username , 'reason' : 'duplicate email in request'})
+        elif username in seen_usernames:
+            conflicts.append({'row' : row , 'email' : user.email , 'username' : username , 'reason' : 'duplicate username in request'})
+        else:
+            seen_emails.add(user.email)
+            seen_usernames.add(username)
+            candidates.append((row , user , username))
+
+    # one lookup for everything that already exists instead of a query per row
+    existing_emails , existing_usernames = set() , set()
+    for start in range(0 , len(candidates) , BULK_USER_BATCH_SIZE):
+        batch = candidates[start:start + BULK_USER_BATCH_SIZE]
+        result = await db.execute(select(User.email , User.username).where(or_(
+            User.email.in_([user.email for _ , user , _ in batch]) ,
+            User.username.in_([username for _ , _ , username in batch])
+        )))
+        for email , username in result:
+            existing_emails.add(email)
+            existing_usernames.add(username)
+
+    to_create = []
+    for row , user , username in candidates:
+        if user.email in existing_emails:
+            conflicts.append({'row' : row , 'email' : user.email , 'username' : username , 'reason' : 'email is already registered'})
+        elif username in existing_usernames:
+            conflicts.append({'row' : row , 'email' : user.email , 'username' : username , 'reason' : 'username is taken'})
+        else:
+            to_create.append((row , user , username))
+
+    hashed = await hash_passwords([user.password for _ , user , _ in to_create])
+
+    created = 0
+    for start in range(0 , len(to_create) , BULK_USER_BATCH_SIZE):
+        batch = to_create[start:start + BULK_USER_BATCH_SIZE]
+        rows = [
+            {'tenant_id' : tenant_id , 'username' : username , 'email' : user.email , 'phone' : user.phone , 'hashed_password' : password}
+            for (_ , user , username) , password in zip(batch , hashed[start:start + BULK_USER_BATCH_SIZE])
+        ]
+        # DO NOTHING covers users signing up between the lookup above and this insert , they just do not come back
+        stmt = insert(User).values(rows).on_conflict_do_nothing().returning(User.id , User.email)
+        user_ids = {email : user_id for user_id , email in (await db.execute(stmt)).all()}
+        for row , user , username in batch:
+            if user.email not in user_ids:
+                conflicts.append({'row' : row , 'email' : user.email , 'username' : username , 'reason' : 'email or username was registered concurrently'})
+        if user_ids:
+            await db.execute(insert(Account).values([
+                {'user_id' : user_id , 'balance' : 0 , 'currency' : 'KES'} for user_id in user_ids.values()
+            ]))
+            await db.execute(insert(NativeChessProfile).values([
+                {'user_id' : user_id} for user_id in user_ids.values()
+            ]))
+        await db.commit()
+        created += len(user_ids)
+
+    conflicts.sort(key = lambda conflict : conflict['row'])
+    return {'created' : created , 'conflicts' : conflicts}
@@ -0,0 +1,71 @@
+# benchmarks/bench_import_time.py
+# measures how long `import main` takes ( the cold start of every worker ) with python -X importtime
+# and fails when it goes over budget or pulls in a module the app should not load at import
+# run with : python -m benchmarks.bench_import_time
+#            IMPORT_TIME_BUDGET_MS=800 python -m benchmarks.bench_import_time --top 30
+import os
+import sys
+import argparse
+import subprocess
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '1500'))
+ROUNDS = 3
+
+# heavy packages that were imported by main before and are not used by the app any more ,
+# or only on first use ( redis ) , importing one of them again is a regression
+FORBIDDEN = ('aiohttp', 'requests', 'redis')
+
+
+def measure() -> tuple:
+    """
+    One cold `import main` in a fresh interpreter
+
+    Returns:
+        tuple: Total ms and {top level package: ms spent importing it}
+    """
+    # REDIS_URL is left as configured , the redis clients must still not be made at import
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import main failed :\n{result.stderr[-2000:]}")
+
+    total = 0.0
+    packages = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = len(name) - len(name.lstrip()) - 1
+        name = name.strip()
+        if depth == 0:
+            # the imports made by `-c import main` itself , together they are the whole import
+            total += int(cumulative) / 1000
+        if '.' not in name and name != 'main':
+            # a package's own line covers everything it imported the first time it was loaded
+            packages[name] = int(cumulative) / 1000
+    return total, packages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import time of main against a budget')
+    parser.add_argument('--top', type=int, default=15, help='slowest top level imports to list')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(ROUNDS)]
+    total, packages = min(runs, key=lambda run: run[0])  # the least noisy run
+
+    print(f"import main : {total:.0f} ms ( best of {ROUNDS} , budget {IMPORT_TIME_BUDGET_MS:.0f} ms )")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    if total > IMPORT_TIME_BUDGET_MS:
+        failures.append(f"import main took {total:.0f} ms , over the {IMPORT_TIME_BUDGET_MS:.0f} ms budget")
+    imported = sorted(name for name in FORBIDDEN if name in packages)
+    if imported:
+        failures.append(f"imported at startup : {', '.join(imported)}")
+    if failures:
+        raise SystemExit('\n'.join(failures))
@@ -0,0 +1,56 @@
+# benchmarks/bench_json_response.py
+# compares the old generic encoding of /sms/todays-schedule against the typed response model + orjson path
+# run with : python -m benchmarks.bench_json_response
+import json
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api.utils.responses import FastJSONResponse
+from pydantic_schemas.timetable_schema import TodaysScheduleResponse
+
+SCHEDULE_SIZE = 5000
+ROUNDS = 20
+
+
+def build_payload(size: int) -> dict:
+    data = []
+    for i in range(size):
+        data.append({
+            'id': i,
+            'unit': f'unit {i}',
+            'start_time': '08:00',
+            'end_time': '10:00',
+            'day': 'monday',
+            'next_alerts': [
+                {'minutes_before': 120, 'alert_time': '06:00'},
+                {'minutes_before': 30, 'alert_time': '07:30'},
+                {'minutes_before': 5, 'alert_time': '07:55'},
+            ]
+        })
+    return {'success': True, 'data': data}
+
+
+def generic_path(payload: dict) -> bytes:
+    # what fastapi does without a response model : jsonable_encoder walk then the stdlib encoder
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def typed_path(payload: dict) -> bytes:
+    # what fastapi does with a response model : one pydantic validate + dump then one orjson pass
+    content = TodaysScheduleResponse.model_validate(payload).model_dump(mode='json')
+    return FastJSONResponse(content).body
+
+
+if __name__ == '__main__':
+    payload = build_payload(SCHEDULE_SIZE)
+    assert json.loads(generic_path(payload)) == json.loads(typed_path(payload))
+
+    generic = timeit.timeit(lambda: generic_path(payload), number=ROUNDS) / ROUNDS
+    typed = timeit.timeit(lambda: typed_path(payload), number=ROUNDS) / ROUNDS
+
+    print(f"schedule items : {SCHEDULE_SIZE}")
+    print(f"generic encoding : {generic * 1000:.2f} ms")
+    print(f"typed + orjson   : {typed * 1000:.2f} ms")
+    print(f"speedup          : {generic / typed:.1f}x")
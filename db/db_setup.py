@@ -1,36 +1,140 @@
 import os
 import sys
+import asyncio
 from typing import AsyncGenerator
 
 # Add the project root to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncEngine
-from dotenv import load_dotenv
 
-load_dotenv()
+from db.query_cache import track_query_cache
+from db.query_tracing import trace_queries
+from settings import get_settings
+
+settings = get_settings()
+SQL_ALCHEMY_DATABASE_URL = settings.database_url
 
-SQL_ALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL')
+# size of sqlalchemy's compiled statement cache and of asyncpg's per connection prepared statement cache
+QUERY_CACHE_SIZE = settings.query_cache_size
+PREPARED_STATEMENT_CACHE_SIZE = settings.prepared_statement_cache_size
+
+connect_args = {}
+if SQL_ALCHEMY_DATABASE_URL and SQL_ALCHEMY_DATABASE_URL.startswith('postgresql+asyncpg'):
+    connect_args['prepared_statement_cache_size'] = PREPARED_STATEMENT_CACHE_SIZE
 
 # These lines are not that important they are general fastapi setup code 
-engine = create_async_engine( SQL_ALCHEMY_DATABASE_URL )
+engine = create_async_engine( SQL_ALCHEMY_DATABASE_URL , query_cache_size = QUERY_CACHE_SIZE , connect_args = connect_args )
+track_query_cache(engine.sync_engine)
+trace_queries(engine.sync_engine)
 AsyncSessionLocal = sessionmaker( engine , class_= AsyncSession , expire_on_commit = False)
 Base = declarative_base()
 
+# counters for the lazy session dependency , exposed through /metrics/db
+session_metrics = {
+    'requests' : 0 , # requests that asked for a db dependancy
+    'sessions_opened' : 0 , # requests that actually touched the db
+    'early_releases' : 0 , # sessions handed back to the pool before the request finished
+}
+
+class LazySession:
+    """
+    Stands in for an AsyncSession and only creates the real one on first use
+
+    Handlers use it exactly like an AsyncSession ( db.execute , db.add , db.commit ... ).
+    Call release() once the handler's db work is done to hand the connection back to the pool
+    before slow non db work such as sending sms
+    """
+
+    def __init__(self):
+        self._session = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = AsyncSessionLocal()
+            session_metrics['sessions_opened'] += 1
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self._get_session(), name)
+
+    async def release(self) -> None:
+        """
+        Ends the current transaction and returns the connection to the pool
+        Uncommitted changes are rolled back so commit before releasing
+        """
+        if self._session is not None and self._session.in_transaction():
+            await self._session.close()
+            session_metrics['early_releases'] += 1
+
+    async def rollback(self) -> None:
+        if self._session is not None:
+            await self._session.rollback()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Dependency function that yields db sessions
+    The session is lazy so requests that never query never take a pool connection
+    """
+    session_metrics['requests'] += 1
+    session = LazySession()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+def get_pool_metrics() -> dict:
+    """
+    Snapshot of the connection pool and the lazy session counters
+    """
+    pool = engine.pool
+    return {
+        'pool_size' : pool.size() ,
+        'checked_out' : pool.checkedout() ,
+        'checked_in' : pool.checkedin() ,
+        'overflow' : pool.overflow() ,
+        **session_metrics ,
+        'sessions_skipped' : session_metrics['requests'] - session_metrics['sessions_opened'] ,
+    }
+
+async def warm_up_database(connections: int = 1) -> None:
+    """
+    Opens a few pool connections up front so the first requests dont pay for the connect
+    Should be called on application startup
     """
-    async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        except Exception:
-            await session.rollback()
-            raise
-        finally:
-            await session.close()
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # open them concurrently otherwise the pool just hands back the same connection each time
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+async def drain_database(timeout: float) -> bool:
+    """
+    Waits for checked out connections to be returned then closes the pool
+    Should be called on application shutdown
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while engine.pool.checkedout() > 0 and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    drained = engine.pool.checkedout() == 0
+    await engine.dispose()
+    return drained
 
 async def create_database() -> None:
     """
@@ -43,8 +147,6 @@ async def create_database() -> None:
         # Then create all tables
         await conn.run_sync(Base.metadata.create_all)
 
-from sqlalchemy import text
-
 async def drop_database() -> None:
     """
     Drops all tables in the database
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON
+from db.db_setup import Base
+
+class IdempotencyRecord(Base):
+    """
+    Fingerprint and cached response of a request made with an Idempotency-Key header
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # "<user id>:<Idempotency-Key>"
+    fingerprint = Column(String, nullable=False)
+    status = Column(String, nullable=False)  # in_progress / done
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
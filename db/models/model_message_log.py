@@ -0,0 +1,44 @@
+from sqlalchemy import Column, String, Integer, SmallInteger, BigInteger, DateTime, Text, Index, PrimaryKeyConstraint, DDL, event
+from db.db_setup import Base
+from db.models.model_tenant import DEFAULT_TENANT_ID
+
+class MessageLog(Base):
+    """
+    Append-only record of every sms sent (or attempted), one row per recipient
+
+    On postgres the table is range partitioned by month on sent_at: monthly partitions
+    are created ahead of time by the message log writer and old months can be detached
+    or dropped whole. The lookup indexes lead with tenant_id and end in (sent_at, id) so
+    the history api can page through one school's messages with keyset pagination, and
+    include the columns it returns.
+    """
+    __tablename__ = "message_log"
+    __table_args__ = (
+        # the partition key has to be part of the primary key
+        PrimaryKeyConstraint('id', 'sent_at'),
+        Index('ix_message_log_class_sent', 'tenant_id', 'class_id', 'sent_at', 'id',
+              postgresql_include=['recipient', 'kind', 'minutes_before', 'status']),
+        Index('ix_message_log_recipient_sent', 'tenant_id', 'recipient', 'sent_at', 'id',
+              postgresql_include=['class_id', 'kind', 'minutes_before', 'status']),
+        Index('ix_message_log_sent', 'tenant_id', 'sent_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (sent_at)'},
+    )
+
+    id = Column(BigInteger, autoincrement=True, nullable=False)
+    sent_at = Column(DateTime, nullable=False)
+    tenant_id = Column(Integer, nullable=False, server_default=str(DEFAULT_TENANT_ID))  # no foreign key either , like class_id
+    recipient = Column(String, nullable=False)
+    class_id = Column(Integer, nullable=True)  # no foreign key , the log outlives deleted slots
+    kind = Column(String, nullable=False)  # reminder / immediate / combined / custom
+    minutes_before = Column(SmallInteger, nullable=True)
+    provider = Column(String, nullable=True)
+    provider_message_id = Column(String, nullable=True)
+    status = Column(String, nullable=False)  # provider status for the recipient , or failed
+    message = Column(Text, nullable=False)
+
+# rows that fall outside every monthly partition land here instead of failing the insert
+event.listen(
+    MessageLog.__table__,
+    'after_create',
+    DDL('CREATE TABLE IF NOT EXISTS message_log_default PARTITION OF message_log DEFAULT').execute_if(dialect='postgresql')
+)
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, String, Integer, Time, Date, ForeignKey, Index, UniqueConstraint
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+from db.models.model_tenant import tenant_column
+
+class ClassOccurrence(Base, TimeStamp):
+    """
+    A dated instance of a weekly TimeTable slot, materialised over a rolling horizon
+    """
+    __tablename__ = "class_occurrences"
+    __table_args__ = (
+        UniqueConstraint('timetable_id', 'original_date', name='uq_class_occurrences_slot_date'),
+        Index('ix_class_occurrences_date_start', 'tenant_id', 'date', 'start_time'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()  # copied from the slot so a school's day is read without a join
+    timetable_id = Column(Integer, ForeignKey("time_table.id", ondelete="CASCADE"), nullable=False)
+    version_id = Column(Integer, nullable=True)  # copied from the slot , reads only see the tenant's active version
+    original_date = Column(Date, nullable=False)  # the date the weekly slot falls on
+    date = Column(Date, nullable=False)  # the date it actually happens ( differs when rescheduled )
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    unit = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="scheduled")  # scheduled / rescheduled / cancelled
+
+class TimetableException(Base, TimeStamp):
+    """
+    Exception rule applied when materialising occurrences
+
+    kind 'cancel' with no timetable_id covers every class of the tenant ( public holidays , exam weeks ),
+    kind 'reschedule' moves one slot's occurrence on start_date to new_date / new times
+    """
+    __tablename__ = "timetable_exceptions"
+    __table_args__ = (
+        Index('ix_timetable_exceptions_tenant_dates', 'tenant_id', 'start_date', 'end_date'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
+    timetable_id = Column(Integer, ForeignKey("time_table.id", ondelete="CASCADE"), nullable=True, index=True)
+    kind = Column(String, nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    new_date = Column(Date, nullable=True)
+    new_start_time = Column(Time, nullable=True)
+    new_end_time = Column(Time, nullable=True)
+    reason = Column(String, nullable=True)
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, Index, text
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+from db.models.model_tenant import tenant_column
+
+# pending -> sending -> sent / failed , or pending -> cancelled / expired
+SCHEDULED_STATUSES = ('pending', 'sending', 'sent', 'failed', 'cancelled', 'expired')
+
+class ScheduledMessage(Base, TimeStamp):
+    """
+    A custom message staff scheduled to go out later
+
+    The alert service keeps the pending ones of the tenants it owns on a timing wheel and
+    sends each when it falls due. Only (id, tenant_id, send_at) is loaded for that , the
+    message and recipients are read back when it is claimed for sending. The partial indexes
+    cover exactly the rows the scheduler reloads , and the claims it reclaims from a dead replica.
+    """
+    __tablename__ = "scheduled_messages"
+    __table_args__ = (
+        Index('ix_scheduled_messages_pending', 'tenant_id', 'send_at', 'id',
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+        Index('ix_scheduled_messages_sending', 'updated_at',
+              postgresql_where=text("status = 'sending'"), sqlite_where=text("status = 'sending'")),
+        Index('ix_scheduled_messages_tenant_created', 'tenant_id', 'created_at', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
+    created_by = Column(Integer, nullable=True)  # user id , no foreign key so the record outlives the user
+    message = Column(Text, nullable=False)
+    recipients = Column(JSON, nullable=True)  # formatted phone numbers , null means every subscribed student at send time
+    send_at = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False, default='pending', server_default='pending')
+    sent_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
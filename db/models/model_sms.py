@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+
+class SMSMessage(Base, TimeStamp):
+    """
+    Delivery status of one sms to one recipient, keyed by the provider's message id
+    """
+    __tablename__ = "sms_messages"
+    __table_args__ = (
+        Index('ix_sms_messages_class_status', 'class_id', 'status'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    provider_message_id = Column(String, unique=True, nullable=False)
+    class_id = Column(Integer, ForeignKey("time_table.id", ondelete="SET NULL"), nullable=True)
+    phone = Column(String, nullable=True)
+    status = Column(String, nullable=False)  # Sent / Submitted / Buffered / Success / Failed / Rejected ...
+    failure_reason = Column(String, nullable=True)
+    network_code = Column(String, nullable=True)
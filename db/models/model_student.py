@@ -0,0 +1,40 @@
+# db/models/model_student.py
+from sqlalchemy import Column, String, Integer, SmallInteger, Boolean, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+from db.models.model_tenant import tenant_column
+
+# alert intervals (minutes before class) and the bit each one has in Student.alert_mask
+ALERT_INTERVALS = [120, 30, 5]
+INTERVAL_BITS = {minutes: 1 << i for i, minutes in enumerate(ALERT_INTERVALS)}
+ALL_INTERVALS = (1 << len(ALERT_INTERVALS)) - 1
+
+class Student(Base, TimeStamp):
+    __tablename__ = "students"
+    __table_args__ = (
+        # registration numbers and emails are only unique within a school
+        UniqueConstraint('tenant_id', 'email', name='uq_students_tenant_email'),
+        UniqueConstraint('tenant_id', 'student_id', name='uq_students_tenant_student_id'),
+        Index('ix_students_tenant_active', 'tenant_id', 'active', 'id'),
+    )
+
+    id = Column(Integer, index=True, primary_key=True)
+    tenant_id = tenant_column()
+    name = Column(String, nullable=False)
+    email = Column(String, nullable=False)
+    phone = Column(String, nullable=False)
+    student_id = Column(String, nullable=False)  # Student registration number
+    active = Column(Boolean, default=True, nullable=False)
+
+    # Optional: Link to a class/grade
+    class_name = Column(String, nullable=True)
+
+    # Alert preferences , kept small since the scheduler loads them for every student
+    alert_mask = Column(SmallInteger, default=ALL_INTERVALS, nullable=False)  # bits from INTERVAL_BITS
+    quiet_start = Column(SmallInteger, nullable=True)  # minute of the day quiet hours begin , may wrap past midnight
+    quiet_end = Column(SmallInteger, nullable=True)  # minute of the day quiet hours end
+    opted_out = Column(Boolean, default=False, nullable=False)  # replied STOP
+
+    def __repr__(self):
+        return f"<Student(name='{self.name}', student_id='{self.student_id}')>"
@@ -0,0 +1,49 @@
+# db/models/model_tenant.py
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, DDL, event
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+
+# rows written before tenants existed ( and signups that name no school ) belong to this tenant
+DEFAULT_TENANT_ID = 1
+
+def tenant_column() -> Column:
+    # indexes on tenant scoped tables lead with this column , every query filters on it
+    return Column(
+        Integer,
+        ForeignKey("tenants.id"),
+        nullable=False,
+        default=DEFAULT_TENANT_ID,
+        server_default=str(DEFAULT_TENANT_ID)
+    )
+
+class Tenant(Base, TimeStamp):
+    """
+    A school served by this deployment , every timetable , occurrence , student and user row carries its id
+    """
+    __tablename__ = "tenants"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    slug = Column(String, unique=True, nullable=False)
+    active = Column(Boolean, default=True, nullable=False)
+    # the published timetable version , null while the school still uses its unversioned timetable
+    # ( no foreign key , timetable_versions itself references tenants )
+    active_timetable_version_id = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<Tenant(slug='{self.slug}')>"
+
+# the default tenant exists from the start so tenant_id can default to it
+event.listen(
+    Tenant.__table__,
+    'after_create',
+    DDL(
+        f"INSERT INTO tenants (id, name, slug, active, created_at, updated_at) "
+        f"VALUES ({DEFAULT_TENANT_ID}, 'default', 'default', true, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+    )
+)
+event.listen(
+    Tenant.__table__,
+    'after_create',
+    DDL(f"SELECT setval('tenants_id_seq', {DEFAULT_TENANT_ID})").execute_if(dialect='postgresql')
+)
@@ -1,14 +1,74 @@
 from datetime import time as time_, datetime
-from sqlalchemy import Column, String, Integer, Time
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, SmallInteger, Time, Index, ForeignKey, DDL, event, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import relationship, validates
 from db.db_setup import Base
 from db.models.mixins import TimeStamp
+from db.models.model_tenant import tenant_column
+from db.models.model_timetable_version import TimetableVersion  # noqa: F401 , the table version_id points at
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6
+}
+
+def day_index_for(day) -> int:
+    # 0 = monday , None for a day name that is not a weekday
+    return WEEKDAYS.get((day or '').strip().lower())
+
+def day_index_default(context):
+    # filled in from the day name on insert so the week can be ordered and paged monday first ,
+    # for core inserts ( bulk loads ) , orm writes set it in TimeTable.set_day
+    return day_index_for(context.get_current_parameters().get('day'))
+
+# the slot as a range on a fixed date so postgres can check overlaps with &&
+SLOT_RANGE = "tsrange(DATE '2000-01-01' + start_time, DATE '2000-01-01' + end_time)"
+
+def no_overlap(column: str) -> ExcludeConstraint:
+    # two slots of a school's timetable version on the same day for the same room / lecturer / group
+    # may not overlap ( rows with a null resource are skipped ) , a draft never clashes with the live version
+    return ExcludeConstraint(
+        ('tenant_id', '='),
+        (text('coalesce(version_id, 0)'), '='),
+        (text('lower(day)'), '='),
+        (column, '='),
+        (text(SLOT_RANGE), '&&'),
+        using='gist',
+        name=f'ex_time_table_{column}_overlap'
+    ).ddl_if(dialect='postgresql')
 
 class TimeTable(Base, TimeStamp):
     __tablename__ = "time_table"  # Changed from "time-table" to use underscore
+    __table_args__ = (
+        no_overlap('room'),
+        no_overlap('lecturer'),
+        no_overlap('group_name'),
+        # keyset pagination of the read api , in week order and per unit , within one school's version
+        Index('ix_time_table_week', 'tenant_id', 'version_id', 'day_index', 'start_time', 'id'),
+        Index('ix_time_table_unit_week', 'tenant_id', 'version_id', 'unit', 'day_index', 'start_time', 'id'),
+    )
 
     id = Column(Integer, index=True, primary_key=True)
+    tenant_id = tenant_column()
+    version_id = Column(Integer, ForeignKey("timetable_versions.id", ondelete="CASCADE"), nullable=True)  # null for the unversioned timetable
     start_time = Column(Time, nullable=False)
     end_time = Column(Time, nullable=False)
     unit = Column(String, nullable=False)
-    day = Column(String, nullable=False)  # Fixed case for 'False'
\ No newline at end of file
+    day = Column(String, nullable=False)  # Fixed case for 'False'
+    day_index = Column(SmallInteger, nullable=True, default=day_index_default)  # 0 = monday , null for an unknown day name
+    room = Column(String, nullable=True)
+    lecturer = Column(String, nullable=True)
+    group_name = Column(String, nullable=True)
+
+    @validates('day')
+    def set_day(self, key, day):
+        # keeps day_index in step when a slot is created or moved to another day through the orm
+        self.day_index = day_index_for(day)
+        return day
+
+# the exclusion constraints mix = on plain columns with && on ranges in one gist index which needs btree_gist
+event.listen(
+    TimeTable.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
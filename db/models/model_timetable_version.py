@@ -0,0 +1,51 @@
+from sqlalchemy import Column, String, Integer, DateTime, Index
+from sqlalchemy.future import select
+from db.db_setup import Base
+from db.models.mixins import TimeStamp
+from db.models.model_tenant import Tenant, tenant_column
+
+# draft -> published -> archived ( replaced by a newer one ) , an archived version can be published again
+TIMETABLE_VERSION_STATUSES = ('draft', 'published', 'archived')
+
+# reads that do not name a version get the tenant's live timetable
+ACTIVE_VERSION = 'active'
+
+class TimetableVersion(Base, TimeStamp):
+    """
+    One complete timetable of a school , e.g. a term's
+
+    A new term's slots are loaded into a draft , which nothing reads. Publishing points the
+    tenant's active_timetable_version_id at it , a single row update , and from then on every
+    read of the timetable and its occurrences sees the new version and none of the old one.
+    Slots written before versions existed have no version , they are the live timetable of a
+    tenant that never published one.
+    """
+    __tablename__ = "timetable_versions"
+    __table_args__ = (
+        Index('ix_timetable_versions_tenant', 'tenant_id', 'id'),  # the version list , newest first
+    )
+
+    id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
+    name = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='draft', server_default='draft')
+    created_by = Column(Integer, nullable=True)  # user id , no foreign key so the record outlives the user
+    published_at = Column(DateTime, nullable=True)  # last time it was made live
+    # the version it replaced when last published , rollback switches back to it ( no foreign key ,
+    # null when it replaced the unversioned timetable or was never published )
+    previous_version_id = Column(Integer, nullable=True)
+
+
+def version_clause(model, version_id=ACTIVE_VERSION):
+    """
+    Filter on a versioned table ( TimeTable , ClassOccurrence ) for one version
+
+    ACTIVE_VERSION compares each row with its tenant's pointer inside the same statement , so a read
+    never mixes two versions however close to a publish it runs. None is the unversioned timetable
+    """
+    if version_id == ACTIVE_VERSION:
+        active = select(Tenant.active_timetable_version_id).where(Tenant.id == model.tenant_id).scalar_subquery()
+        return model.version_id.is_not_distinct_from(active)
+    if version_id is None:
+        return model.version_id.is_(None)
+    return model.version_id == version_id
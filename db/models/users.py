@@ -1,24 +1,41 @@
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy.orm import relationship
 
 # Import the Base from db_setup to ensure all models use the same Base
 from db.db_setup import Base
-from db.models.mixins import DataTime
+from db.models.mixins import TimeStamp
+from db.models.model_tenant import tenant_column
 
-# You can define your models here or in separate files
-# For example:
-# from .another_model import AnotherModel
 
-# Example model template (uncomment and modify as needed):
-"""
-from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy.sql import func
+class User(Base, TimeStamp):
+    __tablename__ = "users"
 
-class ExampleModel(Base):
-    __tablename__ = 'example_models'
-    
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    description = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-"""
\ No newline at end of file
+    tenant_id = tenant_column()  # the school whose data the user works with , carried in their token
+    username = Column(String, unique=True, index=True, nullable=False)
+    email = Column(String, unique=True, index=True, nullable=False)
+    phone = Column(String, nullable=False)
+    hashed_password = Column(String, nullable=False)
+
+    account = relationship("Account", back_populates="user", uselist=False)
+    native_chess_profile = relationship("NativeChessProfile", back_populates="user", uselist=False)
+
+
+class Account(Base, TimeStamp):
+    __tablename__ = "accounts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+    balance = Column(Integer, default=0, nullable=False)
+    currency = Column(String, default="KES", nullable=False)
+
+    user = relationship("User", back_populates="account")
+
+
+class NativeChessProfile(Base, TimeStamp):
+    __tablename__ = "native_chess_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
+
+    user = relationship("User", back_populates="native_chess_profile")
@@ -0,0 +1,275 @@
+# db/online_migrations.py
+# helpers for migrations that run against the live database without stalling the app
+#
+#   from db.online_migrations import ensure_index, backfill
+#
+#   def upgrade():
+#       ensure_index('ix_time_table_week', 'time_table', ['tenant_id', 'version_id', 'day_index', 'start_time', 'id'])
+#       backfill('time_table', "day_index = CASE lower(trim(day)) WHEN 'monday' THEN 0 ... END", 'day_index IS NULL')
+#
+# ( alembic/versions/3f1a9c2b7d41_time_table_day_index.py and 9d4c6e1b2f57_tenant_leading_indexes.py use them )
+#
+# both run outside the migration's transaction ( postgres refuses CREATE INDEX CONCURRENTLY inside one ,
+# and a backfill committed batch by batch only ever holds row locks on one batch )
+#
+# the has_* checks let a revision run against databases made with create_all at any point of the
+# schema's history , and do nothing where the change is already there. A sql script ( offline mode )
+# is written as if none of it were
+import time
+import logging
+from contextlib import contextmanager
+from typing import List, Optional
+
+from alembic import context, op
+from sqlalchemy import inspect, text
+
+# under the alembic logger so progress shows with alembic.ini's logging setup
+logger = logging.getLogger('alembic.online')
+
+
+def _is_postgres() -> bool:
+    # the migration context knows the dialect in offline mode too , where there is no bind
+    return context.get_context().dialect.name == 'postgresql'
+
+def has_table(table: str) -> bool:
+    """
+    Whether the live database already has the table
+    """
+    if context.is_offline_mode():
+        return False
+    return inspect(op.get_bind()).has_table(table)
+
+def has_column(table: str, column: str) -> bool:
+    """
+    Whether the live table already has the column , for revisions that also run against databases
+    made with create_all. A sql script ( offline mode ) is written as if it had not
+    """
+    if context.is_offline_mode():
+        return False
+    return column in {existing['name'] for existing in inspect(op.get_bind()).get_columns(table)}
+
+def index_columns(table: str, name: str) -> Optional[List[str]]:
+    """
+    Key columns of the named index on the live table , None when there is no such index
+    """
+    if context.is_offline_mode():
+        return None
+    for index in inspect(op.get_bind()).get_indexes(table):
+        if index['name'] == name:
+            return list(index['column_names'])
+    return None
+
+def _is_partitioned(table: str, partitioned: Optional[bool] = None) -> bool:
+    # a sql script cannot look it up , the revision says so for the tables it knows are partitioned
+    if not _is_postgres():
+        return False
+    if partitioned is not None or context.is_offline_mode():
+        return bool(partitioned)
+    return op.get_bind().execute(text(
+        "SELECT 1 FROM pg_class WHERE relname = :table AND relkind = 'p'"
+    ), {'table': table}).first() is not None
+
+def add_column(table: str, column) -> bool:
+    """
+    ALTER TABLE ... ADD COLUMN unless the table already has it
+
+    Give a NOT NULL column a server_default , postgres ( 11+ ) then stores it without rewriting
+    the table. Foreign keys go on separately with add_foreign_key
+
+    Returns:
+        bool: Whether the column was added
+    """
+    if has_column(table, column.name):
+        return False
+    op.add_column(table, column)
+    return True
+
+def add_foreign_key(table: str, column: str, referent: str, ondelete: Optional[str] = None):
+    """
+    Foreign key from table.column to referent.id , unless one is already there ( postgres only )
+
+    Added NOT VALID , which only takes a brief lock , and then validated , which checks the
+    existing rows without blocking writes. Named the way postgres names the ones create_all makes
+    """
+    if not context.is_offline_mode():
+        for existing in inspect(op.get_bind()).get_foreign_keys(table):
+            if existing['constrained_columns'] == [column]:
+                return
+    if not _is_postgres():
+        logger.info(f"foreign key {table}.{column} skipped , only added on postgres")
+        return
+    name = f"{table}_{column}_fkey"
+    on_delete = f" ON DELETE {ondelete}" if ondelete else ''
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {referent} (id){on_delete} NOT VALID")
+    op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+@contextmanager
+def session_settings(**settings):
+    """
+    SET postgres settings ( lock_timeout , statement_timeout ... ) for the block and put the previous values back after
+    """
+    if context.is_offline_mode() or not _is_postgres():
+        yield
+        return
+    bind = op.get_bind()
+    previous = {name: bind.execute(text(f"SHOW {name}")).scalar() for name in settings}
+    for name, value in settings.items():
+        bind.execute(text("SELECT set_config(:name, :value, false)"), {'name': name, 'value': str(value)})
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            bind.execute(text("SELECT set_config(:name, :value, false)"), {'name': name, 'value': value})
+
+def _drop_invalid_index(name: str):
+    # a concurrent build that failed or was cancelled leaves an INVALID index behind which IF NOT EXISTS would keep
+    invalid = op.get_bind().execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {'name': name}).first()
+    if invalid:
+        logger.warning(f"dropping invalid index {name} left by an earlier failed build")
+        op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+def create_index_concurrently(name: str, table: str, columns: List[str], partitioned: Optional[bool] = None, **kw):
+    """
+    CREATE INDEX CONCURRENTLY , the table stays readable and writable while the index builds
+
+    The build only waits on other transactions , it never blocks them , so the lock and
+    statement timeouts are lifted for it. Safe to rerun after a failure.
+
+    Args:
+        name: Index name
+        table: Table name
+        columns: Column names or expressions
+        partitioned: Whether table is partitioned on postgres , looked up when None ( needed in offline mode )
+        kw: Passed to op.create_index ( unique , postgresql_include , postgresql_where ... )
+    """
+    if not _is_postgres():
+        op.create_index(name, table, columns, if_not_exists=True, **kw)
+        return
+    if _is_partitioned(table, partitioned):
+        # postgres cannot build an index on a partitioned table concurrently , the plain build
+        # blocks writes to it ( not reads ) while every partition is indexed
+        logger.warning(f"index {name} on partitioned {table} is built without CONCURRENTLY")
+        started = time.monotonic()
+        op.create_index(name, table, columns, if_not_exists=True, **kw)
+        logger.info(f"index {name} on {table} built in {time.monotonic() - started:.1f}s")
+        return
+    with context.get_context().autocommit_block():
+        with session_settings(lock_timeout=0, statement_timeout=0):
+            if not context.is_offline_mode():
+                _drop_invalid_index(name)
+            started = time.monotonic()
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+            logger.info(f"index {name} on {table} built in {time.monotonic() - started:.1f}s")
+
+def drop_index_concurrently(name: str, table: Optional[str] = None, partitioned: Optional[bool] = None):
+    if not _is_postgres() or (table is not None and _is_partitioned(table, partitioned)):
+        op.drop_index(name, table_name=table, if_exists=True)
+        return
+    with context.get_context().autocommit_block():
+        with session_settings(lock_timeout=0, statement_timeout=0):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+def ensure_index(name: str, table: str, columns: List[str], partitioned: Optional[bool] = None, **kw) -> bool:
+    """
+    Make the named index cover exactly these columns , building it if it is missing and
+    rebuilding it if an older version of it has other columns ( e.g. before tenant_id led )
+
+    On postgres the new index is built concurrently under a temporary name and swapped in ,
+    so queries keep the old one until the new one is ready. Only plain column names can be
+    compared , pass expressions to create_index_concurrently instead
+
+    Args:
+        name: Index name
+        table: Table name
+        columns: Column names , in order
+        partitioned: See create_index_concurrently
+        kw: Passed to op.create_index ( postgresql_include , postgresql_where ... )
+
+    Returns:
+        bool: Whether anything was built
+    """
+    existing = index_columns(table, name)
+    if existing == list(columns):
+        return False
+    if context.is_offline_mode():
+        # unknown in a sql script , drop whatever is there and build it again
+        drop_index_concurrently(name, table, partitioned)
+        create_index_concurrently(name, table, columns, partitioned, **kw)
+        return True
+    if existing is None:
+        create_index_concurrently(name, table, columns, partitioned, **kw)
+        return True
+    logger.info(f"index {name} on {table} is on {existing} , rebuilding it on {list(columns)}")
+    if not _is_postgres():
+        op.drop_index(name, table_name=table)
+        op.create_index(name, table, columns, **kw)
+        return True
+    rebuilt = f"{name}_rebuild"
+    create_index_concurrently(rebuilt, table, columns, partitioned, **kw)
+    drop_index_concurrently(name, table, partitioned)
+    op.execute(f"ALTER INDEX {rebuilt} RENAME TO {name}")
+    return True
+
+def backfill(table: str, set_clause: str, where: str, batch_size: int = 5000,
+             pause: float = 0.1, key: str = 'id', report_every: float = 10.0) -> int:
+    """
+    UPDATE a large table in small committed batches instead of one long transaction
+
+    Rows matching `where` are updated in key order, batch_size rows per statement, each
+    batch committed on its own. `where` must stop matching a row once it is updated
+    ( e.g. "day_index IS NULL" ) so a rerun after a failure picks up where it stopped.
+
+    Args:
+        table: Table name
+        set_clause: The SET part , e.g. "day_index = 0"
+        where: Rows still to update
+        batch_size: Rows per UPDATE
+        pause: Seconds to sleep between batches , leaves room for the app's own writes and for replicas to catch up
+        key: Integer primary key the batches are walked by
+        report_every: Seconds between progress log lines
+
+    Returns:
+        int: Rows updated
+    """
+    if context.is_offline_mode():
+        # no round trips to batch with when writing a sql script , emit the whole update
+        op.execute(f"UPDATE {table} SET {set_clause} WHERE ({where})")
+        return 0
+
+    with context.get_context().autocommit_block():
+        bind = op.get_bind()
+        low, high = bind.execute(text(f"SELECT min({key}), max({key}) FROM {table} WHERE ({where})")).first()
+        if low is None:
+            logger.info(f"backfill of {table}: nothing to do")
+            return 0
+
+        statement = text(
+            f"UPDATE {table} SET {set_clause} WHERE {key} IN ("
+            f"SELECT {key} FROM {table} WHERE ({where}) AND {key} > :after ORDER BY {key} LIMIT :batch_size"
+            f") RETURNING {key}"
+        )
+        updated = 0
+        last = low - 1
+        started = reported = time.monotonic()
+        while True:
+            keys = bind.execute(statement, {'after': last, 'batch_size': batch_size}).scalars().all()
+            if not keys:
+                break
+            updated += len(keys)
+            last = max(keys)
+
+            now = time.monotonic()
+            if now - reported >= report_every:
+                done = (last - low + 1) / (high - low + 1)
+                rate = updated / (now - started)
+                eta = (now - started) * (1 - done) / done if done else 0
+                logger.info(f"backfill of {table}: {updated} rows , {done:.0%} , {rate:.0f} rows/s , about {eta:.0f}s left")
+                reported = now
+            if pause:
+                time.sleep(pause)
+
+        logger.info(f"backfill of {table}: {updated} rows in {time.monotonic() - started:.1f}s")
+        return updated
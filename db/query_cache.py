@@ -0,0 +1,35 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+# hit / miss counters for sqlalchemy's compiled statement cache , exposed through /metrics/queries
+query_cache_metrics = {
+    'hits' : 0 ,
+    'misses' : 0 ,
+    'uncached' : 0 , # statements that could not be cached at all ( raw text , no cache key )
+}
+
+
+def track_query_cache(sync_engine : Engine) -> None:
+    """
+    Counts compiled cache hits and misses for every statement the engine runs
+    """
+    @event.listens_for(sync_engine , 'after_cursor_execute')
+    def _count(conn , cursor , statement , parameters , context , executemany):
+        if context is None:
+            return
+        if context.cache_hit is CACHE_HIT:
+            query_cache_metrics['hits'] += 1
+        elif context.cache_hit is CACHE_MISS:
+            query_cache_metrics['misses'] += 1
+        else:
+            query_cache_metrics['uncached'] += 1
+
+
+def get_query_cache_metrics(sync_engine : Engine) -> dict:
+    total = query_cache_metrics['hits'] + query_cache_metrics['misses']
+    return {
+        **query_cache_metrics ,
+        'hit_ratio' : query_cache_metrics['hits'] / total if total else 0.0 ,
+        'compiled_cache_size' : len(sync_engine._compiled_cache) if sync_engine._compiled_cache is not None else 0 ,
+    }
@@ -0,0 +1,40 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.tracing_services.tracing import tracer
+
+# statements are cut to this many characters in the span , the parameters are never recorded
+STATEMENT_PREVIEW = 300
+
+
+def trace_queries(sync_engine : Engine) -> None:
+    """
+    A db.query span for every statement run inside a traced request or scheduler tick ,
+    statements run outside any trace ( startup , migrations ) are not traced
+    """
+    @event.listens_for(sync_engine , 'before_cursor_execute')
+    def _start(conn , cursor , statement , parameters , context , executemany):
+        if context is None:
+            return
+        context._trace_span = tracer.start_child('db.query' , **{
+            'db.statement' : statement[:STATEMENT_PREVIEW] ,
+            'db.executemany' : executemany ,
+        })
+
+    @event.listens_for(sync_engine , 'after_cursor_execute')
+    def _end(conn , cursor , statement , parameters , context , executemany):
+        span = getattr(context , '_trace_span' , None)
+        if span is None:
+            return
+        context._trace_span = None
+        span.set(**{'db.rowcount' : cursor.rowcount})
+        tracer.end_span(span)
+
+    @event.listens_for(sync_engine , 'handle_error')
+    def _error(exception_context):
+        span = getattr(exception_context.execution_context , '_trace_span' , None)
+        if span is None:
+            return
+        exception_context.execution_context._trace_span = None
+        error = exception_context.original_exception
+        tracer.end_span(span , f"{type(error).__name__}: {error}")
@@ -1,23 +1,97 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 import fastapi
 from fastapi import  FastAPI
 from fastapi.middleware.cors import  CORSMiddleware
 
 from db.db_setup import Base , engine
-from db.db_setup import create_database , drop_database
-from api import  api_addtimetable, api_auth 
+from db.db_setup import create_database , drop_database , warm_up_database , drain_database
+from api import  api_addtimetable, api_auth , sms_alerts , api_metrics
+from api.utils.responses import FastJSONResponse
+from api.utils.idempotency import IdempotentReplay , idempotent_replay_handler
+from services.sms_services.sms_service import get_sms_service
+from services.timetable_services.timetable_allerts import alert_service
+from services.sms_services.delivery_reports import delivery_reports
+from services.sms_services.message_log import message_log
+from services.event_services.event_bus import event_bus
+from services.chess_services.chess_profile_service import chess_profiles
+from api.utils.user_cache import user_cache
+from api.utils.passwords import start_hash_pool , shutdown_hash_pool
+from api.utils.request_context import RequestIdMiddleware , TracingMiddleware
+from services.logging_services.structured_logging import setup_logging , shutdown_logging
+from services.tracing_services.tracing import tracer
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+DB_WARMUP_CONNECTIONS = settings.db_warmup_connections
+ALERT_SCHEDULER_AUTOSTART = settings.alert_scheduler_autostart
+SHUTDOWN_DRAIN_TIMEOUT = settings.shutdown_drain_timeout
+
+# we dont need create_database anymore alembic will handle the creations
+# Base.metadata.create_all(bind = engine) # we had to cancel this out because its not async capable its only fo syncronous databases
+
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+    # logs go through a queue to a background thread from here on , nothing logged blocks the event loop
+    setup_logging()
+    tracer.start()
+    start_hash_pool()
+
+    # startup : build the services and warm up the db pool and the sms http client so cold start is paid here and not by the first requests
+    try:
+        await warm_up_database(DB_WARMUP_CONNECTIONS)
+    except Exception as e:
+        logger.error(f"database warm up failed : {e}")
+
+    try:
+        sms_service = get_sms_service()
+        await sms_service.warm_up()
+    except ValueError as e:
+        sms_service = None
+        logger.error(f"sms service is not available : {e}")
+
+    delivery_reports.start()
+    message_log.start()
+    await event_bus.start()
+
+    if ALERT_SCHEDULER_AUTOSTART and sms_service:
+        alert_service.start()
+
+    yield
+
+    # shutdown ( uvicorn gets here on SIGTERM ) : stop the scheduler and drain sends and db sessions within one shared deadline
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SHUTDOWN_DRAIN_TIMEOUT
+    remaining = lambda : max(0.0 , deadline - loop.time())
+
+    await alert_service.shutdown(remaining())
+    if sms_service:
+        await sms_service.drain(remaining())
+        await sms_service.close()
+    # write out buffered delivery reports before the pool goes away
+    await delivery_reports.stop()
+    await message_log.stop()
+    await event_bus.stop()
+    await chess_profiles.close()
+    await user_cache.close()
+    shutdown_hash_pool()
+    if not await drain_database(remaining()):
+        logger.warning("database sessions were still checked out at shutdown")
+    # last , so everything traced and logged while shutting down is written out
+    tracer.shutdown()
+    shutdown_logging()
 
 app = FastAPI(
-    # we will add system info here for later on 
+    # we will add system info here for later on
+    default_response_class = FastJSONResponse,
+    lifespan = lifespan,
 )
 
-# we dont need this anymore alembic will handle the creations 
-"""
-@app.on_event("startup")
-async def startup_event():
-    # await drop_database()  # This will drop all tables
-    await create_database()  # This will recreate them
-"""
-# Base.metadata.create_all(bind = engine) # we had to cancel this out because its not async capable its only fo syncronous databases 
+app.add_exception_handler(IdempotentReplay , idempotent_replay_handler)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,7 +99,13 @@ app.add_middleware(
     allow_credentials = True,
     allow_headers = ['*'],
     allow_methods = ['*'],
+    expose_headers = ['X-Request-ID'],
 )
+app.add_middleware(TracingMiddleware)
+# outermost , so the request id covers the other middleware and the request's trace too
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(api_auth.router)
-app.include_router(api_addtimetable.router)
\ No newline at end of file
+app.include_router(api_addtimetable.router)
+app.include_router(sms_alerts.router)
+app.include_router(api_metrics.router)
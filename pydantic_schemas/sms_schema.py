@@ -0,0 +1,57 @@
+# pydantic_schemas/sms_schema.py
+from pydantic import BaseModel
+from typing import Any, List, Optional
+from datetime import datetime
+
+class SMSActionResponse(BaseModel):
+    # general response for the sms endpoints that trigger an action ( send , start , stop )
+    success: bool
+    message: str
+    data: Optional[Any] = None
+
+class SchedulerStatusResponse(BaseModel):
+    success: bool
+    running: bool
+    alert_intervals: List[int]
+
+class DeliveryStatusCount(BaseModel):
+    class_id: Optional[int] = None
+    status: str
+    count: int
+
+class DeliveryStatsResponse(BaseModel):
+    success: bool
+    data: List[DeliveryStatusCount]
+
+class MessageLogEntry(BaseModel):
+    id: int
+    sent_at: datetime
+    recipient: str
+    class_id: Optional[int] = None
+    kind: str
+    minutes_before: Optional[int] = None
+    status: str
+
+class MessageHistoryResponse(BaseModel):
+    success: bool
+    data: List[MessageLogEntry]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page , null on the last page
+
+class ScheduledMessageEntry(BaseModel):
+    id: int
+    message: str
+    recipients: Optional[List[str]] = None  # null means every subscribed student
+    send_at: datetime
+    status: str
+    sent_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class ScheduledMessageResponse(BaseModel):
+    success: bool
+    message: str
+    data: ScheduledMessageEntry
+
+class ScheduledMessagesResponse(BaseModel):
+    success: bool
+    data: List[ScheduledMessageEntry]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page , null on the last page
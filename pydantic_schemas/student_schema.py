@@ -0,0 +1,29 @@
+# pydantic_schemas/student_schema.py
+from pydantic import BaseModel, field_validator
+from datetime import time
+from typing import List, Optional
+
+from db.models.model_student import ALERT_INTERVALS
+
+class StudentPreferencesUpdate(BaseModel):
+    # fields left out stay as they are , quiet_start / quiet_end sent as null clear the quiet hours
+    alert_intervals: Optional[List[int]] = None  # minutes before class , a subset of 120 / 30 / 5
+    quiet_start: Optional[time] = None
+    quiet_end: Optional[time] = None
+    opted_out: Optional[bool] = None
+
+    @field_validator('alert_intervals')
+    @classmethod
+    def known_intervals(cls, value):
+        if value is not None:
+            unknown = set(value) - set(ALERT_INTERVALS)
+            if unknown:
+                raise ValueError(f"unknown alert intervals {sorted(unknown)}, choose from {ALERT_INTERVALS}")
+        return value
+
+class StudentPreferencesResponse(BaseModel):
+    student_id: str
+    alert_intervals: List[int]
+    quiet_start: Optional[time] = None
+    quiet_end: Optional[time] = None
+    opted_out: bool
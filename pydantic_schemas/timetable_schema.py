@@ -1,20 +1,98 @@
 # pydantic_schemas/timetable_schema.py
-from pydantic import BaseModel
-from datetime import time
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from datetime import time, date, datetime
+from typing import Any, Dict, Optional, List, Literal
 
 class TimetableCreateRequest(BaseModel):
     start_time: time
     end_time: time
     unit: str
     day: str
+    room: Optional[str] = None
+    lecturer: Optional[str] = None
+    group_name: Optional[str] = None
     
 class TimetableResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # built straight from TimeTable rows
+
     id: int
     start_time: time
     end_time: time
     unit: str
     day: str
-    
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    room: Optional[str] = None
+    lecturer: Optional[str] = None
+    group_name: Optional[str] = None
+
+class ScheduleAlert(BaseModel):
+    minutes_before: int
+    alert_time: str
+
+class ScheduleItem(BaseModel):
+    id: int
+    unit: str
+    start_time: str
+    end_time: str
+    day: str
+    next_alerts: List[ScheduleAlert] = []
+
+class TodaysScheduleResponse(BaseModel):
+    success: bool
+    data: List[ScheduleItem]
+
+class TimetableExceptionCreateRequest(BaseModel):
+    kind: Literal['cancel', 'reschedule']
+    start_date: date
+    end_date: date
+    timetable_id: Optional[int] = None  # None applies to every class (holidays, exam weeks)
+    new_date: Optional[date] = None
+    new_start_time: Optional[time] = None
+    new_end_time: Optional[time] = None
+    reason: Optional[str] = None
+
+class TimetableExceptionResponse(TimetableExceptionCreateRequest):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+
+class ClassOccurrenceResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    timetable_id: int
+    date: date
+    start_time: time
+    end_time: time
+    unit: str
+    status: str
+
+
+class TimetablePageResponse(BaseModel):
+    # rows only carry the fields asked for with ?fields= , so they are plain dicts
+    data: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page , null on the last page
+
+
+class TimetableVersionCreateRequest(BaseModel):
+    name: str
+    copy_active: bool = False  # start from the live timetable's slots instead of an empty draft
+
+class TimetableVersionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    status: str  # draft / published / archived
+    active: bool = False  # the tenant's live timetable
+    published_at: Optional[datetime] = None  # last time it was made live
+    previous_version_id: Optional[int] = None  # what a rollback from it switches back to
+    created_at: Optional[datetime] = None
+
+class TimetableSlotsLoadResponse(BaseModel):
+    version_id: int
+    slots: int
+
+class TimetablePublishResponse(BaseModel):
+    version: TimetableVersionResponse
+    previous_version_id: Optional[int] = None  # null when the unversioned timetable was replaced
+    occurrences: int  # dated classes built for the new version
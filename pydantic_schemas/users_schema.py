@@ -1,6 +1,6 @@
-from pydantic import BaseModel 
+from pydantic import BaseModel , ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import Optional , List
 
 
 # defining the user model in fastapi for effective user management
@@ -15,12 +15,11 @@ class UserCreateRequest(UserBase): # this is for use in creating users
     chessDotComUsername : Optional[str] = None
 
 class UserResponse(UserBase): # this is the general model for response models to the frontend i guess 
+    model_config = ConfigDict(from_attributes = True) # since this is a repsonse model we need from_attributes since its created from the database rather from the dictionary
+
     created_at : datetime
     updated_at : datetime
 
-    class config():
-        orm_model = True # since this is a repsonse model we need to set orm = true since its created from the database rather from the dictionary
-
 class Token(BaseModel):
     access_token : str
     # refresh_tokne : str
@@ -29,4 +28,15 @@ class Token(BaseModel):
 # actually according to what im seeing right now , we can also respond to api calls using other pydantic models for those specific response like this one here for sendiing user data 
 class UserProfileResponse(UserBase):
     account_balance : int
-    
\ No newline at end of file
+    
+
+# bulk provisioning : one response for the whole cohort , rows that could not be created are listed with the reason
+class BulkUserConflict(BaseModel):
+    row : int # position in the request list
+    email : str
+    username : Optional[str] = None
+    reason : str
+
+class BulkUserCreateResponse(BaseModel):
+    created : int
+    conflicts : List[BulkUserConflict]
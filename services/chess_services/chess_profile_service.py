@@ -0,0 +1,240 @@
+# services/chess_services/chess_profile_service.py
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+import httpx
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+class ChessAPIUnavailable(Exception):
+    """
+    chess.com did not answer in time or kept failing , the profile could not be checked
+    """
+
+
+class RetryBudget:
+    """
+    Retries are allowed only while they stay under a fraction of recent requests,
+    so an outage at chess.com does not get multiplied by our own retries
+
+    Args:
+        ratio: Retries allowed per request over the window
+        window: Seconds of history considered
+        min_retries: Retries always allowed in the window, so low traffic can still retry
+    """
+
+    def __init__(self, ratio: float, window: float = 10.0, min_retries: int = 3):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self.requests = deque()
+        self.retries = deque()
+
+    def _trim(self, samples: deque, now: float):
+        while samples and samples[0] < now - self.window:
+            samples.popleft()
+
+    def record_request(self):
+        self.requests.append(time.monotonic())
+
+    def can_retry(self) -> bool:
+        now = time.monotonic()
+        self._trim(self.requests, now)
+        self._trim(self.retries, now)
+        if len(self.retries) >= max(self.min_retries, self.ratio * len(self.requests)):
+            return False
+        self.retries.append(now)
+        return True
+
+
+class ProfileCache:
+    """
+    TTL cache of profile lookups : an in-process LRU in front of redis (when REDIS_URL is set)
+    Not found answers are cached too, for a shorter time
+    """
+
+    MISSING = {'_missing': True}
+
+    def __init__(self, max_size: int, ttl: float, missing_ttl: float, redis_url: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.local: OrderedDict = OrderedDict()  # username -> (expires at, profile)
+        self.redis_url = redis_url
+        self._redis = None
+
+    @property
+    def redis(self):
+        # created on first use so importing the app does not import redis
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+
+    def _name(self, username: str) -> str:
+        return f"chess_profile:{username}"
+
+    async def get(self, username: str):
+        """
+        Returns the cached profile, ProfileCache.MISSING for a cached not found, None when not cached
+        """
+        entry = self.local.get(username)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.local.move_to_end(username)
+                return entry[1]
+            del self.local[username]
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(self._name(username))
+            except Exception as e:
+                logger.warning(f"chess profile cache read failed: {str(e)}")
+                return None
+            if value:
+                profile = json.loads(value)
+                self._set_local(username, profile, self.missing_ttl if profile == self.MISSING else self.ttl)
+                return profile
+        return None
+
+    def _set_local(self, username: str, profile: dict, ttl: float):
+        self.local[username] = (time.monotonic() + ttl, profile)
+        self.local.move_to_end(username)
+        while len(self.local) > self.max_size:
+            self.local.popitem(last=False)
+
+    async def set(self, username: str, profile: Optional[dict]):
+        profile = self.MISSING if profile is None else profile
+        ttl = self.missing_ttl if profile == self.MISSING else self.ttl
+        self._set_local(username, profile, ttl)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._name(username), json.dumps(profile), ex=int(ttl))
+            except Exception as e:
+                logger.warning(f"chess profile cache write failed: {str(e)}")
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.close()
+
+
+class ChessProfileService:
+    """
+    Looks up chess.com player profiles for signup
+
+    One pooled http client with short timeouts, retries under a retry budget, a TTL cache
+    and request coalescing : concurrent lookups of the same username share one call.
+    Signup waits at most CHESS_API_DEADLINE seconds whatever chess.com does.
+
+    Args:
+        base_url: chess.com public api, point it at a local stub in tests
+        transport: Optional httpx transport, e.g. httpx.MockTransport, used instead of the network
+    """
+
+    def __init__(self, base_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        settings = get_settings()
+        self.base_url = base_url or settings.chess_api_base_url
+        self.transport = transport
+        self.user_agent = settings.chess_api_user_agent
+        self.timeout = settings.chess_api_timeout
+        self.deadline = settings.chess_api_deadline
+        self.max_attempts = settings.chess_api_max_attempts
+        self.retry_budget = RetryBudget(settings.chess_api_retry_ratio)
+        self.cache = ProfileCache(
+            max_size=settings.chess_profile_cache_size,
+            ttl=settings.chess_profile_cache_ttl,
+            missing_ttl=settings.chess_profile_missing_ttl,
+            redis_url=settings.redis_url
+        )
+        self.client: Optional[httpx.AsyncClient] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def start(self):
+        # the http client is created here so it lives on the running event loop
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=self.transport,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 2.0)),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                # chess.com asks api users to identify themselves
+                headers={'User-Agent': self.user_agent}
+            )
+
+    async def close(self):
+        for future in list(self._in_flight.values()):
+            future.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        await self.cache.close()
+
+    async def _fetch(self, username: str) -> Optional[dict]:
+        """
+        One profile fetch with retries , None when the player does not exist
+        """
+        await self.start()
+        self.retry_budget.record_request()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = await self.client.get(f"/player/{username}")
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code in (404, 410):
+                    return None
+                if response.status_code not in (429, 500, 502, 503, 504):
+                    raise ChessAPIUnavailable(f"chess.com answered {response.status_code}")
+                error = f"chess.com answered {response.status_code}"
+            except httpx.HTTPError as e:
+                error = f"chess.com request failed: {str(e)}"
+
+            if attempt == self.max_attempts or not self.retry_budget.can_retry():
+                raise ChessAPIUnavailable(error)
+            # jittered exponential backoff
+            await asyncio.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+    async def _lookup(self, username: str) -> Optional[dict]:
+        profile = await self._fetch(username)
+        await self.cache.set(username, profile)
+        return profile
+
+    def _lookup_done(self, username: str, future: asyncio.Future):
+        self._in_flight.pop(username, None)
+        # every waiter may have given up already , mark the error as seen so it is not reported as lost
+        if not future.cancelled():
+            future.exception()
+
+    async def get_profile(self, username: str) -> Optional[dict]:
+        """
+        The chess.com profile of a player
+
+        Returns:
+            dict or None when there is no such player on chess.com
+
+        Raises:
+            ChessAPIUnavailable: chess.com could not be reached within the deadline
+        """
+        username = username.strip().lower()
+        cached = await self.cache.get(username)
+        if cached is not None:
+            return None if cached == ProfileCache.MISSING else cached
+
+        future = self._in_flight.get(username)
+        if future is None:
+            future = asyncio.ensure_future(self._lookup(username))
+            self._in_flight[username] = future
+            future.add_done_callback(lambda done: self._lookup_done(username, done))
+        try:
+            # shield : a caller giving up at its deadline does not cancel the lookup the others are waiting on
+            return await asyncio.wait_for(asyncio.shield(future), self.deadline)
+        except asyncio.TimeoutError:
+            raise ChessAPIUnavailable(f"chess.com did not answer within {self.deadline}s")
+
+# Singleton instance
+chess_profiles = ChessProfileService()
@@ -0,0 +1,158 @@
+# services/event_services/event_bus.py
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Set
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """
+    One connected client with its own bounded queue
+
+    When the client reads slower than events arrive the oldest events are dropped
+    and a 'lagged' event tells it how many it missed, so one slow dashboard never
+    holds up the publishers or the other clients
+    """
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next_event(self, timeout: float) -> Optional[dict]:
+        """
+        Next event for this client, a 'lagged' notice first if some were dropped, None on timeout
+        """
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {'type': 'lagged', 'data': {'dropped': dropped}, 'at': datetime.utcnow().isoformat()}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    """
+    Fans scheduler and delivery events out to connected clients
+
+    With REDIS_URL set every event goes through a redis pub/sub channel so clients
+    connected to any replica see events published by all of them, otherwise the
+    fan-out stays inside this process
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.channel = settings.events_channel
+        self.redis_url = settings.redis_url
+        self.max_queue = settings.events_client_queue
+        self.subscribers: Set[Subscriber] = set()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._redis = None
+
+    def publish(self, event_type: str, **data):
+        """
+        Publish an event, never blocks the caller
+
+        Args:
+            event_type: e.g. scheduler_started, alert_queued, alert_sent, delivery_failed
+            data: JSON serialisable event payload
+        """
+        event = {'type': event_type, 'data': data, 'at': datetime.utcnow().isoformat()}
+        if self._outbox is None:
+            self._fan_out(event)
+            return
+        try:
+            self._outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"Event outbox full, dropping {event_type} event")
+
+    def _fan_out(self, event: dict):
+        for subscriber in list(self.subscribers):
+            subscriber.offer(event)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def start(self):
+        """
+        Start the publisher (and the redis listener when redis is configured)
+        """
+        if self._outbox is not None:
+            return
+        self._outbox = asyncio.Queue(maxsize=get_settings().events_outbox_size)
+        if self.redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(self.redis_url)
+                await self._redis.ping()
+                self._tasks.append(asyncio.create_task(self._listen()))
+            except Exception as e:
+                logger.error(f"Redis not available for events, falling back to local fan-out: {str(e)}")
+                self._redis = None
+        self._tasks.append(asyncio.create_task(self._publish_loop()))
+
+    async def _publish_loop(self):
+        while True:
+            event = await self._outbox.get()
+            if self._redis is None:
+                self._fan_out(event)
+                continue
+            try:
+                await self._redis.publish(self.channel, json.dumps(event, default=str))
+            except Exception as e:
+                # redis hiccup : at least the clients on this replica still get it
+                logger.warning(f"Failed to publish event to redis: {str(e)}")
+                self._fan_out(event)
+
+    async def _listen(self):
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    try:
+                        self._fan_out(json.loads(message['data']))
+                    except ValueError:
+                        logger.warning("Dropping malformed event from redis")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Redis event listener lost its connection, resubscribing: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._outbox = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+# Singleton instance
+event_bus = EventBus()
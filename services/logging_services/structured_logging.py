@@ -0,0 +1,214 @@
+# services/logging_services/structured_logging.py
+# non-blocking , structured logging for the app
+#
+# a log call only builds the record and puts it on a bounded in-memory queue , a background thread
+# formats it ( json by default ) and writes it out , so a slow stdout / log shipper never stalls the
+# event loop. When the queue is full records are dropped and counted instead of waiting.
+#
+#   with log_context(alert_id='3:2025-01-06T08:00'):
+#       logger.info("Alert sent", extra={'recipients': 120})   # extra keys become json fields
+#
+#   log_sampled(logger, 'sms_recipient_result', "SMS recipient result", recipient=phone, status=status)
+import sys
+import json
+import time
+import queue
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from settings import get_settings
+
+try:
+    import orjson
+except ImportError: # orjson is optional , we just fall back to the standard json encoder
+    orjson = None
+
+# correlation ids of whatever is running now ( request_id , alert_id ... ) , copied onto every record
+_context: ContextVar[Dict[str, str]] = ContextVar('log_context', default={})
+
+# attributes every LogRecord has , anything else on a record came from extra= and is emitted as a field
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'context'}
+
+logging_metrics = {
+    'dropped': 0,  # records lost because the queue was full
+    'sampled_out': 0,  # records skipped by log_sampled
+}
+
+
+def current_context() -> Dict[str, str]:
+    return _context.get()
+
+@contextmanager
+def log_context(**ids):
+    """
+    Add correlation ids to every record logged inside the block , nested blocks add to the outer ids
+    """
+    token = _context.set({**_context.get(), **{key: str(value) for key, value in ids.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One json object per line : time , level , logger , message , the correlation ids and any extra fields
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **getattr(record, 'context', {}),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Plain lines for local development , the correlation ids are appended in brackets
+    """
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            line += ' [' + ' '.join(f"{key}={value}" for key, value in context.items()) + ']'
+        return line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never waits : the record is handed over as is , with the correlation ids of
+    the caller attached , and formatting is left to the listener thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # read here , in the caller's task , the listener thread has no context of its own
+        record.context = _context.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            logging_metrics['dropped'] += 1
+
+
+class RateLimitedSampler:
+    """
+    Token bucket per event key : `burst` records at once , then `rate` per second , the rest are skipped
+
+    Args:
+        rate: Records per second let through per key once the burst is used up
+        burst: Records let through at once
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, list] = {}  # key -> [tokens , last refill , skipped since the last one let through]
+
+    def allow(self, key: str) -> Optional[int]:
+        """
+        Returns:
+            Optional[int]: None to skip the record , otherwise how many of this key were skipped before it
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            logging_metrics['sampled_out'] += 1
+            return None
+        bucket[0] -= 1
+        skipped, bucket[2] = bucket[2], 0
+        return skipped
+
+
+_sampler: Optional[RateLimitedSampler] = None
+
+def log_sampled(logger: logging.Logger, key: str, message: str, level: int = logging.INFO, **fields):
+    """
+    Log a high volume event ( one per sms recipient ... ) at a limited rate per key
+
+    The check happens before the record is built , so the skipped ones cost next to nothing.
+    Records that do go out carry `sample` ( the key ) and `skipped` ( how many were skipped since the last one ).
+    """
+    global _sampler
+    if not logger.isEnabledFor(level):
+        return
+    if _sampler is None:
+        settings = get_settings()
+        _sampler = RateLimitedSampler(settings.log_sample_rate, settings.log_sample_burst)
+    skipped = _sampler.allow(key)
+    if skipped is None:
+        return
+    logger.log(level, message, extra={**fields, 'sample': key, 'skipped': skipped})
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_replaced: Dict[str, tuple] = {}  # logger name -> (handlers , propagate) before setup_logging
+
+# uvicorn's loggers write straight to the stream , they go through the queue too
+_UVICORN_LOGGERS = ('uvicorn', 'uvicorn.error', 'uvicorn.access')
+
+def setup_logging():
+    """
+    Route the root and uvicorn loggers through the queue , called once at startup
+    """
+    global _listener
+    if _listener is not None:
+        return
+    settings = get_settings()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if settings.log_format == 'json' else TextFormatter())
+    records = queue.Queue(maxsize=settings.log_queue_size)
+    handler = NonBlockingQueueHandler(records)
+
+    root = logging.getLogger()
+    _replaced[''] = (root.handlers[:], root.propagate)
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+    for name in _UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        _replaced[name] = (uvicorn_logger.handlers[:], uvicorn_logger.propagate)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """
+    Write out what is still queued and put the previous handlers back , called last at shutdown
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    for name, (handlers, propagate) in _replaced.items():
+        replaced = logging.getLogger(name or None)
+        replaced.handlers = handlers
+        replaced.propagate = propagate
+    _replaced.clear()
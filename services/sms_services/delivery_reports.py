@@ -0,0 +1,248 @@
+# services/sms_services/delivery_reports.py
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from db.db_setup import AsyncSessionLocal
+from db.models.model_sms import SMSMessage
+from services.event_services.event_bus import event_bus
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ('Failed', 'Rejected', 'AbsentSubscriber', 'Expired')
+
+class DeliveryReportBuffer:
+    """
+    Buffers sent-message records and provider delivery reports in memory
+    and writes them to sms_messages in batched upserts
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.batch_size = settings.delivery_report_batch_size
+        self.flush_interval = settings.delivery_report_flush_interval
+        self.max_pending = settings.delivery_report_max_pending  # beyond this (db down for long) the oldest rows are dropped
+        self.max_attempts = settings.delivery_report_max_attempts  # a row the database keeps refusing is dropped after this
+        # keyed by provider message id so repeats inside one batch collapse to the latest
+        self._sent: Dict[str, dict] = {}
+        self._reports: Dict[str, dict] = {}
+        self._attempts: Dict[Tuple[str, str], int] = {}  # (sent | reports , message id) of rows refused so far
+        self._flush_now: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._sent) + len(self._reports)
+
+    def add_sent(self, message_id: str, phone: str, status: str, class_id: Optional[int] = None):
+        """
+        Record a message the provider accepted, so later reports can be tied back to the class
+        """
+        self._sent[message_id] = {
+            'provider_message_id': message_id,
+            'phone': phone,
+            'status': status,
+            'class_id': class_id
+        }
+        self._maybe_flush()
+
+    def add_sent_from_response(self, response_data: dict, class_id: Optional[int] = None):
+        """
+        Record every recipient of an Africa's Talking send response
+        """
+        recipients = (response_data or {}).get('SMSMessageData', {}).get('Recipients', [])
+        for recipient in recipients:
+            message_id = recipient.get('messageId')
+            if message_id and message_id != 'None':
+                self.add_sent(message_id, recipient.get('number'), recipient.get('status', 'Sent'), class_id)
+
+    def add_report(self, report: dict):
+        """
+        Queue one delivery report from the provider callback
+        """
+        message_id = report.get('id')
+        if not message_id:
+            return
+        self._reports[message_id] = {
+            'provider_message_id': message_id,
+            'phone': report.get('phoneNumber'),
+            'status': report.get('status', 'Unknown'),
+            'failure_reason': report.get('failureReason') or None,
+            'network_code': report.get('networkCode')
+        }
+        if report.get('status') in FAILED_STATUSES:
+            event_bus.publish(
+                'delivery_failed',
+                message_id=message_id,
+                phone=report.get('phoneNumber'),
+                status=report.get('status'),
+                reason=report.get('failureReason')
+            )
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._sent) + len(self._reports) > self.max_pending:
+            self._drop_oldest()
+        if self.pending >= self.batch_size and self._flush_now is not None:
+            self._flush_now.set()
+
+    def _drop_oldest(self):
+        # dicts keep insertion order , so the first keys are the oldest entries
+        dropped = 0
+        for buffered in (self._sent, self._reports):
+            excess = len(self._sent) + len(self._reports) - self.max_pending
+            for message_id in list(buffered)[:max(excess, 0)]:
+                del buffered[message_id]
+                dropped += 1
+        if dropped:
+            logger.error(f"Delivery report backlog full, dropped {dropped} rows")
+
+    def _chunks(self, buffered: Dict[str, dict], now: datetime):
+        rows = [{**row, 'created_at': now, 'updated_at': now} for row in buffered.values()]
+        for start in range(0, len(rows), self.batch_size):
+            yield rows[start:start + self.batch_size]
+
+    def _statement(self, kind: str, rows: List[dict]):
+        stmt = insert(SMSMessage).values(rows)
+        if kind == 'sent':
+            # a report may already have landed first , keep its status and only fill in the class
+            return stmt.on_conflict_do_update(
+                index_elements=[SMSMessage.provider_message_id],
+                set_={
+                    'class_id': func.coalesce(SMSMessage.class_id, stmt.excluded.class_id),
+                    'phone': func.coalesce(SMSMessage.phone, stmt.excluded.phone)
+                }
+            )
+        return stmt.on_conflict_do_update(
+            index_elements=[SMSMessage.provider_message_id],
+            set_={
+                'status': stmt.excluded.status,
+                'failure_reason': stmt.excluded.failure_reason,
+                'network_code': stmt.excluded.network_code,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+
+    async def _write(self, db, kind: str, rows: List[dict], refused: List[Tuple[str, dict]]) -> int:
+        """
+        Upsert rows in their own transaction , a batch the database refuses is split in halves
+        until the rows that cause it are found , and only those are handed back in refused
+        """
+        try:
+            await db.execute(self._statement(kind, rows))
+            await db.commit()
+        except (IntegrityError, DataError) as e:
+            # a bad row ( e.g. a class deleted meanwhile ) , the rest of the batch is fine
+            await db.rollback()
+            if len(rows) == 1:
+                refused.append((kind, rows[0]))
+                logger.warning(f"Delivery report row {rows[0]['provider_message_id']} refused: {str(e)}")
+                return 0
+            middle = len(rows) // 2
+            return await self._write(db, kind, rows[:middle], refused) + await self._write(db, kind, rows[middle:], refused)
+        for row in rows:
+            self._attempts.pop((kind, row['provider_message_id']), None)
+        return len(rows)
+
+    def _requeue(self, kind: str, rows: List[dict], count_attempt: bool = False):
+        kept = {}
+        for row in rows:
+            message_id = row['provider_message_id']
+            if count_attempt:
+                attempts = self._attempts.get((kind, message_id), 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop((kind, message_id), None)
+                    logger.error(f"Dropped delivery report row after {attempts} attempts: {row}")
+                    continue
+                self._attempts[(kind, message_id)] = attempts
+            kept[message_id] = {key: value for key, value in row.items() if key not in ('created_at', 'updated_at')}
+        # newer entries win
+        if kind == 'sent':
+            self._sent = {**kept, **self._sent}
+        else:
+            self._reports = {**kept, **self._reports}
+
+    async def flush(self) -> int:
+        """
+        Write everything buffered so far as multi-row upserts of at most batch_size rows
+
+        Each batch commits on its own. When the database is unreachable the unwritten batches are put
+        back as they are , rows it refuses are retried up to max_attempts flushes and then dropped
+
+        Returns:
+            int: Number of rows written
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            sent, self._sent = self._sent, {}
+            reports, self._reports = self._reports, {}
+            if not sent and not reports:
+                return 0
+
+            now = datetime.utcnow()
+            batches = [('sent', rows) for rows in self._chunks(sent, now)]
+            batches += [('reports', rows) for rows in self._chunks(reports, now)]
+            refused: List[Tuple[str, dict]] = []
+            written = 0
+            done = 0
+            try:
+                async with AsyncSessionLocal() as db:
+                    for kind, rows in batches:
+                        written += await self._write(db, kind, rows, refused)
+                        done += 1
+            except Exception as e:
+                # not the rows' fault , put back the batches not written for the next flush
+                for kind, rows in batches[done:]:
+                    self._requeue(kind, rows)
+                logger.error(f"Failed to flush delivery reports: {str(e)}")
+            for kind, row in refused:
+                self._requeue(kind, [row], count_attempt=True)
+            if len(self._sent) + len(self._reports) > self.max_pending:
+                self._drop_oldest()
+
+            if written:
+                logger.info(f"Flushed {written} sms status rows")
+            return written
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def start(self):
+        """
+        Start the background flush loop on the running event loop
+        """
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._flush_now = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the flush loop and write whatever is left
+        """
+        if self._task is not None:
+            # let the loop finish its current flush rather than cancelling it half way
+            self._stopping = True
+            self._flush_now.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+# Singleton instance
+delivery_reports = DeliveryReportBuffer()
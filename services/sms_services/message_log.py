@@ -0,0 +1,171 @@
+# services/sms_services/message_log.py
+import asyncio
+import logging
+from datetime import datetime, date
+from typing import List, Optional, Set
+
+from sqlalchemy import insert, text
+
+from db.db_setup import AsyncSessionLocal
+from db.models.model_message_log import MessageLog
+from services.logging_services.structured_logging import log_sampled
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+def next_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+class MessageLogBuffer:
+    """
+    Collects sent messages in memory and appends them to message_log in batched inserts,
+    so the send path only pays for a list append
+    """
+
+    def __init__(self):
+        settings = get_settings()
+        self.batch_size = settings.message_log_batch_size
+        self.flush_interval = settings.message_log_flush_interval
+        self.months_ahead = settings.message_log_months_ahead
+        self.max_pending = settings.message_log_max_pending  # beyond this (db down for long) the oldest rows are dropped
+        self._rows: List[dict] = []
+        self._partitions: Set[date] = set()  # months whose partition is known to exist
+        self._flush_now: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def add_send(self, recipients: List[str], message: str, result: dict, kind: str, tenant_id: int,
+                 class_id: Optional[int] = None, minutes_before: Optional[int] = None):
+        """
+        Record one send, a row per recipient with the status the provider gave it
+
+        Args:
+            recipients: Phone numbers the message went to
+            message: SMS content
+            result: Return value of SMSService.send_sms
+            kind: reminder / immediate / combined / custom
+            tenant_id: School the message was sent for
+            class_id: TimeTable slot the message is about, if any
+            minutes_before: Alert interval, if any
+        """
+        sent_at = datetime.utcnow()
+        per_recipient = {}
+        if result.get('success'):
+            data = result.get('data') or {}
+            for recipient in data.get('SMSMessageData', {}).get('Recipients', []):
+                per_recipient[recipient.get('number')] = recipient
+        for phone in recipients:
+            recipient = per_recipient.get(phone, {})
+            message_id = recipient.get('messageId')
+            self._rows.append({
+                'sent_at': sent_at,
+                'tenant_id': tenant_id,
+                'recipient': phone,
+                'class_id': class_id,
+                'kind': kind,
+                'minutes_before': minutes_before,
+                'provider': result.get('provider'),
+                'provider_message_id': message_id if message_id and message_id != 'None' else None,
+                'status': recipient.get('status', 'Sent') if result.get('success') else 'failed',
+                'message': message
+            })
+            # one record per recipient would flood the logs on a big send , a sample is enough to follow it
+            log_sampled(
+                logger, 'sms_recipient_result', "SMS recipient result",
+                recipient=phone, status=self._rows[-1]['status'], provider=result.get('provider'),
+                kind=kind, class_id=class_id, message_id=self._rows[-1]['provider_message_id']
+            )
+        if len(self._rows) > self.max_pending:
+            dropped = len(self._rows) - self.max_pending
+            del self._rows[:dropped]
+            logger.error(f"Message log backlog full, dropped {dropped} rows")
+        if len(self._rows) >= self.batch_size and self._flush_now is not None:
+            self._flush_now.set()
+
+    async def ensure_partitions(self, db, months: Set[date]):
+        """
+        Create the monthly partitions (postgres only) for the given months plus the ones ahead
+        """
+        if db.get_bind().dialect.name != 'postgresql':
+            return
+        wanted = set()
+        for month in months | {month_start(datetime.utcnow().date())}:
+            for _ in range(self.months_ahead + 1):
+                wanted.add(month)
+                month = next_month(month)
+        for month in sorted(wanted - self._partitions):
+            name = f"message_log_{month.year}_{month.month:02d}"
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF message_log "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            ))
+            self._partitions.add(month)
+            logger.info(f"Message log partition {name} ready")
+
+    async def flush(self) -> int:
+        """
+        Append everything buffered so far in inserts of at most batch_size rows
+
+        Returns:
+            int: Number of rows written
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.ensure_partitions(db, {month_start(row['sent_at'].date()) for row in rows})
+                    for start in range(0, len(rows), self.batch_size):
+                        await db.execute(insert(MessageLog), rows[start:start + self.batch_size])
+                    await db.commit()
+            except Exception as e:
+                # keep them for the next flush , in order
+                self._rows = rows + self._rows
+                logger.error(f"Failed to flush message log: {str(e)}")
+                return 0
+            return len(rows)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def start(self):
+        """
+        Start the background flush loop on the running event loop
+        """
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._flush_now = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop the flush loop and write whatever is left
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._flush_now.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+# Singleton instance
+message_log = MessageLogBuffer()
@@ -0,0 +1,233 @@
+# services/sms_services/providers.py
+import asyncio
+import random
+import logging
+from typing import List, Optional
+
+import httpx
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+class SMSProvider:
+    """
+    Base class for SMS backends
+
+    send() returns the same dict shape everywhere:
+    {'success': bool, 'data': ..., 'message': str} or {'success': False, 'error': str, 'message': str}
+    """
+    name = 'base'
+
+    async def start(self):
+        pass
+
+    async def warm_up(self):
+        await self.start()
+
+    async def close(self):
+        pass
+
+    async def send(self, phone_numbers: List[str], message: str) -> dict:
+        raise NotImplementedError
+
+
+class HTTPSMSProvider(SMSProvider):
+    """
+    Provider talking to an http api through one pooled client
+    """
+    base_url = ''
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def build_client(self) -> httpx.AsyncClient:
+        raise NotImplementedError
+
+    async def start(self):
+        # the http client is created here so it lives on the running event loop
+        if self.client is None:
+            self.client = self.build_client()
+
+    async def warm_up(self):
+        """
+        Open a connection to the provider so the first alert does not pay for dns + tls
+        """
+        await self.start()
+        try:
+            await self.client.head(self.base_url)
+        except httpx.HTTPError as e:
+            logger.warning(f"{self.name} client warm up failed: {str(e)}")
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+class AfricasTalkingProvider(HTTPSMSProvider):
+    """
+    Africa's Talking bulk messaging api
+    """
+    name = 'africastalking'
+
+    def __init__(self):
+        super().__init__()
+        settings = get_settings()
+        self.api_key = settings.africas_talking_api_key
+        # "sandbox" + the sandbox url for testing, set both for production
+        self.username = settings.africas_talking_username
+        self.base_url = settings.africas_talking_base_url
+
+        if not self.api_key:
+            raise ValueError("AFRICAS_TALKING_API_KEY not found in environment variables")
+
+        self.headers = {
+            'apiKey': self.api_key,
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json'
+        }
+
+    def build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+    async def send(self, phone_numbers: List[str], message: str) -> dict:
+        await self.start()
+        payload = {
+            'username': self.username,
+            'to': ','.join(phone_numbers),  # Join phone numbers with commas for bulk SMS
+            'message': message
+        }
+        response = await self.client.post(self.base_url, data=payload)
+
+        if response.status_code == 201:
+            return {
+                'success': True,
+                'data': response.json(),
+                'message': 'SMS sent successfully'
+            }
+        return {
+            'success': False,
+            'error': f"API Error: {response.status_code}",
+            'message': response.text
+        }
+
+
+class TwilioProvider(HTTPSMSProvider):
+    """
+    Twilio messages api, one request per recipient
+    """
+    name = 'twilio'
+
+    def __init__(self):
+        super().__init__()
+        settings = get_settings()
+        self.account_sid = settings.twilio_account_sid
+        self.auth_token = settings.twilio_auth_token
+        self.from_number = settings.twilio_from_number
+
+        if not (self.account_sid and self.auth_token and self.from_number):
+            raise ValueError("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER must be set")
+
+        self.base_url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+
+    def build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            auth=(self.account_sid, self.auth_token),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+    async def send(self, phone_numbers: List[str], message: str) -> dict:
+        await self.start()
+        # one recipient's timeout must not fail the others , they were sent and a retry would send them twice
+        responses = await asyncio.gather(*(
+            self.client.post(self.base_url, data={'To': phone, 'From': self.from_number, 'Body': message})
+            for phone in phone_numbers
+        ), return_exceptions=True)
+        failed = [r for r in responses if isinstance(r, Exception) or r.status_code not in (200, 201)]
+        for phone, response in zip(phone_numbers, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Twilio send to {phone} failed: {str(response)}")
+        if len(failed) == len(responses):
+            if isinstance(failed[0], Exception):
+                return {
+                    'success': False,
+                    'error': str(failed[0]),
+                    'message': 'Failed to send SMS due to an internal error'
+                }
+            return {
+                'success': False,
+                'error': f"API Error: {failed[0].status_code}",
+                'message': failed[0].text
+            }
+        return {
+            'success': True,
+            'data': {'sent': len(responses) - len(failed), 'failed': len(failed)},
+            'message': 'SMS sent successfully'
+        }
+
+
+class FakeSMSProvider(SMSProvider):
+    """
+    Local provider for tests and development, keeps every message in memory
+
+    Args:
+        name: Provider name used in metrics
+        latency: Seconds each send takes
+        failure_rate: Fraction of sends that fail (0 - 1)
+    """
+
+    def __init__(self, name: str = 'fake', latency: float = 0.0, failure_rate: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[dict] = []
+
+    async def send(self, phone_numbers: List[str], message: str) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            return {
+                'success': False,
+                'error': 'Fake provider failure',
+                'message': 'Simulated failure'
+            }
+        self.sent.append({'to': list(phone_numbers), 'message': message})
+        message_id = len(self.sent)
+        return {
+            'success': True,
+            'data': {'SMSMessageData': {'Recipients': [
+                {'number': phone, 'status': 'Success', 'messageId': f"fake-{message_id}-{i}"}
+                for i, phone in enumerate(phone_numbers)
+            ]}},
+            'message': 'SMS sent successfully'
+        }
+
+
+PROVIDERS = {
+    'africastalking': AfricasTalkingProvider,
+    'twilio': TwilioProvider,
+    'fake': FakeSMSProvider,
+}
+
+def build_providers(names: Optional[str] = None) -> List[SMSProvider]:
+    """
+    Build the providers listed in SMS_PROVIDERS (comma separated, in priority order)
+    Providers that are not configured are skipped with a warning
+    """
+    names = names or get_settings().sms_providers
+    providers = []
+    for name in (n.strip().lower() for n in names.split(',') if n.strip()):
+        provider_class = PROVIDERS.get(name)
+        if provider_class is None:
+            logger.warning(f"Unknown SMS provider '{name}'")
+            continue
+        try:
+            providers.append(provider_class())
+        except ValueError as e:
+            logger.warning(f"SMS provider '{name}' is not configured: {str(e)}")
+    return providers
@@ -0,0 +1,211 @@
+# services/sms_services/sms_router.py
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import List, Optional
+
+from services.sms_services.providers import SMSProvider
+from services.tracing_services.tracing import tracer
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class ProviderHealth:
+    """
+    Rolling latency / error window and circuit breaker for one provider
+    """
+
+    def __init__(self, window: int, failure_threshold: int, cooldown: float, max_age: float):
+        self.samples = deque(maxlen=window)  # (recorded at, latency seconds, ok)
+        self.max_age = max_age  # older samples stop counting so a recovered provider gets its traffic back
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((time.monotonic(), latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+            self.state = CLOSED
+        else:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def record_latency(self, latency: float):
+        """
+        A latency sample with no outcome , for an attempt cancelled before it finished ( a hedge loser ).
+        It counts toward p95 so a slow provider stops being ranked first , the breaker is left alone
+        """
+        self.samples.append((time.monotonic(), latency, True))
+
+    def available(self) -> bool:
+        """
+        Closed circuits take traffic, open ones let a single trial through after the cooldown
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.trial_in_flight
+        return self.state == CLOSED
+
+    def recent(self) -> List[tuple]:
+        cutoff = time.monotonic() - self.max_age
+        return [(latency, ok) for at, latency, ok in self.samples if at >= cutoff]
+
+    @property
+    def error_rate(self) -> float:
+        samples = self.recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, ok in samples if not ok) / len(samples)
+
+    @property
+    def p95_latency(self) -> float:
+        samples = self.recent()
+        if not samples:
+            return 0.0
+        latencies = sorted(latency for latency, _ in samples)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def snapshot(self) -> dict:
+        return {
+            'state': self.state,
+            'samples': len(self.recent()),
+            'error_rate': round(self.error_rate, 3),
+            'p95_latency': round(self.p95_latency, 3),
+            'consecutive_failures': self.consecutive_failures
+        }
+
+
+class SMSRouter:
+    """
+    Sends through the healthiest provider, failing over in priority order and
+    optionally hedging time-critical sends onto a second provider
+    """
+
+    def __init__(self, providers: List[SMSProvider]):
+        self.providers = providers
+        settings = get_settings()
+        self.slow_threshold = settings.sms_slow_threshold
+        self.hedge_delay = settings.sms_hedge_delay
+        self.health = {
+            provider.name: ProviderHealth(
+                window=settings.sms_health_window,
+                failure_threshold=settings.sms_breaker_failures,
+                cooldown=settings.sms_breaker_cooldown,
+                max_age=settings.sms_health_max_age
+            )
+            for provider in providers
+        }
+
+    def ranked(self) -> List[SMSProvider]:
+        """
+        Providers that may take traffic, healthy ones first then degraded, keeping priority order inside each group
+        """
+        def degraded(provider: SMSProvider) -> bool:
+            health = self.health[provider.name]
+            return health.p95_latency > self.slow_threshold or health.error_rate > 0.5
+
+        available = [p for p in self.providers if self.health[p.name].available()]
+        return sorted(available, key=degraded)
+
+    async def _attempt(self, provider: SMSProvider, phone_numbers: List[str], message: str) -> dict:
+        health = self.health[provider.name]
+        if health.state == HALF_OPEN:
+            health.trial_in_flight = True
+        started = time.monotonic()
+        # the provider http call , hedged attempts run as tasks and still land under the sms.send span
+        with tracer.span('sms.provider', provider=provider.name, circuit=health.state) as span:
+            try:
+                result = await provider.send(phone_numbers, message)
+            except asyncio.CancelledError:
+                # a hedge loser , not the provider's fault , but it was at least this slow
+                health.trial_in_flight = False
+                health.record_latency(time.monotonic() - started)
+                span.set(cancelled=True)
+                raise
+            except Exception as e:
+                logger.error(f"Exception sending through {provider.name}: {str(e)}")
+                result = {
+                    'success': False,
+                    'error': str(e),
+                    'message': 'Failed to send SMS due to an internal error'
+                }
+            span.set(success=result['success'])
+            if not result['success']:
+                span.error = str(result.get('error'))
+        health.record(time.monotonic() - started, result['success'])
+        result['provider'] = provider.name
+        return result
+
+    async def send(self, phone_numbers: List[str], message: str, hedge: bool = False) -> dict:
+        """
+        Send through the best provider, trying the next one when it fails
+
+        Args:
+            phone_numbers: Formatted recipients
+            message: SMS content
+            hedge: Start the next provider too if the first has not answered within the hedge delay.
+                Only for time-critical alerts: if both providers answer, recipients can get the message twice.
+
+        Returns:
+            dict: Result of the first successful provider, or the last failure
+        """
+        candidates = self.ranked()
+        if not candidates:
+            return {
+                'success': False,
+                'error': 'No SMS provider available',
+                'message': 'All SMS providers are failing, circuits are open'
+            }
+
+        if hedge and len(candidates) > 1:
+            return await self._send_hedged(candidates, phone_numbers, message)
+
+        result = None
+        for provider in candidates:
+            result = await self._attempt(provider, phone_numbers, message)
+            if result['success']:
+                return result
+            logger.warning(f"SMS provider {provider.name} failed, trying the next one")
+        return result
+
+    async def _send_hedged(self, candidates: List[SMSProvider], phone_numbers: List[str], message: str) -> dict:
+        primary, backups = candidates[0], candidates[1:]
+        delay = self.hedge_delay
+        pending = {asyncio.create_task(self._attempt(primary, phone_numbers, message))}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=delay if backups else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    result = task.result()
+                    if result['success']:
+                        return result
+                # slow or failed : bring in the next provider
+                if backups:
+                    backup = backups.pop(0)
+                    logger.warning(f"Hedging SMS send onto {backup.name}")
+                    pending.add(asyncio.create_task(self._attempt(backup, phone_numbers, message)))
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        return {name: health.snapshot() for name, health in self.health.items()}
@@ -1,77 +1,100 @@
 # services/sms_services/sms_service.py
-import os
-import requests
+import asyncio
 import logging
 from typing import List, Optional
-from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
-load_dotenv()
+from services.sms_services.providers import SMSProvider, build_providers
+from services.sms_services.sms_router import SMSRouter
+from settings import get_settings
+from services.tracing_services.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
-class AfricasTalkingSMSService:
+class SMSService:
     """
-    Service for sending SMS messages using Africa's Talking API
+    Service for sending SMS messages through the configured providers
+    (Africa's Talking first by default) with latency-aware failover
     """
     
-    def __init__(self):
-        self.api_key = os.getenv('AFRICAS_TALKING_API_KEY')
-        self.username = "sandbox"  # Use "sandbox" for testing, change to your username for production
-        self.base_url = "https://api.sandbox.africastalking.com/version1/messaging"  # Sandbox URL
-        # For production, use: https://api.africastalking.com/version1/messaging
+    def __init__(self, providers: Optional[List[SMSProvider]] = None):
+        providers = providers if providers is not None else build_providers()
+        if not providers:
+            raise ValueError("No SMS provider is configured, check SMS_PROVIDERS and the provider credentials")
         
-        if not self.api_key:
-            raise ValueError("AFRICAS_TALKING_API_KEY not found in environment variables")
+        self.providers = providers
+        self.router = SMSRouter(providers)
+        self._in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
+    
+    async def start(self):
+        """
+        Create the providers' pooled http clients
+        """
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            self._idle.set()
+        for provider in self.providers:
+            await provider.start()
+    
+    async def warm_up(self):
+        """
+        Open a connection to every provider so the first alert does not pay for dns + tls
+        """
+        await self.start()
+        await asyncio.gather(*(provider.warm_up() for provider in self.providers))
+    
+    async def drain(self, timeout: float) -> bool:
+        """
+        Wait for in-flight sends to finish
         
-        self.headers = {
-            'apiKey': self.api_key,
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json'
-        }
+        Args:
+            timeout: Seconds to wait before giving up
+            
+        Returns:
+            bool: True if every send finished in time
+        """
+        if self._idle is None:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._in_flight} SMS sends still in flight after {timeout}s")
+            return False
+    
+    async def close(self):
+        """
+        Close the providers' http clients and their pooled connections
+        """
+        for provider in self.providers:
+            await provider.close()
     
-    async def send_sms(self, phone_numbers: List[str], message: str) -> dict:
+    async def send_sms(self, phone_numbers: List[str], message: str, hedge: bool = False) -> dict:
         """
         Send SMS to multiple phone numbers
         
         Args:
             phone_numbers: List of phone numbers (format: +254XXXXXXXXX)
             message: SMS message content
+            hedge: Also start a backup provider if the first one is slow (time-critical alerts)
             
         Returns:
-            dict: Response from Africa's Talking API
+            dict: Result from the provider that sent it, with its name under 'provider'
         """
+        await self.start()
+        self._in_flight += 1
+        self._idle.clear()
         try:
-            # Join phone numbers with commas for bulk SMS
-            recipients = ','.join(phone_numbers)
-            
-            payload = {
-                'username': self.username,
-                'to': recipients,
-                'message': message
-            }
-            
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                data=payload
-            )
-            
-            if response.status_code == 201:
-                result = response.json()
-                logger.info(f"SMS sent successfully: {result}")
-                return {
-                    'success': True,
-                    'data': result,
-                    'message': 'SMS sent successfully'
-                }
+            with tracer.span('sms.send', recipients=len(phone_numbers), hedge=hedge) as span:
+                result = await self.router.send(phone_numbers, message, hedge=hedge)
+                span.set(provider=result.get('provider'), success=result['success'])
+            if result['success']:
+                logger.info(f"SMS sent successfully through {result['provider']}",
+                            extra={'provider': result['provider'], 'recipients': len(phone_numbers)})
             else:
-                logger.error(f"Failed to send SMS: {response.status_code} - {response.text}")
-                return {
-                    'success': False,
-                    'error': f"API Error: {response.status_code}",
-                    'message': response.text
-                }
+                logger.error(f"Failed to send SMS: {result.get('error')} - {result['message']}")
+            return result
                 
         except Exception as e:
             logger.error(f"Exception in send_sms: {str(e)}")
@@ -80,6 +103,10 @@ class AfricasTalkingSMSService:
                 'error': str(e),
                 'message': 'Failed to send SMS due to an internal error'
             }
+        finally:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.set()
     
     def format_phone_number(self, phone: str) -> str:
         """
@@ -109,6 +136,14 @@ class AfricasTalkingSMSService:
         # Default: assume it's a Kenyan number
         return f"+254{clean_phone}"
     
+    def format_time_until(self, minutes_before: int) -> str:
+        """
+        Human readable lead time, e.g. "2 hours" or "5 minutes"
+        """
+        if minutes_before >= 60:
+            return f"{minutes_before // 60} hour{'s' if minutes_before > 60 else ''}"
+        return f"{minutes_before} minute{'s' if minutes_before > 1 else ''}"
+    
     def generate_class_reminder_message(self, unit: str, start_time: str, 
                                       end_time: str, minutes_before: int) -> str:
         """
@@ -123,10 +158,7 @@ class AfricasTalkingSMSService:
         Returns:
             str: Formatted message
         """
-        if minutes_before >= 60:
-            time_text = f"{minutes_before // 60} hour{'s' if minutes_before > 60 else ''}"
-        else:
-            time_text = f"{minutes_before} minute{'s' if minutes_before > 1 else ''}"
+        time_text = self.format_time_until(minutes_before)
         
         message = (
             f"📚 Class Reminder!\n\n"
@@ -159,6 +191,46 @@ class AfricasTalkingSMSService:
         )
         
         return message
+    
+    def generate_combined_class_message(self, classes: List[tuple]) -> str:
+        """
+        Generate one message for several classes due at the same time
+        
+        Args:
+            classes: (unit, start_time, end_time, minutes_before) for each class
+            
+        Returns:
+            str: Formatted combined message
+        """
+        urgent = any(minutes_before <= 10 for *_, minutes_before in classes)
+        header = "🚨 URGENT: Classes Starting Soon!" if urgent else "📚 Class Reminder!"
+        
+        lines = []
+        for unit, start_time, end_time, minutes_before in classes:
+            if minutes_before <= 10:
+                lines.append(f"- {unit} {start_time} - {end_time} (starting now)")
+            else:
+                lines.append(f"- {unit} {start_time} - {end_time} (in {self.format_time_until(minutes_before)})")
+        
+        message = (
+            f"{header}\n\n"
+            + "\n".join(lines)
+            + "\n\nPlease be prepared and on time. 👨‍🏫"
+        )
+        
+        return message
+
+# Singleton instance, built on first use so missing credentials do not break imports
+_sms_service: Optional[SMSService] = None
 
-# Singleton instance
-sms_service = AfricasTalkingSMSService()
\ No newline at end of file
+def get_sms_service() -> SMSService:
+    """
+    Get the shared SMS service, creating it on first call
+    
+    Raises:
+        ValueError: If no SMS provider is configured
+    """
+    global _sms_service
+    if _sms_service is None:
+        _sms_service = SMSService()
+    return _sms_service
\ No newline at end of file
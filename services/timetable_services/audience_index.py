@@ -0,0 +1,177 @@
+# services/timetable_services/audience_index.py
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models.model_student import Student, INTERVAL_BITS, ALL_INTERVALS
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+QUIET_BUCKET_MINUTES = 15  # quiet hours are matched at quarter hour resolution
+QUIET_BUCKETS = 24 * 60 // QUIET_BUCKET_MINUTES
+
+def quiet_buckets(start: int, end: int) -> List[int]:
+    """
+    Buckets covered by quiet hours from minute start to minute end , wrapping past midnight
+
+    A bucket only partly inside the range counts as quiet , so an end of 06:50 covers 06:45 - 07:00
+    and no alert is sent inside the quiet hours
+    """
+    first = (start // QUIET_BUCKET_MINUTES) % QUIET_BUCKETS
+    last = -(-end // QUIET_BUCKET_MINUTES) % QUIET_BUCKETS  # first bucket after the range
+    if first == last:
+        if start == end:
+            return [first]
+        # the range starts and ends inside the same bucket the other way round , all day
+        return list(range(QUIET_BUCKETS))
+    if first < last:
+        return list(range(first, last))
+    return list(range(first, QUIET_BUCKETS)) + list(range(0, last))
+
+
+class AudienceIndex:
+    """
+    Bitset index over one tenant's student alert preferences
+
+    Every student gets a bit position, and each preference is one python int used as
+    a bitset : a bitset per alert interval, one for opted out students and one per
+    quarter hour of the day for quiet hours. Picking the audience for an alert is a
+    handful of big-int and/not operations however many students there are , only the
+    final bits are turned back into phone numbers.
+
+    Args:
+        tenant_id: School whose students are indexed
+        ttl: Seconds before the index is reloaded, so preference changes made on other replicas show up
+    """
+
+    def __init__(self, tenant_id: int, ttl: Optional[float] = None):
+        self.tenant_id = tenant_id
+        self.ttl = ttl if ttl is not None else get_settings().audience_index_ttl
+        self.phones: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.everyone = 0
+        self.interval_masks: Dict[int, int] = {}
+        self.opted_out = 0
+        self.quiet: List[int] = [0] * QUIET_BUCKETS
+        self.loaded_at: Optional[float] = None
+
+    def build(self, rows: List[tuple]):
+        """
+        Build the bitsets from (phone, alert_mask, quiet_start, quiet_end, opted_out) rows
+        """
+        self.phones = []
+        self.positions = {}
+        interval_masks = {minutes: 0 for minutes in INTERVAL_BITS}
+        opted_out = 0
+        quiet_groups: Dict[tuple, int] = {}
+
+        for phone, alert_mask, quiet_start, quiet_end, is_opted_out in rows:
+            if phone in self.positions:
+                continue
+            bit = 1 << len(self.phones)
+            self.positions[phone] = len(self.phones)
+            self.phones.append(phone)
+            for minutes, interval_bit in INTERVAL_BITS.items():
+                if alert_mask & interval_bit:
+                    interval_masks[minutes] |= bit
+            if is_opted_out:
+                opted_out |= bit
+            if quiet_start is not None and quiet_end is not None:
+                # students sharing the same quiet hours are merged first , there are only a few distinct ranges
+                quiet_groups[(quiet_start, quiet_end)] = quiet_groups.get((quiet_start, quiet_end), 0) | bit
+
+        quiet = [0] * QUIET_BUCKETS
+        for (quiet_start, quiet_end), group in quiet_groups.items():
+            for bucket in quiet_buckets(quiet_start, quiet_end):
+                quiet[bucket] |= group
+
+        self.everyone = (1 << len(self.phones)) - 1
+        self.interval_masks = interval_masks
+        self.opted_out = opted_out
+        self.quiet = quiet
+        self.loaded_at = time.monotonic()
+
+    async def load(self, db: AsyncSession, format_phone: Callable[[str], str]):
+        result = await db.execute(
+            select(
+                Student.phone,
+                Student.alert_mask,
+                Student.quiet_start,
+                Student.quiet_end,
+                Student.opted_out
+            ).where(Student.tenant_id == self.tenant_id, Student.active == True).order_by(Student.id)
+        )
+        self.build([(format_phone(row[0]), *row[1:]) for row in result.all()])
+        logger.info(f"Audience index of tenant {self.tenant_id} loaded with {len(self.phones)} students")
+
+    async def ensure_loaded(self, db: AsyncSession, format_phone: Callable[[str], str]):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl:
+            await self.load(db, format_phone)
+
+    def _phones_for(self, mask: int) -> List[str]:
+        phones = self.phones
+        bits = bin(mask)[:1:-1]  # least significant bit first
+        return [phones[i] for i, set_bit in enumerate(bits) if set_bit == '1']
+
+    def mask_for(self, minutes_before: Optional[int], at: datetime) -> int:
+        """
+        Bitset of the students who should get an alert for this interval at this time
+        None as the interval means any message , only opt outs and quiet hours apply
+        """
+        mask = self.everyone & ~self.opted_out
+        if minutes_before is not None:
+            mask &= self.interval_masks.get(minutes_before, self.everyone)
+        bucket = (at.hour * 60 + at.minute) // QUIET_BUCKET_MINUTES
+        return mask & ~self.quiet[bucket]
+
+    def audience(self, minutes_before: Optional[int], at: datetime) -> List[str]:
+        return self._phones_for(self.mask_for(minutes_before, at))
+
+    def subscribed(self) -> List[str]:
+        """
+        Everyone who has not opted out , for messages that ignore intervals and quiet hours
+        """
+        return self._phones_for(self.everyone & ~self.opted_out)
+
+    def update(self, phone: str, alert_mask: int = ALL_INTERVALS, quiet_start: Optional[int] = None,
+               quiet_end: Optional[int] = None, opted_out: bool = False):
+        """
+        Apply one student's new preferences in place , without waiting for the next reload
+        """
+        position = self.positions.get(phone)
+        if position is None:
+            # a student the index has not seen yet , picked up on the next reload
+            self.loaded_at = None
+            return
+        bit = 1 << position
+        for minutes, interval_bit in INTERVAL_BITS.items():
+            if alert_mask & interval_bit:
+                self.interval_masks[minutes] |= bit
+            else:
+                self.interval_masks[minutes] &= ~bit
+        if opted_out:
+            self.opted_out |= bit
+        else:
+            self.opted_out &= ~bit
+        covered = set()
+        if quiet_start is not None and quiet_end is not None:
+            covered = set(quiet_buckets(quiet_start, quiet_end))
+        for bucket in range(QUIET_BUCKETS):
+            if bucket in covered:
+                self.quiet[bucket] |= bit
+            else:
+                self.quiet[bucket] &= ~bit
+
+    def set_opted_out(self, phone: str, opted_out: bool):
+        position = self.positions.get(phone)
+        if position is None:
+            return
+        if opted_out:
+            self.opted_out |= 1 << position
+        else:
+            self.opted_out &= ~(1 << position)
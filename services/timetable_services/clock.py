@@ -0,0 +1,51 @@
+# services/timetable_services/clock.py
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class SystemClock:
+    """
+    Wall clock used by the scheduler in production
+    """
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def sleep(self, seconds: float, stop_event: asyncio.Event):
+        """
+        Wait for the next tick, waking up early if the scheduler is asked to stop
+        """
+        try:
+            await asyncio.wait_for(stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+class SimulatedClock:
+    """
+    Clock for replays: sleeping moves time forward instantly
+
+    Args:
+        start: Simulated time the replay begins at
+        until: When set, the scheduler is stopped once the clock gets there
+    """
+
+    def __init__(self, start: datetime, until: Optional[datetime] = None):
+        self.current = start
+        self.until = until
+        self.ticks = 0
+
+    def now(self) -> datetime:
+        return self.current
+
+    async def sleep(self, seconds: float, stop_event: asyncio.Event):
+        self.current += timedelta(seconds=seconds)
+        self.ticks += 1
+        if self.until is not None and self.current >= self.until:
+            stop_event.set()
+        # still yield so other tasks on the loop get to run between ticks
+        await asyncio.sleep(0)
+
+# Shared default
+system_clock = SystemClock()
@@ -0,0 +1,140 @@
+# services/timetable_services/conflict_service.py
+import heapq
+import logging
+from collections import defaultdict
+from datetime import time
+from typing import List, Dict, Tuple, Optional, Iterable
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models.model_timetable import TimeTable
+from db.models.model_timetable_version import ACTIVE_VERSION, version_clause
+
+logger = logging.getLogger(__name__)
+
+# slot fields that may not be double booked
+RESOURCES = ('room', 'lecturer', 'group_name')
+
+
+class Slot:
+    """
+    Light view of a timetable slot, either an existing row or an incoming one
+    """
+    __slots__ = ('ref', 'day', 'start_time', 'end_time', 'unit', 'resources', 'existing')
+
+    def __init__(self, ref, day: str, start_time: time, end_time: time, unit: str,
+                 resources: Dict[str, Optional[str]], existing: bool):
+        self.ref = ref  # row id for existing slots, position in the request for new ones
+        self.day = day.strip().lower()
+        self.start_time = start_time
+        self.end_time = end_time
+        self.unit = unit
+        self.resources = resources
+        self.existing = existing
+
+    @classmethod
+    def from_row(cls, row: TimeTable) -> 'Slot':
+        return cls(row.id, row.day, row.start_time, row.end_time, row.unit,
+                   {r: getattr(row, r) for r in RESOURCES}, True)
+
+    @classmethod
+    def from_request(cls, index: int, data: dict) -> 'Slot':
+        return cls(index, data['day'], data['start_time'], data['end_time'], data['unit'],
+                   {r: data.get(r) for r in RESOURCES}, False)
+
+    def describe(self) -> dict:
+        return {
+            'id' if self.existing else 'index': self.ref,
+            'unit': self.unit,
+            'day': self.day,
+            'start_time': self.start_time.strftime('%H:%M'),
+            'end_time': self.end_time.strftime('%H:%M')
+        }
+
+
+def find_conflicts(slots: Iterable[Slot], only_new: bool = True) -> List[dict]:
+    """
+    Find every pair of overlapping slots that share a day and a resource
+
+    Slots are bucketed per (day, resource, value) and each bucket is swept in start
+    time order keeping the slots that are still open, so the cost is O(n log n + k)
+    for k clashes instead of comparing every pair
+
+    Args:
+        slots: Existing and incoming slots
+        only_new: Skip clashes between two existing slots (they are already stored)
+
+    Returns:
+        List[dict]: One entry per clash
+    """
+    buckets: Dict[Tuple[str, str, str], List[Slot]] = defaultdict(list)
+    for slot in slots:
+        for resource, value in slot.resources.items():
+            if value:
+                buckets[(slot.day, resource, value.strip().lower())].append(slot)
+
+    conflicts = []
+    for (day, resource, value), bucket in buckets.items():
+        if len(bucket) < 2:
+            continue
+        bucket.sort(key=lambda s: (s.start_time, s.end_time))
+        active: List[Tuple[time, int, Slot]] = []  # heap of open slots keyed on end time
+        for position, slot in enumerate(bucket):
+            # drop slots that ended before this one starts ( touching end/start is not a clash )
+            while active and active[0][0] <= slot.start_time:
+                heapq.heappop(active)
+            for _, _, other in active:
+                if only_new and other.existing and slot.existing:
+                    continue
+                conflicts.append({
+                    'resource': resource,
+                    'value': value,
+                    'day': day,
+                    'slot': slot.describe(),
+                    'conflicts_with': other.describe()
+                })
+            heapq.heappush(active, (slot.end_time, position, slot))
+    return conflicts
+
+
+def find_invalid_slots(slots: Iterable[Slot]) -> List[dict]:
+    """
+    Slots that end before they start
+    """
+    return [
+        {'slot': slot.describe(), 'error': 'end_time must be after start_time'}
+        for slot in slots if slot.end_time <= slot.start_time
+    ]
+
+
+async def check_new_slots(db: AsyncSession, new_slots: List[dict], tenant_id: int,
+                          version_id=ACTIVE_VERSION) -> List[dict]:
+    """
+    Validate a batch of incoming slots against each other and the tenant's stored timetable in one pass
+
+    Args:
+        db: Database session
+        new_slots: Incoming slot dicts (TimetableCreateRequest.model_dump())
+        tenant_id: School the slots are added to , other schools' rooms and lecturers never clash with them
+        version_id: Timetable version the slots are added to , the live one by default
+
+    Returns:
+        List[dict]: Every problem found, empty when the batch can be written
+    """
+    incoming = [Slot.from_request(i, data) for i, data in enumerate(new_slots)]
+    problems = find_invalid_slots(incoming)
+
+    days = {slot.day for slot in incoming}
+    query = select(TimeTable).where(
+        TimeTable.tenant_id == tenant_id,
+        version_clause(TimeTable, version_id),
+        func.lower(func.trim(TimeTable.day)).in_(days)
+    )
+    existing = [Slot.from_row(row) for row in (await db.execute(query)).scalars().all()]
+
+    problems.extend(find_conflicts(existing + incoming))
+    if problems:
+        logger.info(f"Timetable batch of {len(incoming)} slots rejected with {len(problems)} problems")
+    return problems
@@ -0,0 +1,255 @@
+# services/timetable_services/occurrence_service.py
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from sqlalchemy import delete, insert, or_, func, lambda_stmt
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models.model_timetable import TimeTable, WEEKDAYS
+from db.models.model_occurrence import ClassOccurrence, TimetableException
+from db.models.model_tenant import Tenant
+from db.models.model_timetable_version import ACTIVE_VERSION, version_clause
+from services.timetable_services.clock import system_clock
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def expand_slot(slot: TimeTable, from_date: date, until: date,
+                exceptions: Iterable[TimetableException]) -> List[dict]:
+    """
+    Expand one weekly slot into dated occurrence rows and apply the exception rules
+
+    Args:
+        slot: Weekly TimeTable slot
+        from_date: First date of the window (inclusive)
+        until: End of the window (exclusive)
+        exceptions: Exceptions that may apply to this slot
+
+    Returns:
+        List[dict]: Rows ready for a bulk insert into class_occurrences
+    """
+    weekday = WEEKDAYS.get(slot.day.strip().lower())
+    if weekday is None:
+        logger.warning(f"Timetable slot {slot.id} has an unknown day '{slot.day}'")
+        return []
+
+    # The school's global rules (holidays, exam weeks) first so a slot's own rule can override them
+    rules = sorted(
+        (
+            e for e in exceptions
+            if (e.timetable_id is None and e.tenant_id == slot.tenant_id) or e.timetable_id == slot.id
+        ),
+        key=lambda e: (e.timetable_id is not None, e.id or 0)
+    )
+
+    rows = []
+    current = from_date + timedelta(days=(weekday - from_date.weekday()) % 7)
+    while current < until:
+        row = {
+            'tenant_id': slot.tenant_id,
+            'timetable_id': slot.id,
+            'version_id': slot.version_id,
+            'original_date': current,
+            'date': current,
+            'start_time': slot.start_time,
+            'end_time': slot.end_time,
+            'unit': slot.unit,
+            'status': 'scheduled'
+        }
+        for rule in rules:
+            if not (rule.start_date <= current <= rule.end_date):
+                continue
+            if rule.kind == 'cancel':
+                row['status'] = 'cancelled'
+            elif rule.kind == 'reschedule' and rule.timetable_id == slot.id:
+                row['date'] = rule.new_date or current
+                row['start_time'] = rule.new_start_time or slot.start_time
+                row['end_time'] = rule.new_end_time or slot.end_time
+                row['status'] = 'rescheduled'
+        rows.append(row)
+        current += timedelta(days=7)
+    return rows
+
+
+class OccurrenceEngine:
+    """
+    Materialises weekly timetable slots into dated class_occurrences rows
+
+    Only each tenant's active timetable version is kept materialised , a version being published
+    is built in full just before the switch ( see version_service )
+    """
+
+    def __init__(self, horizon_days: Optional[int] = None, clock=None):
+        self.horizon_days = horizon_days or get_settings().occurrence_horizon_days
+        self.clock = clock or system_clock
+        # (tenant id , version id) -> end of its materialised window , a newly published version is
+        # simply a key not seen yet , nothing has to be invalidated when the pointer moves
+        self.materialised_until: Dict[Tuple[int, Optional[int]], date] = {}
+        self.active_versions: Dict[int, Optional[int]] = {}  # tenant id -> version seen on the last tick
+
+    async def materialise(self, db: AsyncSession, timetable_ids: Optional[List[int]] = None,
+                          from_date: Optional[date] = None, until: Optional[date] = None,
+                          tenant_ids: Optional[List[int]] = None, version_id=ACTIVE_VERSION) -> int:
+        """
+        (Re)build occurrences for the given slots over [from_date, until)
+
+        Args:
+            db: Database session (committed by the caller)
+            timetable_ids: Slots to rebuild, None rebuilds every slot
+            from_date: Start of the window, defaults to today
+            until: End of the window, defaults to today + horizon
+            tenant_ids: Only rebuild these tenants' slots, None for every tenant
+            version_id: Timetable version to rebuild when no slots are named , each tenant's active one by default
+
+        Returns:
+            int: Number of occurrence rows written
+        """
+        today = self.clock.now().date()
+        from_date = from_date or today
+        until = until or (today + timedelta(days=self.horizon_days))
+        if from_date >= until:
+            return 0
+
+        slot_query = select(TimeTable)
+        if timetable_ids is not None:
+            if not timetable_ids:
+                return 0
+            slot_query = slot_query.where(TimeTable.id.in_(timetable_ids))
+        else:
+            slot_query = slot_query.where(version_clause(TimeTable, version_id))
+        if tenant_ids is not None:
+            slot_query = slot_query.where(TimeTable.tenant_id.in_(tenant_ids))
+        slots = (await db.execute(slot_query)).scalars().all()
+
+        exception_query = select(TimetableException).where(
+            TimetableException.start_date < until,
+            TimetableException.end_date >= from_date
+        )
+        if timetable_ids is not None:
+            exception_query = exception_query.where(or_(
+                TimetableException.timetable_id.is_(None),
+                TimetableException.timetable_id.in_(timetable_ids)
+            ))
+        if tenant_ids is not None:
+            exception_query = exception_query.where(TimetableException.tenant_id.in_(tenant_ids))
+        exceptions = (await db.execute(exception_query)).scalars().all()
+
+        clear = delete(ClassOccurrence).where(
+            ClassOccurrence.original_date >= from_date,
+            ClassOccurrence.original_date < until
+        )
+        if timetable_ids is not None:
+            clear = clear.where(ClassOccurrence.timetable_id.in_(timetable_ids))
+        else:
+            clear = clear.where(version_clause(ClassOccurrence, version_id))
+        if tenant_ids is not None:
+            clear = clear.where(ClassOccurrence.tenant_id.in_(tenant_ids))
+        await db.execute(clear)
+
+        rows = []
+        for slot in slots:
+            rows.extend(expand_slot(slot, from_date, until, exceptions))
+        if rows:
+            await db.execute(insert(ClassOccurrence), rows)
+
+        logger.info(f"Materialised {len(rows)} occurrences for {len(slots)} slots ({from_date} - {until})")
+        return len(rows)
+
+    async def rematerialise_for_exception(self, db: AsyncSession, exception: TimetableException) -> int:
+        """
+        Rebuild only the occurrences an exception can affect
+        """
+        today = self.clock.now().date()
+        until = today + timedelta(days=self.horizon_days)
+        from_date = max(exception.start_date, today)
+        window_end = min(exception.end_date + timedelta(days=1), until)
+        ids = None if exception.timetable_id is None else [exception.timetable_id]
+        return await self.materialise(db, ids, from_date, window_end, [exception.tenant_id])
+
+    async def _stored_extent(self, db: AsyncSession, keys: List[Tuple[int, Optional[int]]]) -> Dict[Tuple[int, Optional[int]], date]:
+        # how far earlier runs ( or another replica , before a rebalance , or a publish ) already materialised these versions
+        result = await db.execute(
+            select(ClassOccurrence.tenant_id, ClassOccurrence.version_id, func.max(ClassOccurrence.original_date))
+            .where(ClassOccurrence.tenant_id.in_({tenant_id for tenant_id, _ in keys}))
+            .group_by(ClassOccurrence.tenant_id, ClassOccurrence.version_id)
+        )
+        wanted = set(keys)
+        return {
+            (tenant_id, version_id): last + timedelta(days=1)
+            for tenant_id, version_id, last in result.all()
+            if last is not None and (tenant_id, version_id) in wanted
+        }
+
+    async def get_active_versions(self, db: AsyncSession, tenant_ids: List[int]) -> Dict[int, Optional[int]]:
+        """
+        Published timetable version of each tenant , one primary key lookup for all of them
+        """
+        result = await db.execute(
+            select(Tenant.id, Tenant.active_timetable_version_id).where(Tenant.id.in_(tenant_ids))
+        )
+        return dict(result.all())
+
+    async def ensure_horizon(self, db: AsyncSession, tenant_ids: List[int]) -> int:
+        """
+        Extend the tenants' materialised window so it always reaches today + horizon
+        Only the missing days are built, so this is cheap to call every scheduler tick
+        and a tenant handed over from another replica is not rebuilt from scratch
+        """
+        today = self.clock.now().date()
+        until = today + timedelta(days=self.horizon_days)
+        versions = await self.get_active_versions(db, tenant_ids)
+        for tenant_id, version_id in versions.items():
+            previous = self.active_versions.get(tenant_id, version_id)
+            if previous != version_id:
+                # published or rolled back since the last tick , the old version's window is of no use any more
+                self.materialised_until.pop((tenant_id, previous), None)
+                logger.info(f"Tenant {tenant_id} switched to timetable version {version_id}")
+            self.active_versions[tenant_id] = version_id
+        keys = {tenant_id: (tenant_id, versions.get(tenant_id)) for tenant_id in tenant_ids}
+        unknown = [key for key in keys.values() if key not in self.materialised_until]
+        if unknown:
+            self.materialised_until.update(await self._stored_extent(db, unknown))
+
+        # tenants that are behind by the same amount are built together
+        behind: Dict[date, List[int]] = {}
+        for tenant_id in tenant_ids:
+            materialised_until = self.materialised_until.get(keys[tenant_id])
+            if materialised_until is not None and materialised_until >= until:
+                continue
+            from_date = materialised_until if materialised_until is not None and materialised_until > today else today
+            behind.setdefault(from_date, []).append(tenant_id)
+        if not behind:
+            return 0
+
+        written = 0
+        for from_date, tenants in behind.items():
+            written += await self.materialise(db, None, from_date, until, tenants)
+        await db.commit()
+        for tenants in behind.values():
+            for tenant_id in tenants:
+                self.materialised_until[keys[tenant_id]] = until
+        return written
+
+    async def get_occurrences_for_date(self, db: AsyncSession, day: date,
+                                       include_cancelled: bool = False,
+                                       tenant_ids: Optional[List[int]] = None) -> List[ClassOccurrence]:
+        """
+        Get the ready-made occurrences for one date, ordered by start time
+        Only the given tenants' classes when tenant_ids is passed , and only of each tenant's active timetable version
+        """
+        query = lambda_stmt(lambda: select(ClassOccurrence).where(
+            ClassOccurrence.date == day, version_clause(ClassOccurrence)
+        ))
+        if tenant_ids is not None:
+            query += lambda s: s.where(ClassOccurrence.tenant_id.in_(tenant_ids))
+        if not include_cancelled:
+            query += lambda s: s.where(ClassOccurrence.status != 'cancelled')
+        query += lambda s: s.order_by(ClassOccurrence.start_time)
+        result = await db.execute(query)
+        return result.scalars().all()
+
+# Singleton instance
+occurrence_engine = OccurrenceEngine()
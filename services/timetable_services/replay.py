@@ -0,0 +1,294 @@
+# services/timetable_services/replay.py
+# runs the alert scheduler over a generated or recorded timetable on a simulated clock
+# with a fake sms sink , at thousands of times real speed
+# run with : python -m services.timetable_services.replay --days 7 --slots 300
+#            python -m services.timetable_services.replay --timetable recorded.json --start 2025-01-06
+#            python -m services.timetable_services.replay --tenants 20 --nodes 4   ( schools split across scheduler replicas )
+#            python -m services.timetable_services.replay --scheduled 5000        ( staff scheduled custom messages too )
+# a recorded timetable is a json list shaped like the /addtimetable/add_timetable request body
+import json
+import asyncio
+import random
+import logging
+import argparse
+import time as timer
+from collections import Counter
+from datetime import datetime, date, time, timedelta
+from typing import List, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from db.db_setup import Base
+from db.models.model_timetable import TimeTable
+from db.models.model_timetable_version import TimetableVersion
+from db.models.model_occurrence import ClassOccurrence, TimetableException
+from db.models.model_student import Student, ALL_INTERVALS, INTERVAL_BITS
+from db.models.model_tenant import Tenant, DEFAULT_TENANT_ID
+from db.models.model_scheduled_message import ScheduledMessage
+from services.sms_services.providers import FakeSMSProvider
+from services.sms_services.sms_service import SMSService
+from services.sms_services.message_log import MessageLogBuffer
+from services.timetable_services.clock import SimulatedClock
+from services.timetable_services.occurrence_service import OccurrenceEngine
+from services.timetable_services.timetable_allerts import TimetableAlertService
+from services.timetable_services.tenant_ring import ClusterMembership, HashRing
+
+logger = logging.getLogger(__name__)
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def generate_timetable(slots: int, seed: int = 0) -> List[dict]:
+    """
+    Random weekday slots between 07:00 and 20:00 on the quarter hour
+    """
+    rng = random.Random(seed)
+    timetable = []
+    for i in range(slots):
+        start = time(rng.randint(7, 19), rng.choice([0, 15, 30, 45]))
+        end = (datetime.combine(date.min, start) + timedelta(hours=rng.choice([1, 2]))).time()
+        timetable.append({
+            'unit': f'unit {i}',
+            'day': rng.choice(DAYS[:5]),
+            'start_time': start.strftime('%H:%M'),
+            'end_time': end.strftime('%H:%M'),
+        })
+    return timetable
+
+
+def generate_students(count: int, seed: int = 0) -> List[dict]:
+    """
+    Students with a spread of preferences : most keep the defaults, some only want the
+    30 minute alert, some have quiet hours and a few have opted out
+    """
+    rng = random.Random(seed)
+    students = []
+    for i in range(count):
+        student = {'phone': f'+2547{i:08d}', 'alert_mask': ALL_INTERVALS, 'opted_out': rng.random() < 0.05}
+        if rng.random() < 0.3:
+            student['alert_mask'] = INTERVAL_BITS[30]
+        if rng.random() < 0.2:
+            student['quiet_start'], student['quiet_end'] = 21 * 60, 7 * 60 + rng.choice([0, 30, 60, 90])
+        students.append(student)
+    return students
+
+
+def load_timetable(path: str) -> List[dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+class DiscardingMessageLog(MessageLogBuffer):
+    """
+    The replay has no message_log table , sends are counted on the fake sink instead
+    """
+
+    def add_send(self, *args, **kwargs):
+        pass
+
+
+class ReplayAlertService(TimetableAlertService):
+    """
+    Alert service that also records every alert the scheduler decides is due
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.fired = Counter()  # (occurrence id, minutes before) -> times it was sent
+
+    def coalesce_alerts(self, due_alerts, audiences):
+        for class_item, minutes_before in due_alerts:
+            self.fired[(class_item.id, minutes_before)] += 1
+        return super().coalesce_alerts(due_alerts, audiences)
+
+
+async def run_replay(timetable: List[dict], start: datetime, days: int,
+                     students: Optional[List[dict]] = None,
+                     database_url: str = 'sqlite+aiosqlite://',
+                     tenants: int = 1, nodes: int = 1, scheduled: int = 0) -> dict:
+    """
+    Replay the scheduler from start for the given number of simulated days
+
+    Slots and students are dealt out round robin over the tenants, and every node replays
+    the same days for the tenants the hash ring gives it, one node after the other on the
+    same database, so the report shows whether the nodes together sent every alert once
+
+    Args:
+        timetable: Slots with unit, day, start_time and end_time
+        start: Simulated start time
+        days: Number of simulated days
+        students: Phones and alert preferences, 1000 generated students by default
+        database_url: Scratch database, an in-memory sqlite one by default
+        tenants: Number of schools
+        nodes: Number of scheduler replicas
+        scheduled: Custom messages scheduled at random times over the replayed days
+
+    Returns:
+        dict: Alerts expected / fired, duplicates, misses, db queries per simulated day and wall time
+    """
+    until = start + timedelta(days=days)
+    engine = create_async_engine(database_url)
+    queries = Counter()
+    current = {'clock': SimulatedClock(start, until=until)}
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        queries[current['clock'].now().date().isoformat()] += 1
+
+    students = students if students is not None else generate_students(1000)
+    tenant_ids = [DEFAULT_TENANT_ID + i for i in range(tenants)]
+    tables = [Tenant.__table__, TimetableVersion.__table__, TimeTable.__table__, TimetableException.__table__,
+              ClassOccurrence.__table__, Student.__table__, ScheduledMessage.__table__]
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all, tables=tables)
+        await conn.run_sync(Base.metadata.create_all, tables=tables)
+
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        # the default tenant is created with the table
+        db.add_all(Tenant(id=tenant_id, name=f'school {tenant_id}', slug=f'school-{tenant_id}') for tenant_id in tenant_ids[1:])
+        await db.flush()
+        db.add_all(
+            TimeTable(
+                tenant_id=tenant_ids[i % tenants],
+                unit=slot['unit'],
+                day=slot['day'],
+                start_time=time.fromisoformat(slot['start_time']),
+                end_time=time.fromisoformat(slot['end_time']),
+                room=slot.get('room'),
+                lecturer=slot.get('lecturer'),
+                group_name=slot.get('group_name')
+            )
+            for i, slot in enumerate(timetable)
+        )
+        db.add_all(
+            Student(
+                tenant_id=tenant_ids[i % tenants],
+                name=f'student {i}',
+                email=f'student{i}@replay.local',
+                student_id=f'R{i:06d}',
+                phone=student['phone'],
+                alert_mask=student.get('alert_mask', ALL_INTERVALS),
+                quiet_start=student.get('quiet_start'),
+                quiet_end=student.get('quiet_end'),
+                opted_out=student.get('opted_out', False)
+            )
+            for i, student in enumerate(students)
+        )
+        rng = random.Random(len(students))
+        db.add_all(
+            ScheduledMessage(
+                tenant_id=tenant_ids[i % tenants],
+                message=f'announcement {i}',
+                recipients=[students[i % len(students)]['phone']],
+                send_at=start + timedelta(seconds=rng.randint(0, days * 86400 - 1))
+            )
+            for i in range(scheduled)
+        )
+        await db.commit()
+    queries.clear()
+
+    sink = FakeSMSProvider('replay')
+    node_ids = [f'node-{i}' for i in range(nodes)]
+    ring = HashRing(node_ids)
+    fired = Counter()
+    per_node = {}
+    for node_id in node_ids:
+        clock = current['clock'] = SimulatedClock(start, until=until)
+        # no redis in the replay , every node is handed the same fixed ring instead of heartbeating
+        membership = ClusterMembership(node_id=node_id)
+        membership.ring = ring
+        service = ReplayAlertService(
+            clock=clock,
+            session_factory=session_factory,
+            occurrences=OccurrenceEngine(clock=clock),
+            sms_service=SMSService([sink]),
+            message_log=DiscardingMessageLog(),
+            membership=membership
+        )
+
+        started = timer.perf_counter()
+        await service.start_scheduler(asyncio.Event())
+        wall_time = timer.perf_counter() - started
+        fired.update(service.fired)
+        per_node[node_id] = {
+            'tenants': len(membership.owned(tenant_ids)),
+            'alerts_fired': len(service.fired),
+            'wall_time_s': round(wall_time, 3),
+        }
+
+    # every alert whose time fell inside the replayed window should have gone out exactly once
+    first_window = start - timedelta(seconds=service.tick_seconds)
+    last_check = service._last_checked
+    async with session_factory() as db:
+        occurrences = (await db.execute(
+            select(ClassOccurrence).where(
+                ClassOccurrence.date >= start.date(),
+                ClassOccurrence.date <= last_check.date() + timedelta(days=1),
+                ClassOccurrence.status != 'cancelled'
+            )
+        )).scalars().all()
+        scheduled_status = Counter((await db.execute(select(ScheduledMessage.status))).scalars().all())
+    expected = set()
+    for occurrence in occurrences:
+        class_datetime = datetime.combine(occurrence.date, occurrence.start_time)
+        for minutes_before in service.alert_intervals:
+            if first_window < class_datetime - timedelta(minutes=minutes_before) <= last_check:
+                expected.add((occurrence.id, minutes_before))
+    await engine.dispose()
+
+    simulated_seconds = (clock.now() - start).total_seconds()
+    # the nodes would run side by side , so the slowest one sets the pace
+    slowest = max(node['wall_time_s'] for node in per_node.values())
+    return {
+        'simulated_days': days,
+        'ticks': clock.ticks,
+        'slots': len(timetable),
+        'tenants': tenants,
+        'alerts_expected': len(expected),
+        'alerts_fired': len(fired),
+        'duplicates': sum(count - 1 for count in fired.values()),
+        'misses': len(expected - set(fired)),
+        'unexpected': len(set(fired) - expected),
+        'students': len(students),
+        'scheduled_messages': dict(scheduled_status),
+        'sms_sent': len(sink.sent),
+        'sms_recipients': sum(len(sent['to']) for sent in sink.sent),
+        'db_queries_per_day': dict(sorted(queries.items())),
+        'nodes': per_node,
+        'wall_time_s': round(sum(node['wall_time_s'] for node in per_node.values()), 3),
+        'speedup': round(simulated_seconds / slowest) if slowest else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Replay the alert scheduler on a simulated clock')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--slots', type=int, default=200, help='slots to generate when no timetable is given')
+    parser.add_argument('--students', type=int, default=1000, help='students to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timetable', help='json file with a recorded timetable')
+    parser.add_argument('--start', help='simulated start date (YYYY-MM-DD), defaults to the coming monday')
+    parser.add_argument('--database-url', default='sqlite+aiosqlite://')
+    parser.add_argument('--tenants', type=int, default=1, help='schools the slots and students are spread over')
+    parser.add_argument('--nodes', type=int, default=1, help='scheduler replicas the schools are split between')
+    parser.add_argument('--scheduled', type=int, default=0, help='custom messages to schedule over the replayed days')
+    args = parser.parse_args(argv)
+
+    if args.start:
+        start = datetime.combine(date.fromisoformat(args.start), time.min)
+    else:
+        today = date.today()
+        start = datetime.combine(today + timedelta(days=(7 - today.weekday()) % 7), time.min)
+    timetable = load_timetable(args.timetable) if args.timetable else generate_timetable(args.slots, args.seed)
+
+    logging.basicConfig(level=logging.WARNING)
+    students = generate_students(args.students, args.seed)
+    report = asyncio.run(run_replay(
+        timetable, start, args.days, students, args.database_url, args.tenants, args.nodes, args.scheduled
+    ))
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
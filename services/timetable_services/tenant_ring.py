@@ -0,0 +1,143 @@
+# services/timetable_services/tenant_ring.py
+import os
+import time
+import bisect
+import socket
+import hashlib
+import logging
+from typing import Iterable, List, Optional
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring of scheduler nodes
+
+    Every node is placed on the ring at `vnodes` points and a tenant belongs to the first
+    node clockwise from its own hash. When a node joins or leaves only the tenants next
+    to its points move , roughly 1/n of them , everyone else stays where they were.
+
+    Args:
+        nodes: Node ids
+        vnodes: Points per node , more points spread tenants more evenly
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, tenant_id) -> Optional[str]:
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(f"tenant:{tenant_id}")) % len(self._hashes)
+        return self._owners[index]
+
+
+class ClusterMembership:
+    """
+    Which scheduler replicas are alive , and so which tenants this one sends alerts for
+
+    Each replica heartbeats into a redis sorted set scored by the time it was last seen and
+    members not seen for `ttl` seconds drop out , so the ring rebalances by itself when a
+    replica starts , stops or dies. Without REDIS_URL this replica is the only member and
+    owns every tenant.
+
+    Args:
+        node_id: This replica's id , SCHEDULER_NODE_ID or host:pid by default
+        redis_url: Redis shared by the replicas
+        ttl: Seconds without a heartbeat before a replica is dropped
+        vnodes: Ring points per replica
+    """
+
+    KEY = 'scheduler:nodes'
+
+    def __init__(self, node_id: Optional[str] = None, redis_url: Optional[str] = None,
+                 ttl: Optional[float] = None, vnodes: Optional[int] = None):
+        settings = get_settings()
+        self.node_id = node_id or settings.scheduler_node_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl if ttl is not None else settings.scheduler_node_ttl
+        self.vnodes = vnodes or settings.scheduler_ring_vnodes
+        self.claim_ttl = settings.alert_claim_ttl
+        self.redis_url = redis_url
+        self._redis = None
+        self.ring = HashRing([self.node_id], self.vnodes)
+        self.rebalances = 0
+
+    @property
+    def redis(self):
+        # created on first use so importing the app does not import redis
+        if self._redis is None and self.redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+        return self._redis
+
+    async def refresh(self) -> HashRing:
+        """
+        Heartbeat and pick up replicas that joined or left , called once per scheduler tick
+        On redis trouble the last known ring is kept
+        """
+        if self.redis is None:
+            return self.ring
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(self.KEY, {self.node_id: now})
+            pipe.zremrangebyscore(self.KEY, '-inf', now - self.ttl)
+            pipe.zrange(self.KEY, 0, -1)
+            _, _, members = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"scheduler heartbeat failed: {str(e)}")
+            return self.ring
+
+        nodes = sorted({m.decode() if isinstance(m, bytes) else m for m in members} | {self.node_id})
+        if nodes != self.ring.nodes:
+            logger.info(f"Scheduler nodes changed from {self.ring.nodes} to {nodes}, rebalancing tenants")
+            self.ring = HashRing(nodes, self.vnodes)
+            self.rebalances += 1
+        return self.ring
+
+    def owns(self, tenant_id: int) -> bool:
+        return self.ring.node_for(tenant_id) == self.node_id
+
+    def owned(self, tenant_ids: Iterable[int]) -> List[int]:
+        return [tenant_id for tenant_id in tenant_ids if self.owns(tenant_id)]
+
+    async def claim(self, keys: List[str]) -> List[bool]:
+        """
+        Claim alerts before sending them , False for the ones another replica already sent
+
+        Right after a rebalance two replicas can briefly both think they own a tenant ,
+        the claim ( SET NX ) makes sure only one of them sends
+        """
+        if self.redis is None or not keys:
+            return [True] * len(keys)
+        try:
+            pipe = self.redis.pipeline()
+            for key in keys:
+                pipe.set(f"alert_claim:{key}", self.node_id, nx=True, ex=self.claim_ttl)
+            return [bool(claimed) for claimed in await pipe.execute()]
+        except Exception as e:
+            # a duplicate alert beats a missed one
+            logger.warning(f"alert claim failed, sending unclaimed: {str(e)}")
+            return [True] * len(keys)
+
+    async def leave(self):
+        """
+        Drop out of the ring on shutdown so the other replicas take over this one's tenants straight away
+        """
+        if self._redis is None:
+            return
+        try:
+            await self._redis.zrem(self.KEY, self.node_id)
+        except Exception as e:
+            logger.warning(f"could not leave the scheduler ring: {str(e)}")
+        await self._redis.close()
@@ -2,13 +2,29 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta, time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Union, Tuple
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
 from db.models.model_timetable import TimeTable
-from services.sms_services.sms_service import sms_service
+from db.models.model_occurrence import ClassOccurrence
+from db.models.model_tenant import Tenant
+from db.models.model_scheduled_message import ScheduledMessage
+from services.timetable_services.occurrence_service import occurrence_engine
+from services.timetable_services.clock import system_clock
+from services.timetable_services.audience_index import AudienceIndex
+from services.timetable_services.tenant_ring import ClusterMembership
+from services.timetable_services.timing_wheel import TimingWheel
+from db.models.model_student import ALERT_INTERVALS
+from services.sms_services.sms_service import get_sms_service
+from services.sms_services.delivery_reports import delivery_reports
+from services.sms_services.message_log import message_log as default_message_log
+from services.event_services.event_bus import event_bus
+from services.logging_services.structured_logging import log_context
+from services.tracing_services.tracing import tracer
+from settings import get_settings
 from db.db_setup import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
@@ -16,161 +32,432 @@ logger = logging.getLogger(__name__)
 class TimetableAlertService:
     """
     Service for managing timetable alerts and SMS notifications
+    
+    Every replica runs the scheduler , each one only for the tenants the consistent hash
+    ring gives it , so adding replicas spreads the schools between them.
+    
+    Scheduled custom messages of the owned tenants wait on a timing wheel in memory , which
+    the scheduler advances once per tick , so thousands pending cost nothing until they fall
+    due. The table is the source of truth , the wheel is rebuilt from it on a restart or
+    when the owned tenants change.
+    
+    The clock, session factory, occurrence engine and sms service can be swapped out,
+    which is how the replay in services/timetable_services/replay.py runs a simulated week
     """
     
-    def __init__(self):
-        self.alert_intervals = [120, 30, 5]  # Alert at 2 hours, 30 minutes, and 5 minutes before
-        self.student_contacts = []  # Will be populated from database
+    def __init__(self, clock=None, session_factory=None, occurrences=None, sms_service=None, message_log=None,
+                 membership=None):
+        self.alert_intervals = list(ALERT_INTERVALS)  # Alert at 2 hours, 30 minutes, and 5 minutes before
+        self.audiences: Dict[int, AudienceIndex] = {}  # tenant id -> per student intervals , quiet hours and opt outs
+        self.membership = membership or ClusterMembership(redis_url=get_settings().redis_url)
+        self.tenant_list_ttl = timedelta(seconds=get_settings().tenant_list_ttl)
+        self._tenants: List[int] = []
+        self._tenants_loaded_at: Optional[datetime] = None
+        self._rebalances = 0
+        self.tick_seconds = 60
+        self.max_catch_up = timedelta(minutes=5)  # alerts older than this after a stall are dropped , not sent late
+        self.clock = clock or system_clock
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.occurrences = occurrences or occurrence_engine
+        self._sms_service = sms_service
+        self.message_log = message_log or default_message_log
+        self._last_checked: Optional[datetime] = None
         self.running = False
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self.coalesce_stats = {'due_alerts': 0, 'sends': 0}  # how many sms sends coalescing saved
+        self.scheduled = TimingWheel(self.clock.now(), tick=timedelta(seconds=self.tick_seconds))
+        self.scheduled_max_delay = timedelta(seconds=get_settings().scheduled_message_max_delay)
+        self._scheduled_tenants: Set[int] = set()  # tenants whose pending messages are on the wheel
+        # every tick the pending rows due within this are (re)loaded , whatever order they were committed in
+        self.scheduled_lookahead = timedelta(seconds=2 * self.tick_seconds)
+        self.scheduled_sending_timeout = timedelta(seconds=get_settings().scheduled_message_sending_timeout)
+        self._scheduled_reclaimed_at: Optional[datetime] = None
+    
+    @property
+    def sms_service(self):
+        return self._sms_service or get_sms_service()
+    
+    def audience_index_for(self, tenant_id: int) -> AudienceIndex:
+        index = self.audiences.get(tenant_id)
+        if index is None:
+            index = self.audiences[tenant_id] = AudienceIndex(tenant_id)
+        return index
+    
+    def set_opted_out(self, phone: str, opted_out: bool):
+        """
+        Apply a STOP / START reply to every loaded tenant the phone belongs to
+        """
+        for index in self.audiences.values():
+            index.set_opted_out(phone, opted_out)
     
-    async def get_student_contacts(self, db: AsyncSession) -> List[str]:
+    async def get_tenant_ids(self, db: AsyncSession) -> List[int]:
         """
-        Get all student phone numbers from the database
-        You'll need to implement this based on your student model
+        Ids of the active tenants , reloaded every tenant_list_ttl
+        """
+        now = self.clock.now()
+        if self._tenants_loaded_at is None or now - self._tenants_loaded_at >= self.tenant_list_ttl:
+            result = await db.execute(select(Tenant.id).where(Tenant.active == True).order_by(Tenant.id))
+            self._tenants = list(result.scalars().all())
+            self._tenants_loaded_at = now
+        return self._tenants
+    
+    async def get_student_contacts(self, db: AsyncSession, tenant_id: int) -> List[str]:
+        """
+        Get the phone numbers of every active student of the tenant who has not opted out
         
         Args:
             db: Database session
+            tenant_id: School whose students to fetch
             
         Returns:
             List[str]: List of formatted phone numbers
         """
         try:
-            # TODO: Replace with your actual student model query
-            # query = select(Student.phone).where(Student.active == True)
-            # result = await db.execute(query)
-            # phones = [phone[0] for phone in result.fetchall()]
-            
-            # For now, return demo numbers (replace with actual implementation)
-            demo_phones = [
-                "+254700000001",
-                "+254700000002", 
-                "+254700000003"
-            ]
-            
-            # Format all phone numbers
-            formatted_phones = [sms_service.format_phone_number(phone) for phone in demo_phones]
-            return formatted_phones
+            index = self.audience_index_for(tenant_id)
+            await index.ensure_loaded(db, self.sms_service.format_phone_number)
+            return index.subscribed()
             
         except Exception as e:
             logger.error(f"Error fetching student contacts: {str(e)}")
             return []
     
-    async def get_todays_timetable(self, db: AsyncSession) -> List[TimeTable]:
+    async def get_todays_timetable(self, db: AsyncSession, tenant_id: int) -> List[ClassOccurrence]:
         """
-        Get today's timetable from the database
+        Get the tenant's classes today from the materialised occurrences
+        Cancelled classes (holidays, exam weeks) are left out and rescheduled ones show their new time
         
         Args:
             db: Database session
+            tenant_id: School whose timetable to read
             
         Returns:
-            List[TimeTable]: List of today's classes
+            List[ClassOccurrence]: List of today's classes
         """
         try:
-            today = datetime.now().strftime('%A').lower()  # Get current day name
-            
-            query = select(TimeTable).where(
-                TimeTable.day.ilike(f"%{today}%")
-            ).order_by(TimeTable.start_time)
-            
-            result = await db.execute(query)
-            return result.scalars().all()
+            with tracer.span('alerts.get_todays_timetable', tenant_id=tenant_id):
+                return await self.occurrences.get_occurrences_for_date(
+                    db, self.clock.now().date(), tenant_ids=[tenant_id]
+                )
             
         except Exception as e:
             logger.error(f"Error fetching today's timetable: {str(e)}")
             return []
     
+    async def owned_tenants(self, db: AsyncSession) -> List[int]:
+        """
+        The tenants this replica schedules , after picking up replicas that joined or left
+        """
+        await self.membership.refresh()
+        tenants = self.membership.owned(await self.get_tenant_ids(db))
+        if self.membership.rebalances != self._rebalances:
+            # tenants handed to another replica no longer need their students in memory here
+            self._rebalances = self.membership.rebalances
+            self.audiences = {tenant_id: index for tenant_id, index in self.audiences.items() if tenant_id in tenants}
+            logger.info(f"Scheduling {len(tenants)} tenants on {self.membership.node_id}")
+        return tenants
+    
     async def check_and_send_alerts(self):
         """
-        Check for upcoming classes and send appropriate alerts
+        Check for upcoming classes of the tenants this replica owns and send appropriate alerts
         """
-        async with AsyncSessionLocal() as db:
-            try:
-                current_time = datetime.now()
-                today_classes = await self.get_todays_timetable(db)
-                student_contacts = await self.get_student_contacts(db)
-                
-                if not student_contacts:
-                    logger.warning("No student contacts found")
-                    return
-                
-                for class_item in today_classes:
-                    # Combine today's date with class start time
-                    class_datetime = datetime.combine(
-                        current_time.date(),
-                        class_item.start_time
-                    )
+        # one trace per tick , kept when the tick was slow , so a late alert shows where the time went
+        with tracer.span('scheduler.tick', node=self.membership.node_id) as tick:
+            async with self.session_factory() as db:
+                try:
+                    current_time = self.clock.now()
+                    # alerts are due when their time falls between the previous check and now , so a
+                    # slow tick neither skips an alert nor lets the next tick send it a second time
+                    window_start = current_time - timedelta(seconds=self.tick_seconds)
+                    if self._last_checked is not None:
+                        window_start = max(self._last_checked, current_time - self.max_catch_up)
                     
-                    # Check each alert interval
-                    for minutes_before in self.alert_intervals:
-                        alert_time = class_datetime - timedelta(minutes=minutes_before)
-                        
-                        # Check if we should send alert now (within 1 minute window)
-                        time_diff = abs((current_time - alert_time).total_seconds())
+                    with tracer.span('alerts.owned_tenants'):
+                        tenants = await self.owned_tenants(db)
+                    tick.set(tenants=len(tenants))
+                    if not tenants:
+                        self._last_checked = current_time
+                        return
+                    with tracer.span('alerts.load_occurrences') as span:
+                        # keep the materialised window rolling , this is a no-op except once a day
+                        await self.occurrences.ensure_horizon(db, tenants)
+                        # near midnight the 2 hour alert of an early class falls on the day before it
+                        classes = []
+                        day = window_start.date()
+                        last_day = (current_time + timedelta(minutes=max(self.alert_intervals))).date()
+                        while day <= last_day:
+                            classes.extend(await self.occurrences.get_occurrences_for_date(db, day, tenant_ids=tenants))
+                            day += timedelta(days=1)
+                        span.set(classes=len(classes))
+                    
+                    due_per_tenant: Dict[int, List[Tuple[object, int]]] = {}
+                    for class_item in classes:
+                        class_datetime = datetime.combine(class_item.date, class_item.start_time)
                         
-                        if time_diff <= 60:  # Within 1 minute of alert time
-                            await self.send_class_alert(
-                                class_item, 
-                                student_contacts, 
-                                minutes_before
-                            )
+                        # Check each alert interval
+                        for minutes_before in self.alert_intervals:
+                            alert_time = class_datetime - timedelta(minutes=minutes_before)
+                            if window_start < alert_time <= current_time:
+                                due_per_tenant.setdefault(class_item.tenant_id, []).append((class_item, minutes_before))
+                    self._last_checked = current_time
+                    tick.set(due_alerts=sum(len(due) for due in due_per_tenant.values()))
+                    
+                    for tenant_id, due in due_per_tenant.items():
+                        # every record of this tenant's sends in this tick shares one alert_id
+                        alert_id = f"{tenant_id}:{current_time:%Y-%m-%dT%H:%M}"
+                        with log_context(tenant_id=tenant_id, alert_id=alert_id), \
+                                tracer.span('alerts.send_tenant', tenant_id=tenant_id, alert_id=alert_id, due=len(due)):
+                            await self.send_tenant_alerts(db, tenant_id, due, current_time)
+                    
+                except Exception as e:
+                    logger.error(f"Error in check_and_send_alerts: {str(e)}")
                 
-            except Exception as e:
-                logger.error(f"Error in check_and_send_alerts: {str(e)}")
+                try:
+                    await self.send_scheduled_messages(db, current_time)
+                except Exception as e:
+                    logger.error(f"Error sending scheduled messages: {str(e)}")
     
-    async def send_class_alert(self, class_item: TimeTable, 
-                             student_contacts: List[str], minutes_before: int):
+    async def send_tenant_alerts(self, db: AsyncSession, tenant_id: int,
+                                 due: List[Tuple[object, int]], current_time: datetime):
         """
-        Send SMS alert for a specific class
+        Send one tenant's alerts that fell due in this tick
+        """
+        index = self.audience_index_for(tenant_id)
+        with tracer.span('alerts.resolve_audience') as span:
+            await index.ensure_loaded(db, self.sms_service.format_phone_number)
+            if not index.phones:
+                logger.warning(f"No student contacts found for tenant {tenant_id}")
+                return
+            
+            # right after a rebalance the previous owner may have sent some of these already
+            claims = await self.membership.claim([
+                f"{tenant_id}:{class_item.timetable_id}:{class_item.date}:{class_item.start_time}:{minutes_before}"
+                for class_item, minutes_before in due
+            ])
+            
+            due_alerts = []
+            audiences: Dict[int, List[str]] = {}
+            for (class_item, minutes_before), claimed in zip(due, claims):
+                if not claimed:
+                    continue
+                if minutes_before not in audiences:
+                    # students who want this interval and are not in quiet hours right now
+                    audiences[minutes_before] = index.audience(minutes_before, current_time)
+                if not audiences[minutes_before]:
+                    continue
+                event_bus.publish(
+                    'alert_queued',
+                    tenant_id=tenant_id,
+                    unit=class_item.unit,
+                    start_time=class_item.start_time.strftime('%H:%M'),
+                    minutes_before=minutes_before,
+                    recipients=len(audiences[minutes_before])
+                )
+                due_alerts.append((class_item, minutes_before))
+            span.set(students=len(index.phones), claimed=sum(claims), alerts=len(due_alerts))
+        
+        # Everything due in this tick is merged per recipient, so a student with
+        # three classes at 8:00 gets one SMS instead of three
+        alert_audiences = [audiences[minutes_before] for _, minutes_before in due_alerts]
+        with tracer.span('alerts.coalesce') as span:
+            groups = self.coalesce_alerts(due_alerts, alert_audiences)
+            span.set(groups=len(groups))
+        for recipients, alerts in groups:
+            await self.send_alert_group(alerts, recipients)
+    
+    def coalesce_alerts(self, due_alerts: List[Tuple[object, int]],
+                        audiences: List[List[str]]) -> List[Tuple[List[str], List[Tuple[object, int]]]]:
+        """
+        Group due alerts so every recipient gets one message for everything due to them
+        
+        Recipients are keyed by the exact set of alerts they are due, and everyone
+        sharing a set shares one send
         
         Args:
-            class_item: TimeTable object
-            student_contacts: List of student phone numbers
-            minutes_before: Minutes before class starts
+            due_alerts: (class_item, minutes_before) pairs due now
+            audiences: Recipients of each due alert, in the same order
+            
+        Returns:
+            List of (recipients, alerts) groups, one provider call each
+        """
+        alerts_per_recipient: Dict[str, List[int]] = {}
+        for index, recipients in enumerate(audiences):
+            for phone in recipients:
+                alerts_per_recipient.setdefault(phone, []).append(index)
+        
+        groups: Dict[Tuple[int, ...], List[str]] = {}
+        for phone, indexes in alerts_per_recipient.items():
+            groups.setdefault(tuple(indexes), []).append(phone)
+        
+        self.coalesce_stats['due_alerts'] += len(due_alerts)
+        self.coalesce_stats['sends'] += len(groups)
+        return [
+            (recipients, [due_alerts[i] for i in indexes])
+            for indexes, recipients in groups.items()
+        ]
+    
+    async def send_alert_group(self, alerts: List[Tuple[object, int]], recipients: List[str]):
         """
+        Send one SMS covering every alert in the group
+        
+        Args:
+            alerts: (class_item, minutes_before) pairs
+            recipients: Phone numbers that are due all of them
+        """
+        if len(alerts) == 1:
+            class_item, minutes_before = alerts[0]
+            await self.send_class_alert(class_item, recipients, minutes_before)
+            return
+        
         try:
-            start_time_str = class_item.start_time.strftime('%H:%M')
-            end_time_str = class_item.end_time.strftime('%H:%M')
+            with tracer.span('alerts.render_message', alerts=len(alerts)):
+                alerts = sorted(alerts, key=lambda alert: (alert[0].start_time, alert[1]))
+                message = self.sms_service.generate_combined_class_message([
+                    (
+                        class_item.unit,
+                        class_item.start_time.strftime('%H:%M'),
+                        class_item.end_time.strftime('%H:%M'),
+                        minutes_before
+                    )
+                    for class_item, minutes_before in alerts
+                ])
+            urgent = any(minutes_before <= 10 for _, minutes_before in alerts)
+            units = [class_item.unit for class_item, _ in alerts]
             
-            # Generate appropriate message based on time before class
-            if minutes_before <= 10:
-                message = sms_service.generate_immediate_class_message(
-                    class_item.unit,
-                    start_time_str,
-                    end_time_str
-                )
-            else:
-                message = sms_service.generate_class_reminder_message(
-                    class_item.unit,
-                    start_time_str,
-                    end_time_str,
+            result = await self.sms_service.send_sms(recipients, message, hedge=urgent)
+            # a row per recipient and class , so the history of each class shows the combined message too
+            for class_item, minutes_before in alerts:
+                self.message_log.add_send(
+                    recipients,
+                    message,
+                    result,
+                    'combined',
+                    class_item.tenant_id,
+                    getattr(class_item, 'timetable_id', class_item.id),
                     minutes_before
                 )
             
-            # Send SMS to all students
-            result = await sms_service.send_sms(student_contacts, message)
+            if result['success']:
+                # sms_messages holds one row per provider message id , it is tied to the first class
+                # the message covers and message_log maps the same id to the others
+                first_class = alerts[0][0]
+                delivery_reports.add_sent_from_response(
+                    result['data'],
+                    getattr(first_class, 'timetable_id', first_class.id)
+                )
+                logger.info(f"Combined alert sent for {', '.join(units)}")
+                event_bus.publish(
+                    'alert_sent',
+                    units=units,
+                    recipients=len(recipients),
+                    provider=result.get('provider')
+                )
+            else:
+                logger.error(f"Failed to send combined alert for {', '.join(units)}: {result['message']}")
+                event_bus.publish('alert_failed', units=units, error=result.get('error'))
+                
+        except Exception as e:
+            logger.error(f"Error sending combined alert: {str(e)}")
+    
+    async def send_class_alert(self, class_item: Union[TimeTable, ClassOccurrence], 
+                             student_contacts: List[str], minutes_before: int) -> dict:
+        """
+        Send SMS alert for a specific class
+        
+        Args:
+            class_item: TimeTable slot or dated ClassOccurrence
+            student_contacts: List of student phone numbers
+            minutes_before: Minutes before class starts
+            
+        Returns:
+            dict: The result of SMSService.send_sms , success False when sending raised
+        """
+        try:
+            with tracer.span('alerts.render_message', alerts=1):
+                start_time_str = class_item.start_time.strftime('%H:%M')
+                end_time_str = class_item.end_time.strftime('%H:%M')
+                
+                # Generate appropriate message based on time before class
+                if minutes_before <= 10:
+                    message = self.sms_service.generate_immediate_class_message(
+                        class_item.unit,
+                        start_time_str,
+                        end_time_str
+                    )
+                else:
+                    message = self.sms_service.generate_class_reminder_message(
+                        class_item.unit,
+                        start_time_str,
+                        end_time_str,
+                        minutes_before
+                    )
+            
+            # Send SMS to all students, the last minute alerts are hedged onto a backup provider if the primary is slow
+            result = await self.sms_service.send_sms(
+                student_contacts,
+                message,
+                hedge=minutes_before <= 10
+            )
+            self.message_log.add_send(
+                student_contacts,
+                message,
+                result,
+                'reminder' if minutes_before > 10 else 'immediate',
+                class_item.tenant_id,
+                getattr(class_item, 'timetable_id', class_item.id),
+                minutes_before
+            )
             
             if result['success']:
+                # remember the provider message ids so delivery reports can be tied back to this class
+                delivery_reports.add_sent_from_response(
+                    result['data'],
+                    getattr(class_item, 'timetable_id', class_item.id)
+                )
                 logger.info(f"Alert sent for {class_item.unit} class ({minutes_before} min before)")
+                event_bus.publish(
+                    'alert_sent',
+                    unit=class_item.unit,
+                    minutes_before=minutes_before,
+                    recipients=len(student_contacts),
+                    provider=result.get('provider')
+                )
             else:
                 logger.error(f"Failed to send alert for {class_item.unit}: {result['message']}")
+                event_bus.publish(
+                    'alert_failed',
+                    unit=class_item.unit,
+                    minutes_before=minutes_before,
+                    error=result.get('error')
+                )
+            return result
                 
         except Exception as e:
             logger.error(f"Error sending class alert: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'message': 'Failed to send SMS due to an internal error'
+            }
     
-    async def send_custom_message(self, message: str, recipients: Optional[List[str]] = None):
+    async def send_custom_message(self, message: str, tenant_id: int, recipients: Optional[List[str]] = None):
         """
         Send custom message to students
         
         Args:
             message: Custom message to send
-            recipients: Specific recipients (if None, send to all students)
+            tenant_id: School the message is sent for
+            recipients: Specific recipients (if None, send to all the tenant's students)
         """
-        async with AsyncSessionLocal() as db:
+        async with self.session_factory() as db:
             try:
                 if recipients is None:
-                    recipients = await self.get_student_contacts(db)
+                    recipients = await self.get_student_contacts(db, tenant_id)
                 
-                result = await sms_service.send_sms(recipients, message)
+                result = await self.sms_service.send_sms(recipients, message)
+                self.message_log.add_send(recipients, message, result, 'custom', tenant_id)
+                if result['success']:
+                    delivery_reports.add_sent_from_response(result['data'])
                 return result
                 
             except Exception as e:
@@ -181,29 +468,240 @@ class TimetableAlertService:
                     'message': 'Failed to send custom message'
                 }
     
-    async def start_scheduler(self):
+    async def load_scheduled_messages(self, db: AsyncSession, tenants: List[int]):
         """
-        Start the alert scheduler (runs continuously)
+        Put the owned tenants' pending scheduled messages on the wheel
+        
+        When the owned tenants change the wheel is rebuilt from the table. Otherwise only the
+        pending rows due before the next ticks are read , so a message scheduled through another
+        replica , or committed after a later one , is on the wheel before it falls due.
+        Only ids and send times are loaded.
+        """
+        await self.reclaim_scheduled_messages(db)
+        rebuild = set(tenants) != self._scheduled_tenants
+        if rebuild:
+            self.scheduled.clear()
+            self._scheduled_tenants = set(tenants)
+        if not tenants:
+            return
+        query = select(ScheduledMessage.id, ScheduledMessage.tenant_id, ScheduledMessage.send_at).where(
+            ScheduledMessage.status == 'pending',
+            ScheduledMessage.tenant_id.in_(tenants)
+        )
+        if not rebuild:
+            query = query.where(ScheduledMessage.send_at <= self.clock.now() + self.scheduled_lookahead)
+        for message_id, tenant_id, send_at in await db.execute(query):
+            if message_id not in self.scheduled:
+                self.scheduled.add(message_id, send_at, tenant_id)
+    
+    async def reclaim_scheduled_messages(self, db: AsyncSession):
+        """
+        Put messages claimed by a replica that died before finishing them back to pending , checked
+        once per sending timeout. One that did go out just before the crash is sent a second time ,
+        which beats never sending it
+        """
+        now = datetime.utcnow()
+        if self._scheduled_reclaimed_at is not None and now - self._scheduled_reclaimed_at < self.scheduled_sending_timeout:
+            return
+        self._scheduled_reclaimed_at = now
+        reclaimed = (await db.execute(
+            update(ScheduledMessage)
+            .where(
+                ScheduledMessage.status == 'sending',
+                ScheduledMessage.updated_at < now - self.scheduled_sending_timeout
+            )
+            .values(status='pending', updated_at=now)
+            .returning(ScheduledMessage.id)
+        )).scalars().all()
+        await db.commit()
+        if reclaimed:
+            logger.warning(f"Reclaimed {len(reclaimed)} scheduled messages left in sending: {reclaimed}")
+    
+    async def send_scheduled_messages(self, db: AsyncSession, current_time: datetime):
+        """
+        Send the scheduled messages that fell due in this tick
+        """
+        await self.load_scheduled_messages(db, self.membership.owned(await self.get_tenant_ids(db)))
+        for message_id, tenant_id in self.scheduled.advance(current_time):
+            with log_context(tenant_id=tenant_id, alert_id=f"scheduled:{message_id}"), \
+                    tracer.span('alerts.send_scheduled', tenant_id=tenant_id, scheduled_message_id=message_id):
+                await self.send_scheduled_message(db, message_id, current_time)
+    
+    async def send_scheduled_message(self, db: AsyncSession, message_id: int, current_time: datetime):
+        """
+        Claim one scheduled message and hand it to the custom message send path
+        
+        The claim moves it from pending to sending in one UPDATE , so a message cancelled in the
+        meantime or already taken by another replica right after a rebalance is not sent
+        """
+        claimed = (await db.execute(
+            update(ScheduledMessage)
+            .where(ScheduledMessage.id == message_id, ScheduledMessage.status == 'pending')
+            .values(status='sending', updated_at=datetime.utcnow())
+            .returning(ScheduledMessage.tenant_id, ScheduledMessage.message,
+                       ScheduledMessage.recipients, ScheduledMessage.send_at)
+        )).first()
+        await db.commit()
+        if claimed is None:
+            return
+        tenant_id, message, recipients, send_at = claimed
+        
+        if current_time - send_at > self.scheduled_max_delay:
+            # the scheduler was down past it , an announcement hours late does more harm than good
+            logger.warning(f"Scheduled message {message_id} is {current_time - send_at} late, not sending it")
+            await self._finish_scheduled(db, message_id, 'expired', error='not sent before the maximum delay')
+            event_bus.publish('scheduled_message_expired', tenant_id=tenant_id, id=message_id)
+            return
+        
+        result = await self.send_custom_message(message, tenant_id, recipients)
+        if result['success']:
+            await self._finish_scheduled(db, message_id, 'sent', sent_at=current_time)
+            logger.info(f"Scheduled message {message_id} sent")
+            event_bus.publish('scheduled_message_sent', tenant_id=tenant_id, id=message_id,
+                              provider=result.get('provider'))
+        else:
+            await self._finish_scheduled(db, message_id, 'failed', sent_at=current_time,
+                                         error=str(result.get('error') or result.get('message')))
+            logger.error(f"Failed to send scheduled message {message_id}: {result.get('message')}")
+            event_bus.publish('scheduled_message_failed', tenant_id=tenant_id, id=message_id,
+                              error=result.get('error'))
+    
+    async def _finish_scheduled(self, db: AsyncSession, message_id: int, status: str,
+                                sent_at: Optional[datetime] = None, error: Optional[str] = None):
+        await db.execute(
+            update(ScheduledMessage)
+            .where(ScheduledMessage.id == message_id)
+            .values(status=status, sent_at=sent_at, error=error, updated_at=datetime.utcnow())
+        )
+        await db.commit()
+    
+    async def schedule_custom_message(self, db: AsyncSession, message: str, send_at: datetime, tenant_id: int,
+                                      recipients: Optional[List[str]] = None,
+                                      created_by: Optional[int] = None) -> ScheduledMessage:
         """
+        Schedule a custom message to go out at send_at
+        
+        Args:
+            db: Database session
+            message: Custom message to send
+            send_at: When to send it , in the scheduler's local time
+            tenant_id: School the message is sent for
+            recipients: Formatted phone numbers (if None, every subscribed student of the tenant at send time)
+            created_by: Id of the user who scheduled it
+            
+        Returns:
+            ScheduledMessage: The pending row
+        """
+        scheduled = ScheduledMessage(
+            tenant_id=tenant_id,
+            created_by=created_by,
+            message=message,
+            recipients=recipients,
+            send_at=send_at
+        )
+        db.add(scheduled)
+        await db.commit()
+        if tenant_id in self._scheduled_tenants:
+            # owned here , straight onto the wheel , otherwise the owner loads it on its next tick
+            self.scheduled.add(scheduled.id, send_at, tenant_id)
+        event_bus.publish('scheduled_message_added', tenant_id=tenant_id, id=scheduled.id,
+                          send_at=send_at.isoformat())
+        return scheduled
+    
+    async def cancel_scheduled_message(self, db: AsyncSession, message_id: int, tenant_id: int) -> bool:
+        """
+        Cancel a scheduled message that has not gone out yet
+        
+        Returns:
+            bool: False if there is no such pending message for the tenant
+        """
+        cancelled = (await db.execute(
+            update(ScheduledMessage)
+            .where(
+                ScheduledMessage.id == message_id,
+                ScheduledMessage.tenant_id == tenant_id,
+                ScheduledMessage.status == 'pending'
+            )
+            .values(status='cancelled', updated_at=datetime.utcnow())
+            .returning(ScheduledMessage.id)
+        )).first()
+        await db.commit()
+        # a replica that still has it on its wheel fails to claim it when it falls due
+        self.scheduled.cancel(message_id)
+        if cancelled is not None:
+            event_bus.publish('scheduled_message_cancelled', tenant_id=tenant_id, id=message_id)
+        return cancelled is not None
+    
+    def start(self) -> bool:
+        """
+        Launch the scheduler loop as a task on the running event loop
+        
+        Returns:
+            bool: False if a scheduler loop is still running (or still finishing its last tick after a stop)
+        """
+        if self._task is not None and not self._task.done():
+            return False
+        # set the state here rather than inside the task so a second start() before the task first runs sees it
         self.running = True
+        self._last_checked = None
+        self._stop_event = asyncio.Event()
+        self._task = asyncio.create_task(self.start_scheduler(self._stop_event))
+        return True
+    
+    async def start_scheduler(self, stop_event: Optional[asyncio.Event] = None):
+        """
+        Start the alert scheduler (runs continuously)
+        
+        Args:
+            stop_event: Event that ends this loop, each loop gets its own so a restart never revives an old one
+        """
+        if stop_event is None:
+            self.running = True
+            self._stop_event = stop_event = asyncio.Event()
         logger.info("Timetable alert scheduler started")
+        event_bus.publish('scheduler_started', alert_intervals=self.alert_intervals)
         
-        while self.running:
+        while not stop_event.is_set():
             try:
                 await self.check_and_send_alerts()
-                # Check every minute
-                await asyncio.sleep(60)
-                
             except Exception as e:
                 logger.error(f"Error in scheduler loop: {str(e)}")
-                await asyncio.sleep(60)  # Continue running even if there's an error
+            
+            # Check every minute, waking up early if we are asked to stop
+            await self.clock.sleep(self.tick_seconds, stop_event)
     
     def stop_scheduler(self):
         """
         Stop the alert scheduler
         """
         self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
         logger.info("Timetable alert scheduler stopped")
+        event_bus.publish('scheduler_stopped')
+    
+    async def shutdown(self, timeout: float):
+        """
+        Stop the scheduler, let the current tick finish sending its alerts and hand
+        this replica's tenants over to the others
+        
+        Args:
+            timeout: Seconds to wait for the current tick before cancelling it
+        """
+        self.stop_scheduler()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Scheduler tick still running after {timeout}s, cancelling it")
+                self._task.cancel()
+                # wait for the cancellation to land so the tick is not still using the http client or a session
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        await self.membership.leave()
 
 # Singleton instance
 alert_service = TimetableAlertService()
\ No newline at end of file
@@ -0,0 +1,122 @@
+# services/timetable_services/timing_wheel.py
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Hashable, List
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel of timers keyed by id
+
+    Time moves in whole ticks. Level 0 has one slot per tick, and each level above has slots
+    `size` times wider than the one below, so three levels of 60 one-minute slots cover
+    60 minutes, 60 hours and 150 days. Timers further out than that wait in an overflow
+    bucket. When a level comes round to a new slot, that slot's timers are moved down
+    to the level below, so a timer moves at most once per level before it fires.
+
+    Adding and cancelling a timer is a dict insert or delete whatever the number of pending
+    timers. advance() only visits the slots that came due, not every timer.
+
+    Args:
+        start: Time the wheel starts at , from the scheduler's clock
+        tick: Width of a level 0 slot
+        size: Slots per level
+        levels: Number of levels
+    """
+
+    def __init__(self, start: datetime, tick: timedelta = timedelta(minutes=1), size: int = 60, levels: int = 3):
+        self.tick_seconds = tick.total_seconds()
+        self.size = size
+        self.levels = levels
+        self.spans = [size ** level for level in range(levels + 1)]  # ticks per slot of each level , then the whole wheel
+        self.wheels: List[List[Dict[Hashable, Any]]] = [[{} for _ in range(size)] for _ in range(levels)]
+        self.overflow: Dict[Hashable, Any] = {}
+        self.ready: Dict[Hashable, Any] = {}  # already due , handed out by the next advance()
+        self.due: Dict[Hashable, int] = {}  # id -> tick it fires at
+        self._where: Dict[Hashable, Dict[Hashable, Any]] = {}  # id -> the bucket holding it
+        self.current = self.to_tick(start, math.floor)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def to_tick(self, when: datetime, rounding=math.ceil) -> int:
+        # timers round up so they never fire before their time , the clock rounds down
+        return int(rounding((when - EPOCH).total_seconds() / self.tick_seconds))
+
+    def _bucket(self, due: int) -> Dict[Hashable, Any]:
+        if due <= self.current:
+            return self.ready
+        delta = due - self.current
+        for level in range(self.levels):
+            if delta < self.spans[level + 1]:
+                return self.wheels[level][(due // self.spans[level]) % self.size]
+        return self.overflow
+
+    def _place(self, key: Hashable, value: Any, due: int):
+        bucket = self._bucket(due)
+        bucket[key] = value
+        self._where[key] = bucket
+        self.due[key] = due
+
+    def add(self, key: Hashable, when: datetime, value: Any = None):
+        """
+        Schedule a timer , or move it if the key is already on the wheel
+        """
+        self.cancel(key)
+        self._place(key, value, self.to_tick(when))
+
+    def cancel(self, key: Hashable) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        del self.due[key]
+        return True
+
+    def clear(self):
+        for key in list(self._where):
+            self.cancel(key)
+
+    def _cascade(self, bucket: Dict[Hashable, Any]):
+        items = list(bucket.items())
+        bucket.clear()
+        for key, value in items:
+            self._place(key, value, self.due[key])
+
+    def advance(self, now: datetime) -> List[Any]:
+        """
+        Move the wheel up to now
+
+        Returns:
+            List: (key, value) of every timer that fell due , in due order
+        """
+        target = self.to_tick(now, math.floor)
+        fired = []
+        self._fire(self.ready, fired)
+        while self.current < target:
+            if not self._where:
+                # nothing pending , skip the empty ticks in one step
+                self.current = target
+                break
+            self.current += 1
+            # outermost first , so timers cascaded down on this tick still reach level 0 in time
+            if self.current % self.spans[self.levels] == 0:
+                self._cascade(self.overflow)
+            for level in range(self.levels - 1, 0, -1):
+                if self.current % self.spans[level] == 0:
+                    self._cascade(self.wheels[level][(self.current // self.spans[level]) % self.size])
+            self._fire(self.wheels[0][self.current % self.size], fired)
+            self._fire(self.ready, fired)
+        fired.sort(key=lambda item: item[0])
+        return [(key, value) for _, key, value in fired]
+
+    def _fire(self, bucket: Dict[Hashable, Any], fired: List):
+        for key, value in bucket.items():
+            del self._where[key]
+            fired.append((self.due.pop(key), key, value))
+        bucket.clear()
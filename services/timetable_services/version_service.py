@@ -0,0 +1,148 @@
+# services/timetable_services/version_service.py
+import logging
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, literal, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models.model_tenant import Tenant
+from db.models.model_timetable import TimeTable
+from db.models.model_occurrence import ClassOccurrence
+from db.models.model_timetable_version import TimetableVersion, ACTIVE_VERSION, version_clause
+from services.timetable_services.occurrence_service import occurrence_engine
+from services.timetable_services.clock import system_clock
+
+logger = logging.getLogger(__name__)
+
+# slot columns copied when a draft starts from the live timetable
+SLOT_COLUMNS = ('start_time', 'end_time', 'unit', 'day', 'day_index', 'room', 'lecturer', 'group_name')
+
+
+class TimetableVersionService:
+    """
+    Drafts , publishing and rollback of whole timetables
+
+    A draft is filled in bulk and read by nothing but the draft review api. Publishing builds the
+    draft's occurrences next to the live ones and then moves the tenant's pointer , all in the
+    caller's transaction , so the scheduler sees the old version up to the commit and the whole new
+    one after it. The previous version's occurrences are kept so a rollback is the same switch back.
+    """
+
+    def __init__(self, occurrences=None, clock=None):
+        self.occurrences = occurrences or occurrence_engine
+        self.clock = clock or system_clock
+
+    async def create_draft(self, db: AsyncSession, tenant_id: int, name: str,
+                           created_by: Optional[int] = None, copy_active: bool = False) -> TimetableVersion:
+        """
+        Start a new draft , empty or as a copy of the live timetable to edit
+
+        Args:
+            db: Database session (committed by the caller)
+            tenant_id: School the draft belongs to
+            name: Label shown to staff , e.g. "Term 2 2025"
+            created_by: User id
+            copy_active: Start from the slots of the live timetable
+        """
+        version = TimetableVersion(tenant_id=tenant_id, name=name, status='draft', created_by=created_by)
+        db.add(version)
+        await db.flush()
+        if copy_active:
+            # copied inside the database , the slots never come through the app
+            columns = [getattr(TimeTable, column) for column in SLOT_COLUMNS]
+            await db.execute(
+                insert(TimeTable).from_select(
+                    ['tenant_id', 'version_id', *SLOT_COLUMNS],
+                    select(TimeTable.tenant_id, literal(version.id), *columns).where(
+                        TimeTable.tenant_id == tenant_id, version_clause(TimeTable, ACTIVE_VERSION)
+                    )
+                )
+            )
+        return version
+
+    async def load_slots(self, db: AsyncSession, version: TimetableVersion, slots: List[dict]) -> int:
+        """
+        Bulk insert validated slots ( TimetableCreateRequest.model_dump() ) into a draft , one statement for all of them
+        """
+        if not slots:
+            return 0
+        rows = [
+            {**slot, 'tenant_id': version.tenant_id, 'version_id': version.id}
+            for slot in slots
+        ]
+        await db.execute(insert(TimeTable), rows)
+        logger.info(f"Loaded {len(rows)} slots into timetable version {version.id} of tenant {version.tenant_id}")
+        return len(rows)
+
+    async def publish(self, db: AsyncSession, version: TimetableVersion) -> dict:
+        """
+        Make a version the tenant's live timetable
+
+        The tenant row is locked first so two publishes of one school run one after the other.
+        Nothing is visible to readers until the caller commits
+
+        Returns:
+            dict: previous_version_id and the number of occurrences built
+        """
+        tenant = (await db.execute(
+            select(Tenant).where(Tenant.id == version.tenant_id).with_for_update()
+        )).scalars().one()
+        previous = tenant.active_timetable_version_id
+        if previous == version.id:
+            return {'previous_version_id': previous, 'occurrences': 0}
+
+        today = self.clock.now().date()
+        until = today + timedelta(days=self.occurrences.horizon_days)
+        written = await self.occurrences.materialise(db, None, today, until, [tenant.id], version_id=version.id)
+
+        # upcoming occurrences of versions older than the one being replaced are never read again ,
+        # the replaced one's stay for a rollback , past ones are history
+        keep = [version.id] if previous is None else [version.id, previous]
+        stale = ClassOccurrence.version_id.not_in(keep)
+        if previous is not None:
+            stale = or_(stale, ClassOccurrence.version_id.is_(None))
+        await db.execute(
+            delete(ClassOccurrence).where(
+                ClassOccurrence.tenant_id == tenant.id, ClassOccurrence.original_date >= today, stale
+            )
+        )
+
+        now = self.clock.now()
+        if previous is not None:
+            await db.execute(
+                update(TimetableVersion).where(TimetableVersion.id == previous).values(status='archived')
+            )
+        version.status = 'published'
+        version.published_at = now
+        version.previous_version_id = previous
+        # the switch itself , one row
+        tenant.active_timetable_version_id = version.id
+        await db.flush()
+        logger.info(f"Published timetable version {version.id} of tenant {tenant.id} , replacing {previous} , {written} occurrences")
+        return {'previous_version_id': previous, 'occurrences': written}
+
+    async def rollback(self, db: AsyncSession, tenant_id: int) -> Optional[dict]:
+        """
+        Publish again the version that was live before the current one , undoing the last switch
+
+        Returns:
+            Optional[dict]: The version now live and what publish() returned , None when there is nothing to go back to
+        """
+        active_id = (await db.execute(
+            select(Tenant.active_timetable_version_id).where(Tenant.id == tenant_id)
+        )).scalar()
+        if active_id is None:
+            return None
+        active = await db.get(TimetableVersion, active_id)
+        if active is None or active.previous_version_id is None:
+            return None
+        target = await db.get(TimetableVersion, active.previous_version_id)
+        if target is None or target.tenant_id != tenant_id:
+            return None
+        published = await self.publish(db, target)
+        return {'version': target, **published}
+
+# Singleton instance
+timetable_versions = TimetableVersionService()
@@ -0,0 +1,424 @@
+# services/tracing_services/tracing.py
+# request , scheduler and sms tracing with tail-based sampling , no collector needed
+#
+#   from services.tracing_services.tracing import tracer
+#
+#   with tracer.span('alerts.resolve_audience', tenant_id=3) as span:
+#       ...
+#       span.set(recipients=120)
+#
+# The current span lives in a context variable , so spans opened in tasks created inside a span
+# ( asyncio copies the context into new tasks ) and in sqlalchemy's greenlets nest under it.
+#
+# Spans are buffered per trace until its root span ends , then the whole trace is kept when it
+# was slow ( TRACE_SLOW_MS ) , had an error , or falls in the TRACE_SAMPLE_RATE random sample ,
+# and dropped otherwise. A span left by a cancelled task ( e.g. the loser of a hedged send ) is
+# marked cancelled , not as an error. Kept traces are logged , or with TRACE_EXPORTER=file written
+# as one json line each to TRACE_FILE by a background thread , rotated at TRACE_FILE_MAX_BYTES.
+#
+# Slowest traces of a file : python -m services.tracing_services.tracing traces.jsonl --top 10
+import os
+import sys
+import asyncio
+import json
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from settings import get_settings
+from services.logging_services.structured_logging import log_context
+
+try:
+    import orjson
+except ImportError: # orjson is optional , we just fall back to the standard json encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+tracing_metrics = {
+    'traces_kept': 0,
+    'traces_dropped': 0,  # sampled out at the end of the trace
+    'spans_dropped': 0,  # over the open trace / per trace limits
+    'exports_dropped': 0,  # exporter queue full
+}
+
+def _new_id(bytes_: int) -> str:
+    return os.urandom(bytes_).hex()
+
+def _dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=str).decode()
+    return json.dumps(value, default=str)
+
+
+class Span:
+    """
+    One timed operation , ended by the tracer's span() block
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes',
+                 'error', 'local_root', '_started')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], local_root: bool, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.local_root = local_root  # first span of the trace in this process , its end decides the trace
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def finish(self, error: Optional[str] = None):
+        self.end = self.start + (time.perf_counter() - self._started)
+        if error is not None:
+            self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round(self.duration_ms, 3),
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+class FileTraceExporter:
+    """
+    Appends kept traces to a file , one json line per trace , from a background thread
+    A full queue drops the trace rather than making the caller wait. Past max_bytes the file is
+    renamed to path.1 ( path.1 to path.2 ... up to backups ) and a new one started
+    """
+
+    def __init__(self, path: str, max_queue: int = 1000, max_bytes: int = 100 * 1024 * 1024, backups: int = 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, trace: dict):
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            tracing_metrics['exports_dropped'] += 1
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        output = open(self.path, 'a')
+        try:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    break
+                output.write(_dumps(trace) + '\n')
+                if self._queue.empty():
+                    output.flush()
+                if self.max_bytes and output.tell() >= self.max_bytes:
+                    output.close()
+                    self._rotate()
+                    output = open(self.path, 'a')
+        finally:
+            output.close()
+
+    def shutdown(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class LogTraceExporter:
+    """
+    Logs each kept trace as one structured record , for deployments that ship the app log anyway
+    """
+
+    def export(self, trace: dict):
+        logger.info(f"Trace {trace['name']} took {trace['duration_ms']:.0f}ms ({trace['reason']})", extra={'trace': trace})
+
+    def start(self):
+        pass
+
+    def shutdown(self, timeout: float = 5.0):
+        pass
+
+
+class Tracer:
+    """
+    Creates spans and decides which traces to keep once they are complete
+
+    Args:
+        exporter: Where kept traces go , None disables tracing
+        slow_ms: Traces whose root span took at least this long are always kept
+        sample_rate: Share of the other traces kept anyway , as a baseline
+        max_open_traces: Traces buffered at once , spans of new traces past this are not recorded
+        max_spans: Spans recorded per trace
+    """
+
+    def __init__(self, exporter=None, slow_ms: float = 500, sample_rate: float = 0.01,
+                 max_open_traces: int = 10000, max_spans: int = 1000):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.max_open_traces = max_open_traces
+        self.max_spans = max_spans
+        self._open: Dict[str, List[Span]] = {}  # trace id -> its ended spans , until the root ends
+        self._decided: OrderedDict = OrderedDict()  # trace id -> kept , for spans that end after their root
+
+    @contextmanager
+    def span(self, name: str, remote_parent: Optional[Tuple[str, str]] = None, **attributes):
+        """
+        Time the block as a span , a child of the current span or a new trace
+
+        Args:
+            name: What is being timed
+            remote_parent: (trace id , span id) of a caller in another process ( traceparent header )
+            attributes: Searchable details , ids , counts , status codes
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, False, attributes)
+        elif remote_parent is not None:
+            span = Span(name, remote_parent[0], remote_parent[1], True, attributes)
+        else:
+            span = Span(name, _new_id(16), None, True, attributes)
+
+        token = _current.set(span)
+        error = None
+        try:
+            if span.local_root:
+                # every log line of the trace carries its id
+                with log_context(trace_id=span.trace_id):
+                    yield span
+            else:
+                yield span
+        except asyncio.CancelledError:
+            # cancelled from outside , e.g. the slower half of a hedged send , nothing failed
+            span.set(cancelled=True)
+            raise
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            span.finish(error)
+            self._record(span)
+
+    def start_child(self, name: str, **attributes) -> Optional[Span]:
+        """
+        A span under the current one that is not made current , for callbacks that see the start
+        and the end of an operation separately ( sqlalchemy events ) , None outside a trace
+        End it with end_span()
+        """
+        parent = _current.get()
+        if not self.enabled or parent is None:
+            return None
+        return Span(name, parent.trace_id, parent.span_id, False, attributes)
+
+    def end_span(self, span: Span, error: Optional[str] = None):
+        span.finish(error)
+        self._record(span)
+
+    def traced(self, name: Optional[str] = None):
+        """
+        Decorator running an async function inside a span
+        """
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return await function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _record(self, span: Span):
+        spans = self._open.get(span.trace_id)
+        if spans is None:
+            kept = self._decided.get(span.trace_id)
+            if kept is not None:
+                # a background task outlived the request that started it
+                if kept:
+                    self._export(span.trace_id, [span], span, 'late')
+                return
+            if len(self._open) >= self.max_open_traces:
+                tracing_metrics['spans_dropped'] += 1
+                return
+            spans = self._open[span.trace_id] = []
+        if len(spans) < self.max_spans:
+            spans.append(span)
+        else:
+            tracing_metrics['spans_dropped'] += 1
+        if span.local_root:
+            self._decide(span, self._open.pop(span.trace_id))
+
+    def _decide(self, root: Span, spans: List[Span]):
+        if root.duration_ms >= self.slow_ms:
+            reason = 'slow'
+        elif any(span.error for span in spans):
+            reason = 'error'
+        elif random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            reason = None
+
+        self._decided[root.trace_id] = reason is not None
+        if len(self._decided) > self.max_open_traces:
+            self._decided.popitem(last=False)
+        if reason is None:
+            tracing_metrics['traces_dropped'] += 1
+            return
+        tracing_metrics['traces_kept'] += 1
+        self._export(root.trace_id, spans, root, reason)
+
+    def _export(self, trace_id: str, spans: List[Span], root: Span, reason: str):
+        self.exporter.export({
+            'trace_id': trace_id,
+            'name': root.name,
+            'start': root.start,
+            'duration_ms': round(root.duration_ms, 3),
+            'reason': reason,
+            'spans': [span.to_dict() for span in sorted(spans, key=lambda span: span.start)],
+        })
+
+    def start(self):
+        if self.enabled:
+            self.exporter.start()
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        Write out the traces still queued , called at shutdown
+        """
+        if self.enabled:
+            self.exporter.shutdown(timeout)
+
+
+class _NoopSpan:
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    (trace id , parent span id) from a w3c traceparent header , None when missing or malformed
+    """
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return parts[1], parts[2]
+
+
+def build_tracer() -> Tracer:
+    settings = get_settings()
+    exporter = None
+    if settings.tracing_enabled and settings.trace_exporter == 'file':
+        exporter = FileTraceExporter(
+            settings.trace_file,
+            max_bytes=settings.trace_file_max_bytes,
+            backups=settings.trace_file_backups
+        )
+    elif settings.tracing_enabled and settings.trace_exporter == 'log':
+        exporter = LogTraceExporter()
+    return Tracer(
+        exporter,
+        slow_ms=settings.trace_slow_ms,
+        sample_rate=settings.trace_sample_rate,
+        max_open_traces=settings.trace_max_open
+    )
+
+# Singleton instance
+tracer = build_tracer()
+
+
+def _print_trace(trace: dict):
+    print(f"{trace['duration_ms']:9.1f} ms  {trace['name']}  ({trace['reason']}, trace {trace['trace_id']})")
+    children: Dict[Optional[str], List[dict]] = {}
+    ids = {span['span_id'] for span in trace['spans']}
+    for span in trace['spans']:
+        # spans whose parent is in another process or was not recorded hang off the top
+        children.setdefault(span['parent_id'] if span['parent_id'] in ids else None, []).append(span)
+
+    def walk(parent_id: Optional[str], depth: int):
+        for span in children.get(parent_id, []):
+            offset = (span['start'] - trace['start']) * 1000
+            error = f"  ERROR {span['error']}" if span['error'] else ''
+            if span['attributes'].get('cancelled'):
+                error += '  cancelled'
+            print(f"  {offset:8.1f} +{span['duration_ms']:8.1f} ms  {'  ' * depth}{span['name']}{error}")
+            walk(span['span_id'], depth + 1)
+    walk(None, 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Slowest traces of a trace file')
+    parser.add_argument('path', nargs='?', default=get_settings().trace_file)
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--name', help='only traces whose root span name contains this')
+    args = parser.parse_args()
+
+    with open(args.path) as f:
+        traces = [json.loads(line) for line in f if line.strip()]
+    traces = [trace for trace in traces if trace['reason'] != 'late' and (not args.name or args.name in trace['name'])]
+    for trace in sorted(traces, key=lambda trace: -trace['duration_ms'])[:args.top]:
+        _print_trace(trace)
+        print()
+    if not traces:
+        sys.exit('no traces')
@@ -0,0 +1,142 @@
+# settings.py
+# every environment variable the app reads , parsed and typed once
+#
+#   from settings import get_settings
+#   settings = get_settings()
+#   settings.database_url
+#
+# .env is loaded here and nowhere else. Values are read on the first get_settings() call and
+# cached for the life of the process , call get_settings.cache_clear() to pick up changes ( scripts , tests )
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+
+def _str(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name)
+    return value if value not in (None, '') else default
+
+def _int(name: str, default: int) -> int:
+    return int(_str(name, str(default)))
+
+def _float(name: str, default: float) -> float:
+    return float(_str(name, str(default)))
+
+def _bool(name: str, default: bool) -> bool:
+    return _str(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _set(name: str) -> FrozenSet[str]:
+    return frozenset(item.strip() for item in (_str(name) or '').split(',') if item.strip())
+
+
+@dataclass(frozen=True)
+class Settings:
+    # database
+    database_url: Optional[str] = field(default_factory=lambda: _str('DATABASE_URL'), repr=False)
+    query_cache_size: int = field(default_factory=lambda: _int('QUERY_CACHE_SIZE', 500))
+    prepared_statement_cache_size: int = field(default_factory=lambda: _int('PREPARED_STATEMENT_CACHE_SIZE', 200))
+    db_warmup_connections: int = field(default_factory=lambda: _int('DB_WARMUP_CONNECTIONS', 2))
+    shutdown_drain_timeout: float = field(default_factory=lambda: _float('SHUTDOWN_DRAIN_TIMEOUT', 20))
+    migration_lock_timeout: str = field(default_factory=lambda: _str('MIGRATION_LOCK_TIMEOUT', '5s'))
+    migration_statement_timeout: str = field(default_factory=lambda: _str('MIGRATION_STATEMENT_TIMEOUT', '15min'))
+
+    # auth , AUTH_ALGORITHM is still accepted for the access token algorithm but ALGORITHM wins
+    auth_secret_key: Optional[str] = field(default_factory=lambda: _str('AUTH_SECRET_KEY'), repr=False)
+    algorithm: str = field(default_factory=lambda: _str('ALGORITHM') or _str('AUTH_ALGORITHM', 'HS256'))
+    refresh_algorithm: str = field(default_factory=lambda: _str('REFRESH_ALGORITHM') or _str('ALGORITHM') or _str('AUTH_ALGORITHM', 'HS256'))
+    admin_usernames: FrozenSet[str] = field(default_factory=lambda: _set('ADMIN_USERNAMES'))
+    password_hash_workers: int = field(default_factory=lambda: _int('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    password_hash_chunk: int = field(default_factory=lambda: _int('PASSWORD_HASH_CHUNK', 50))
+    bulk_user_batch_size: int = field(default_factory=lambda: _int('BULK_USER_BATCH_SIZE', 1000))
+    bulk_user_max_rows: int = field(default_factory=lambda: _int('BULK_USER_MAX_ROWS', 20000))
+
+    # redis and the caches / stores kept in it
+    redis_url: Optional[str] = field(default_factory=lambda: _str('REDIS_URL'), repr=False)
+    user_cache_ttl: int = field(default_factory=lambda: _int('USER_CACHE_TTL', 600))
+    user_cache_lock_ttl: int = field(default_factory=lambda: _int('USER_CACHE_LOCK_TTL', 5))
+    user_cache_local_size: int = field(default_factory=lambda: _int('USER_CACHE_LOCAL_SIZE', 10000))
+    idempotency_ttl: int = field(default_factory=lambda: _int('IDEMPOTENCY_TTL', 86400))
+    idempotency_lock_ttl: int = field(default_factory=lambda: _int('IDEMPOTENCY_LOCK_TTL', 120))
+    idempotency_wait_timeout: float = field(default_factory=lambda: _float('IDEMPOTENCY_WAIT_TIMEOUT', 30))
+    events_channel: str = field(default_factory=lambda: _str('EVENTS_CHANNEL', 'at_backend:events'))
+    events_client_queue: int = field(default_factory=lambda: _int('EVENTS_CLIENT_QUEUE', 100))
+    events_outbox_size: int = field(default_factory=lambda: _int('EVENTS_OUTBOX_SIZE', 10000))
+
+    # timetable alerts
+    alert_scheduler_autostart: bool = field(default_factory=lambda: _bool('ALERT_SCHEDULER_AUTOSTART', False))
+    occurrence_horizon_days: int = field(default_factory=lambda: _int('OCCURRENCE_HORIZON_DAYS', 14))
+    audience_index_ttl: float = field(default_factory=lambda: _float('AUDIENCE_INDEX_TTL', 300))
+    tenant_list_ttl: float = field(default_factory=lambda: _float('TENANT_LIST_TTL', 300))
+    scheduler_node_id: Optional[str] = field(default_factory=lambda: _str('SCHEDULER_NODE_ID'))
+    scheduler_node_ttl: float = field(default_factory=lambda: _float('SCHEDULER_NODE_TTL', 180))
+    scheduler_ring_vnodes: int = field(default_factory=lambda: _int('SCHEDULER_RING_VNODES', 64))
+    alert_claim_ttl: int = field(default_factory=lambda: _int('ALERT_CLAIM_TTL', 86400))
+    scheduled_message_max_delay: float = field(default_factory=lambda: _float('SCHEDULED_MESSAGE_MAX_DELAY', 3600))
+    # a message left in 'sending' this long ( the replica died mid send ) is put back to pending
+    scheduled_message_sending_timeout: float = field(default_factory=lambda: _float('SCHEDULED_MESSAGE_SENDING_TIMEOUT', 600))
+
+    # sms
+    sms_providers: str = field(default_factory=lambda: _str('SMS_PROVIDERS', 'africastalking'))
+    africas_talking_api_key: Optional[str] = field(default_factory=lambda: _str('AFRICAS_TALKING_API_KEY'), repr=False)
+    africas_talking_username: str = field(default_factory=lambda: _str('AFRICAS_TALKING_USERNAME', 'sandbox'))
+    africas_talking_base_url: str = field(default_factory=lambda: _str(
+        'AFRICAS_TALKING_BASE_URL', 'https://api.sandbox.africastalking.com/version1/messaging'
+    ))
+    twilio_account_sid: Optional[str] = field(default_factory=lambda: _str('TWILIO_ACCOUNT_SID'))
+    twilio_auth_token: Optional[str] = field(default_factory=lambda: _str('TWILIO_AUTH_TOKEN'), repr=False)
+    twilio_from_number: Optional[str] = field(default_factory=lambda: _str('TWILIO_FROM_NUMBER'))
+    sms_slow_threshold: float = field(default_factory=lambda: _float('SMS_SLOW_THRESHOLD', 3))
+    sms_hedge_delay: float = field(default_factory=lambda: _float('SMS_HEDGE_DELAY', 1.5))
+    sms_health_window: int = field(default_factory=lambda: _int('SMS_HEALTH_WINDOW', 50))
+    sms_breaker_failures: int = field(default_factory=lambda: _int('SMS_BREAKER_FAILURES', 3))
+    sms_breaker_cooldown: float = field(default_factory=lambda: _float('SMS_BREAKER_COOLDOWN', 30))
+    sms_health_max_age: float = field(default_factory=lambda: _float('SMS_HEALTH_MAX_AGE', 300))
+    delivery_report_token: Optional[str] = field(default_factory=lambda: _str('DELIVERY_REPORT_TOKEN'), repr=False)
+    delivery_report_batch_size: int = field(default_factory=lambda: _int('DELIVERY_REPORT_BATCH_SIZE', 500))
+    delivery_report_flush_interval: float = field(default_factory=lambda: _float('DELIVERY_REPORT_FLUSH_INTERVAL', 2))
+    delivery_report_max_pending: int = field(default_factory=lambda: _int('DELIVERY_REPORT_MAX_PENDING', 100000))
+    delivery_report_max_attempts: int = field(default_factory=lambda: _int('DELIVERY_REPORT_MAX_ATTEMPTS', 3))
+    message_log_batch_size: int = field(default_factory=lambda: _int('MESSAGE_LOG_BATCH_SIZE', 1000))
+    message_log_flush_interval: float = field(default_factory=lambda: _float('MESSAGE_LOG_FLUSH_INTERVAL', 2))
+    message_log_months_ahead: int = field(default_factory=lambda: _int('MESSAGE_LOG_MONTHS_AHEAD', 2))
+    message_log_max_pending: int = field(default_factory=lambda: _int('MESSAGE_LOG_MAX_PENDING', 200000))
+
+    # logging
+    log_level: str = field(default_factory=lambda: _str('LOG_LEVEL', 'INFO'))
+    log_format: str = field(default_factory=lambda: _str('LOG_FORMAT', 'json'))  # json / text
+    log_queue_size: int = field(default_factory=lambda: _int('LOG_QUEUE_SIZE', 10000))
+    log_sample_rate: float = field(default_factory=lambda: _float('LOG_SAMPLE_RATE', 10))
+    log_sample_burst: int = field(default_factory=lambda: _int('LOG_SAMPLE_BURST', 50))
+
+    # tracing
+    tracing_enabled: bool = field(default_factory=lambda: _bool('TRACING_ENABLED', True))
+    trace_exporter: str = field(default_factory=lambda: _str('TRACE_EXPORTER', 'log'))  # log / file
+    trace_file: str = field(default_factory=lambda: _str('TRACE_FILE', 'traces.jsonl'))
+    trace_file_max_bytes: int = field(default_factory=lambda: _int('TRACE_FILE_MAX_BYTES', 100 * 1024 * 1024))
+    trace_file_backups: int = field(default_factory=lambda: _int('TRACE_FILE_BACKUPS', 3))
+    trace_slow_ms: float = field(default_factory=lambda: _float('TRACE_SLOW_MS', 500))
+    trace_sample_rate: float = field(default_factory=lambda: _float('TRACE_SAMPLE_RATE', 0.01))
+    trace_max_open: int = field(default_factory=lambda: _int('TRACE_MAX_OPEN', 10000))
+
+    # chess.com
+    chess_api_base_url: str = field(default_factory=lambda: _str('CHESS_API_BASE_URL', 'https://api.chess.com/pub'))
+    chess_api_timeout: float = field(default_factory=lambda: _float('CHESS_API_TIMEOUT', 2))
+    chess_api_deadline: float = field(default_factory=lambda: _float('CHESS_API_DEADLINE', 3))
+    chess_api_max_attempts: int = field(default_factory=lambda: _int('CHESS_API_MAX_ATTEMPTS', 3))
+    chess_api_retry_ratio: float = field(default_factory=lambda: _float('CHESS_API_RETRY_RATIO', 0.2))
+    chess_api_user_agent: str = field(default_factory=lambda: _str('CHESS_API_USER_AGENT', 'at-backend signup check'))
+    chess_profile_cache_size: int = field(default_factory=lambda: _int('CHESS_PROFILE_CACHE_SIZE', 10000))
+    chess_profile_cache_ttl: float = field(default_factory=lambda: _float('CHESS_PROFILE_CACHE_TTL', 3600))
+    chess_profile_missing_ttl: float = field(default_factory=lambda: _float('CHESS_PROFILE_MISSING_TTL', 300))
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    The app's settings , .env is loaded and the environment parsed on the first call only
+    Variables already set in the environment win over .env
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Settings()